@@ -2,6 +2,7 @@ from flask import Flask
 from flask_cors import CORS
 from config import Config
 from app.cli import register_cli
+from app.json_provider import create_json_provider
 
 # Extensions
 from app.extensions import db, migrate
@@ -11,7 +12,8 @@ def create_app(config_class=Config):
     # Create App and Config
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(config_class)
-    CORS(app, origins=["*"], supports_credentials=True)
+    app.json = create_json_provider(app)
+    CORS(app, origins=["*"], supports_credentials=True, expose_headers=["Link"])
 
     # Initialize Flask extensions
     db.init_app(app)
@@ -25,8 +27,7 @@ def create_app(config_class=Config):
     from app.image_server import bp as image_bp
 
     app.register_blueprint(api_bp, url_prefix="/api/1")
-    if app.config["DEBUG"] or app.config["TESTING"]:
-        app.register_blueprint(image_bp)
+    app.register_blueprint(image_bp)
 
     return app
 
@@ -40,3 +41,7 @@ from app.models.book import Magazine
 from app.models.book import Cookbook
 from app.models.rating import Rating
 from app.models.tag import Tag
+from app.models.token_revocation import TokenRevocation
+
+# Search index DDL and sync listeners
+from app import search
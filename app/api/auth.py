@@ -1,10 +1,318 @@
+import hashlib
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic
+from flask import current_app, g
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy.orm import make_transient_to_detached
+from app.extensions import db
 from app.models.user import User
+from app.models.token_revocation import TokenRevocation
 from app.api.errors import error_response
+from app.visibility import get_group_members
 
 basic_auth = HTTPBasicAuth()
 token_auth = HTTPTokenAuth()
 
+SIGNED_TOKEN = "signed"
+TOKEN_LIFETIME = 3600
+REFRESH_TOKEN_LIFETIME = timedelta(days=100)
+
+# What authentication needs to know about a user, without loading it
+Principal = namedtuple("Principal", ["id", "user_group_id", "roles", "expires_at"])
+
+
+class TokenCache:
+    """Bounded LRU cache of access token to Principal.
+
+    Entries expire with the token or after ttl seconds, whichever is first.
+    The cache lives in the worker process: a token revoked through another
+    worker stays valid here for at most ttl seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._principals = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, token):
+        with self._lock:
+            principal = self._principals.get(token)
+            if principal is None:
+                return None
+            if principal.expires_at <= datetime.utcnow():
+                del self._principals[token]
+                return None
+            self._principals.move_to_end(token)
+            return principal
+
+    def set(self, token, principal):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        expires_at = min(
+            principal.expires_at, datetime.utcnow() + timedelta(seconds=self.ttl)
+        )
+        with self._lock:
+            self._principals[token] = principal._replace(expires_at=expires_at)
+            self._principals.move_to_end(token)
+            while len(self._principals) > self.maxsize:
+                self._principals.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            tokens = [t for t, p in self._principals.items() if p.id == user_id]
+            for token in tokens:
+                del self._principals[token]
+
+
+class TokenRevocations:
+    """Revocation times of signed access and refresh tokens by user id.
+
+    Reloaded from the database every refresh_interval seconds, so a
+    revocation made by another worker or node applies here after at most
+    that delay. Rows older than REFRESH_TOKEN_LIFETIME are purged, every
+    token they could revoke has expired.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._revoked_at = {}
+        self._loaded_at = None
+        self._lock = Lock()
+
+    def get(self, user_id, refresh=False):
+        """Return when the access tokens of user_id were last revoked, with
+        refresh when its refresh tokens were, None if never.
+        """
+
+        with self._lock:
+            if (
+                self._loaded_at is None
+                or monotonic() - self._loaded_at >= self.refresh_interval
+            ):
+                rows = db.session.execute(
+                    db.select(
+                        TokenRevocation.user_id,
+                        TokenRevocation.revoked_at,
+                        TokenRevocation.refresh_revoked_at,
+                    )
+                )
+                self._revoked_at = {
+                    user_id: (revoked_at, refresh_revoked_at)
+                    for user_id, revoked_at, refresh_revoked_at in rows
+                }
+                self._loaded_at = monotonic()
+            revoked_at, refresh_revoked_at = self._revoked_at.get(
+                user_id, (None, None)
+            )
+            return refresh_revoked_at if refresh else revoked_at
+
+    def revoke(self, user_ids, revoked_at, refresh=True):
+        """Revoke the access tokens of user_ids issued before revoked_at, with
+        refresh their refresh tokens as well.
+        """
+
+        revocations = {
+            revocation.user_id: revocation
+            for revocation in db.session.scalars(
+                db.select(TokenRevocation).where(TokenRevocation.user_id.in_(user_ids))
+            )
+        }
+        revoked = {}
+        for user_id in user_ids:
+            revocation = revocations.get(user_id) or TokenRevocation(user_id=user_id)
+            revocation.revoked_at = revoked_at
+            if refresh:
+                revocation.refresh_revoked_at = revoked_at
+            db.session.add(revocation)
+            revoked[user_id] = (revoked_at, revocation.refresh_revoked_at)
+        db.session.execute(
+            db.delete(TokenRevocation).where(
+                TokenRevocation.revoked_at < revoked_at - REFRESH_TOKEN_LIFETIME
+            )
+        )
+        db.session.commit()
+
+        with self._lock:
+            self._revoked_at.update(revoked)
+
+
+def _app_extension(name, factory):
+    extension = current_app.extensions.get(name)
+    if extension is None:
+        extension = factory()
+        current_app.extensions[name] = extension
+    return extension
+
+
+def get_token_cache() -> TokenCache:
+    config = current_app.config
+    return _app_extension(
+        "token_cache",
+        lambda: TokenCache(config["TOKEN_CACHE_SIZE"], config["TOKEN_CACHE_TTL"]),
+    )
+
+
+def get_token_revocations() -> TokenRevocations:
+    config = current_app.config
+    return _app_extension(
+        "token_revocations",
+        lambda: TokenRevocations(config["TOKEN_REVOCATION_REFRESH"]),
+    )
+
+
+def _signed_tokens_enabled():
+    return current_app.config["TOKEN_MODE"] == SIGNED_TOKEN
+
+
+def _token_serializer(salt="access-token"):
+    return URLSafeSerializer(
+        current_app.config["SECRET_KEY"],
+        salt=salt,
+        signer_kwargs={"digest_method": hashlib.sha256},
+    )
+
+
+def _load_signed_token(token):
+    """Return the Principal of a valid signed token or None."""
+
+    try:
+        data = _token_serializer().loads(token)
+        issued_at = datetime.fromisoformat(data["iat"])
+        expires_at = datetime.fromisoformat(data["exp"])
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+    if expires_at <= datetime.utcnow():
+        return None
+    revoked_at = get_token_revocations().get(data["uid"])
+    if revoked_at and issued_at < revoked_at:
+        return None
+
+    return Principal(data["uid"], data["gid"], tuple(data["roles"]), expires_at)
+
+
+def issue_token(user: User, force_new=False):
+    """Return an access token for user and its expiration.
+
+    Signed tokens are created without a database write. With force_new the
+    previous tokens of user are invalidated.
+    """
+
+    if not _signed_tokens_enabled():
+        old_token = user.token
+        token = user.get_token(expires_in=TOKEN_LIFETIME, force_new=force_new)
+        if token != old_token:
+            get_token_cache().invalidate_user(user.id)
+        return token, user.token_expiration
+
+    issued_at = datetime.utcnow()
+    if force_new:
+        get_token_revocations().revoke([user.id], issued_at)
+
+    expires_at = issued_at + timedelta(seconds=TOKEN_LIFETIME)
+    token = _token_serializer().dumps(
+        {
+            "uid": user.id,
+            "gid": user.user_group_id,
+            "roles": user.get_roles(),
+            "iat": issued_at.isoformat(),
+            "exp": expires_at.isoformat(),
+        }
+    )
+    return token, expires_at
+
+
+def issue_refresh_token(user: User):
+    """Return a refresh token for user and its expiration.
+
+    Signed refresh tokens are created without a database write and revoked
+    by logging out. Otherwise a random refresh token
+    is stored with the user, every login writes and commits the user row.
+    """
+
+    if not _signed_tokens_enabled():
+        return user.get_refresh_token(), user.refresh_token_expiration
+
+    issued_at = datetime.utcnow()
+    expires_at = issued_at + REFRESH_TOKEN_LIFETIME
+    token = _token_serializer("refresh-token").dumps(
+        {"uid": user.id, "iat": issued_at.isoformat(), "exp": expires_at.isoformat()}
+    )
+    return token, expires_at
+
+
+def load_refresh_token(token):
+    """Return the User of refresh token and the token expiration.
+
+    Returns (None, None) for an unknown, tampered or revoked token. The
+    expiration is left to the caller.
+    """
+
+    if not _signed_tokens_enabled():
+        user = db.session.scalars(
+            db.select(User).where(User.refresh_token == token)
+        ).first()
+        if user is None:
+            return None, None
+        return user, user.refresh_token_expiration
+
+    try:
+        data = _token_serializer("refresh-token").loads(token)
+        issued_at = datetime.fromisoformat(data["iat"])
+        expires_at = datetime.fromisoformat(data["exp"])
+    except (BadSignature, KeyError, TypeError, ValueError):
+        return None, None
+
+    revoked_at = get_token_revocations().get(data["uid"], refresh=True)
+    if revoked_at and issued_at < revoked_at:
+        return None, None
+    user = db.session.get(User, data["uid"])
+    if user is None:
+        return None, None
+    return user, expires_at
+
+
+def revoke_tokens(user: User):
+    """Invalidate all access and refresh tokens of user."""
+
+    user.revoke_token()
+    if _signed_tokens_enabled():
+        get_token_revocations().revoke([user.id], datetime.utcnow())
+    else:
+        get_token_cache().invalidate_user(user.id)
+
+
+def invalidate_principals(user_ids):
+    """Drop what tokens know about users after their group or roles changed.
+
+    Signed access tokens embed the group and roles, so they are revoked.
+    The refresh tokens stay valid, the clients refresh their access tokens
+    and get the new group and roles.
+    """
+
+    get_group_members().invalidate()
+    if _signed_tokens_enabled():
+        get_token_revocations().revoke(user_ids, datetime.utcnow(), refresh=False)
+    else:
+        cache = get_token_cache()
+        for user_id in user_ids:
+            cache.invalidate_user(user_id)
+
+
+def _principal_user(principal: Principal):
+    """Return the User of principal, attached to the session without a query.
+
+    Attributes not known by the principal are loaded on first access.
+    """
+
+    user = User(id=principal.id, user_group_id=principal.user_group_id)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
 
 @basic_auth.verify_password
 def verify_password(username, password):
@@ -22,7 +330,29 @@ def basic_auth_error(status):
 
 @token_auth.verify_token
 def verify_token(token):
-    return User.check_token(token) if token else None
+    if not token:
+        return None
+
+    if _signed_tokens_enabled():
+        principal = _load_signed_token(token)
+    else:
+        principal = get_token_cache().get(token)
+    if principal:
+        g.principal = principal
+        return _principal_user(principal)
+    if _signed_tokens_enabled():
+        return None
+
+    user = User.check_token(token)
+    if user is None:
+        return None
+
+    principal = Principal(
+        user.id, user.user_group_id, tuple(user.get_roles()), user.token_expiration
+    )
+    get_token_cache().set(token, principal)
+    g.principal = principal
+    return user
 
 
 @token_auth.error_handler
@@ -32,4 +362,7 @@ def token_auth_error(status):
 
 @token_auth.get_user_roles
 def get_user_roles(user):
+    principal = g.get("principal")
+    if principal and principal.id == user.id:
+        return list(principal.roles)
     return user.get_roles()
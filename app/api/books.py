@@ -5,8 +5,17 @@ from app.models.book import Cookbook, Magazine, Book
 from app.extensions import db
 from flask import jsonify, request, url_for, abort
 from app.api.auth import token_auth
-from app.validators import required_fields, validate_book_type
+from app.validators import (
+    required_fields,
+    validate_book_type,
+    validate_limit,
+    validate_cursor,
+    validate_fields,
+    parse_fields,
+)
 from app.queries.book import get_user_books_query, get_user_books_by_id_query
+from app.api.pagination import list_response
+from app.visibility import get_visible_owner_ids
 
 
 @bp.route("/books/types", methods=["GET"])
@@ -46,13 +55,20 @@ def create_book():
 
 @bp.route("/books", methods=["GET"])
 @token_auth.login_required
+@validate_limit
+@validate_cursor
+@validate_fields(Book.FIELDS)
 def get_all_books():
     user: User = token_auth.current_user()
+    fields = parse_fields(request.args, Book.FIELDS)
 
-    result = db.session.execute(get_user_books_query(user))
-    books = result.scalars().all()
-
-    return jsonify([book.to_dict() for book in books])
+    return list_response(
+        get_user_books_query(user),
+        Book,
+        lambda books: Book.to_dict_list(books, fields),
+        "api.get_all_books",
+        owner_ids=get_visible_owner_ids(user),
+    )
 
 
 @bp.route("/books/<int:book_id>", methods=["GET"])
@@ -106,9 +122,9 @@ def delete_book(book_id):
     if not book:
         abort(404)
 
-    result = db.session.execute(db.delete(Book).where(Book.id == book_id))
-    if result.rowcount != 1:
-        abort(500)
+    # through the session, so the recipes of the book are deleted with it
+    # and their image files released
+    db.session.delete(book)
     db.session.commit()
 
     return "", 204
@@ -2,14 +2,32 @@ from . import bp
 from app.models.user import User
 from app.models.recipe import Recipe
 from app.extensions import db
-from flask import jsonify, request, abort, current_app
+from flask import jsonify, request, abort, current_app, url_for
 from app.api.auth import token_auth
+from app.api.errors import error_response
 from app.queries.recipe import get_user_recipes_by_id_query
-from uuid import uuid4
-from PIL import Image, ImageOps
+from app.images import (
+    ASYNC,
+    ImageTooLarge,
+    content_hash,
+    get_image_jobs,
+    get_stored_image_variants,
+    image_extension,
+    image_variants_config,
+    image_work_folder,
+    is_processing,
+    process_image,
+    read_image_header,
+    release_image_files,
+    set_recipe_image,
+    start_image_processing,
+)
+from PIL import UnidentifiedImageError
 import os
+import tempfile
 
-THUMBNAIL = "{}.thumbnail"
+IMAGE_IS_PROCESSING = "image is being processed"
+IMAGE_TOO_LARGE = "image has more than {:g} megapixels"
 
 
 def allowed_file(filename):
@@ -29,6 +47,8 @@ def put_image(recipe_id):
     recipe: Recipe = result.scalars().one_or_none()
     if not recipe:
         abort(404)
+    if is_processing(recipe):
+        return error_response(409, IMAGE_IS_PROCESSING)
 
     # File Handling
     if "image" not in request.files:
@@ -37,42 +57,61 @@ def put_image(recipe_id):
     if not allowed_file(file.filename):
         abort(400)
 
-    # Image Validation
-    with Image.open(file) as image:
-        if image.format not in current_app.config["ALLOWED_EXTENSIONS"]:
-            abort(400)
-        image_format = image.format
-
-    extension = image_format.lower().replace("jpeg", "jpg")
-    unique_filename = str(uuid4()).replace("-", "") + "." + extension
-    full_filename = os.path.join(current_app.config["UPLOAD_FOLDER"], unique_filename)
-
-    # Resizing and save
-    with Image.open(file) as image:
-        ImageOps.fit(image, (1200, 800)).save(full_filename)
-
-    # Create thumbnail
-    with Image.open(full_filename) as image:
-        image.thumbnail((128, 128))
-        image.save(THUMBNAIL.format(full_filename), image_format)
-
-    # Delete old Files
-    if recipe.image:
-        old_file = recipe.image
-        try:
-            os.unlink(os.path.join(current_app.config["UPLOAD_FOLDER"], old_file))
-            os.unlink(
-                os.path.join(
-                    current_app.config["UPLOAD_FOLDER"], THUMBNAIL.format(old_file)
-                )
-            )
-        except Exception:
-            pass
-
-    # Update DB
-    recipe.image = unique_filename
-    db.session.add(recipe)
-    db.session.commit()
+    # Image Validation, from the header before anything is decoded
+    max_megapixels = current_app.config["IMAGE_MAX_MEGAPIXELS"]
+    try:
+        image_format, _ = read_image_header(
+            file.stream,
+            current_app.config["ALLOWED_EXTENSIONS"],
+            max_megapixels * 1000 * 1000,
+        )
+    except UnidentifiedImageError:
+        abort(400)
+    except ImageTooLarge:
+        return error_response(413, IMAGE_TOO_LARGE.format(max_megapixels))
+    if image_format not in current_app.config["ALLOWED_EXTENSIONS"]:
+        abort(400)
+
+    # Images are stored by content, an image uploaded before is reused
+    extension = image_extension(image_format)
+    unique_filename = content_hash(file.stream) + "." + extension
+
+    variants = get_stored_image_variants(unique_filename)
+    if variants is not None and set_recipe_image(recipe, unique_filename, variants):
+        return jsonify(recipe.to_dict())
+
+    if current_app.config["IMAGE_PROCESSING"] == ASYNC:
+        # Keep the upload locally and let the image workers resize it
+        fd, upload = tempfile.mkstemp(suffix=".upload", dir=image_work_folder())
+        with os.fdopen(fd, "wb") as f:
+            file.save(f)
+
+        # a concurrent upload may have started a job since the check above
+        started_at = start_image_processing(recipe)
+        if started_at is None:
+            os.unlink(upload)
+            return error_response(409, IMAGE_IS_PROCESSING)
+
+        response = jsonify(recipe.to_dict())
+        get_image_jobs().submit(
+            recipe.id, upload, unique_filename, image_format, started_at
+        )
+
+        response.status_code = 202
+        response.headers["Location"] = url_for("api.get_recipe", recipe_id=recipe.id)
+        return response
+
+    # Resizing, thumbnail, variants and save
+    with tempfile.TemporaryDirectory(dir=image_work_folder()) as folder:
+        variants = process_image(
+            file,
+            os.path.join(folder, unique_filename),
+            image_format,
+            *image_variants_config(),
+        )
+
+        # Update DB and delete old Files
+        set_recipe_image(recipe, unique_filename, variants, folder)
 
     return jsonify(recipe.to_dict())
 
@@ -86,23 +125,21 @@ def delete_image(recipe_id):
     recipe: Recipe = result.scalars().one_or_none()
     if not recipe:
         abort(404)
+    if is_processing(recipe):
+        return error_response(409, IMAGE_IS_PROCESSING)
 
-    # Try deleting old Files
-    if recipe.image:
-        old_file = recipe.image
-        try:
-            os.unlink(os.path.join(current_app.config["UPLOAD_FOLDER"], old_file))
-            os.unlink(
-                os.path.join(
-                    current_app.config["UPLOAD_FOLDER"], THUMBNAIL.format(old_file)
-                )
-            )
-        except Exception:
-            pass
+    old_file, old_variants = recipe.image, recipe.image_variants
 
     # Always update DB
     recipe.image = None
+    recipe.image_variants = None
+    recipe.image_status = None
+    recipe.image_processing_at = None
     db.session.add(recipe)
     db.session.commit()
 
+    # Try deleting old Files
+    if old_file:
+        release_image_files(old_file, old_variants)
+
     return jsonify(recipe.to_dict())
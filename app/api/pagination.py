@@ -0,0 +1,81 @@
+from flask import (
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+    url_for,
+)
+from app.extensions import db
+from app.queries.pagination import paginate_query, encode_cursor
+
+DEFAULT_PAGE_SIZE = 50
+STREAM_CHUNK_SIZE = 500
+
+
+def _results(result, rows):
+    return result if rows else result.scalars()
+
+
+def list_response(query, model, serialize, endpoint, rows=False, owner_ids=None):
+    """Return the jsonified list of query results.
+
+    Without limit or cursor query parameters the whole list is returned. With
+    them only one page is returned and the url of the next page, if any, is
+    set in the Link header with rel="next", other query parameters like
+    fields are kept. With stream=true the whole list is streamed, see
+    stream_response. serialize gets model objects, or the result rows of
+    column queries with rows=True. owner_ids are the visible owners query
+    is filtered by, see paginate_query.
+    """
+
+    if request.args.get("stream", "").lower() in ["true", "1"]:
+        return stream_response(query, serialize, rows)
+
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor")
+
+    if not (limit or cursor):
+        return jsonify(serialize(_results(db.session.execute(query), rows).all()))
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    items = _results(
+        db.session.execute(paginate_query(query, model, limit, cursor, owner_ids)),
+        rows,
+    ).all()
+
+    response = jsonify(serialize(items[:limit]))
+    if len(items) > limit:
+        cursor = encode_cursor(items[limit - 1])
+        args = {**request.args.to_dict(), "limit": limit, "cursor": cursor}
+        next_url = url_for(endpoint, **args)
+        response.headers["Link"] = '<{}>; rel="next"'.format(next_url)
+
+    return response
+
+
+def stream_response(query, serialize, rows=False):
+    """Stream all query results as one JSON array.
+
+    Rows are fetched and serialized in chunks of STREAM_CHUNK_SIZE (server
+    side cursor where supported), so memory use does not depend on the size
+    of the collection.
+    """
+
+    def generate():
+        result = _results(
+            db.session.execute(query.execution_options(yield_per=STREAM_CHUNK_SIZE)),
+            rows,
+        )
+
+        yield "["
+        separator = ""
+        for partition in result.partitions():
+            for item in serialize(partition):
+                yield separator + current_app.json.dumps(
+                    item, separators=(",", ":")
+                )
+                separator = ","
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
@@ -1,9 +1,11 @@
 from . import bp
-from flask import jsonify, request, url_for, abort
+import random
+from flask import g, jsonify, request, url_for, abort
 from app.models.user import User
 from app.models.recipe import Recipe
 from app.models.rating import Rating
 from app.models.recipe_tag import recipe_tags
+from app.models.tag import UNKNOWN_TAG_MSG, find_tags, resolve_tags, tag_key
 from app.extensions import db
 from app.validators import (
     required_fields,
@@ -11,22 +13,51 @@ from app.validators import (
     validate_rating,
     validate_tags,
     validate_limit,
+    validate_cursor,
+    validate_recipe_filters,
+    parse_recipe_filters,
+    validate_seed,
+    validate_recipe_items,
+    validate_recipe_item,
+    validate_fields,
+    parse_fields,
 )
 from app.api.auth import token_auth
-from app.queries.recipe import get_user_recipes_query, get_user_recipes_by_id_query
-from app.queries.book import get_user_books_by_id_query
+from app.api.errors import bad_request
+from app.queries.recipe import (
+    get_user_recipe_rows_query,
+    get_user_recipes_by_id_query,
+    get_owner_recipe_ids_query,
+    get_user_recipe_counts_query,
+    filter_recipes_query,
+)
+from app.queries.book import get_user_books_by_id_query, get_user_book_ids_query
 from app.queries.rating import get_rating_by_recipe_and_user_query
+from app.api.pagination import list_response
+from app.visibility import get_visible_owner_ids
+from app.search import index_recipes, remove_from_index
+from app.images import release_image_files
+
+BOOK_NOT_FOUND_MSG = "book not found"
 
 
 @bp.route("/recipes", methods=["GET"])
 @token_auth.login_required
+@validate_limit
+@validate_cursor
+@validate_fields(Recipe.FIELDS)
 def get_all_recipes():
     user: User = token_auth.current_user()
-
-    result = db.session.execute(get_user_recipes_query(user))
-    recipes = result.scalars().all()
-
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    fields = parse_fields(request.args, Recipe.FIELDS)
+
+    return list_response(
+        get_user_recipe_rows_query(user, fields),
+        Recipe,
+        lambda rows: Recipe.to_dict_list(rows, fields),
+        "api.get_all_recipes",
+        rows=True,
+        owner_ids=get_visible_owner_ids(user),
+    )
 
 
 @bp.route("/recipes", methods=["POST"])
@@ -45,7 +76,11 @@ def create_recipe():
         abort(404)
 
     recipe = Recipe()
-    recipe.from_dict(data)
+    try:
+        recipe.from_dict(data)
+    except ValueError as e:
+        db.session.rollback()
+        return bad_request(str(e))
     recipe.book = book
     recipe.user = user
 
@@ -69,6 +104,138 @@ def create_recipe():
     return response
 
 
+def _insert_recipes(rows):
+    """Insert the recipe dicts rows in one executemany, return their ids in order.
+
+    SQLite can't tell which row of a multi row INSERT .. RETURNING belongs
+    to which parameters, so the ids are assigned here, following the largest
+    id while the database write lock is held. PostgreSQL returns them in
+    parameter order from a batched insert, other databases row by row.
+    """
+
+    if db.session.get_bind().dialect.name != "sqlite":
+        return db.session.scalars(
+            db.insert(Recipe).returning(Recipe.id, sort_by_parameter_order=True),
+            rows,
+        ).all()
+
+    # any write statement takes the lock, this one changes nothing
+    db.session.execute(
+        db.update(Recipe.__table__).where(db.false()).values(image=None)
+    )
+    first_id = (db.session.scalar(db.select(db.func.max(Recipe.id))) or 0) + 1
+    recipe_ids = list(range(first_id, first_id + len(rows)))
+    db.session.execute(
+        db.insert(Recipe),
+        [dict(row, id=recipe_id) for row, recipe_id in zip(rows, recipe_ids)],
+    )
+    return recipe_ids
+
+
+@bp.route("/recipes/bulk", methods=["POST"])
+@token_auth.login_required
+@validate_recipe_items
+def create_recipes():
+    """Create the recipes of a JSON array or NDJSON body in one transaction.
+
+    Every item is validated like a create_recipe body. Invalid items and
+    items of books the user can't access are skipped, the rest is written
+    with one executemany per table and a single commit. Returns one result
+    per item, in order.
+    """
+
+    user: User = token_auth.current_user()
+    items = g.recipe_items
+
+    results = [None] * len(items)
+    valid = {}
+    for index, item in enumerate(items):
+        error = validate_recipe_item(item)
+        if error:
+            results[index] = {"status": 400, "message": error}
+        else:
+            valid[index] = item
+
+    requested_book_ids = {item["book_id"] for item in valid.values()}
+    book_ids = set(
+        db.session.execute(
+            get_user_book_ids_query(user, requested_book_ids)
+        ).scalars()
+    )
+    # every item is validated before anything is written
+    existing_tags = find_tags(
+        [
+            tag
+            for item in valid.values()
+            if item["book_id"] in book_ids
+            for tag in item["tags"]
+        ]
+    )
+    existing_tag_ids = {tag.id for tag in existing_tags}
+
+    created = []
+    for index, item in valid.items():
+        if item["book_id"] not in book_ids:
+            results[index] = {"status": 404, "message": BOOK_NOT_FOUND_MSG}
+        elif any(
+            "tag_name" not in tag and tag["id"] not in existing_tag_ids
+            for tag in item["tags"]
+        ):
+            results[index] = {"status": 400, "message": UNKNOWN_TAG_MSG}
+        else:
+            created.append(index)
+
+    if created:
+        tags_by_key = resolve_tags(
+            [tag for index in created for tag in items[index]["tags"]],
+            existing_tags,
+        )
+        recipe_ids = _insert_recipes(
+            [
+                {
+                    "title": items[index]["title"],
+                    "page": items[index].get("page"),
+                    "book_id": items[index]["book_id"],
+                    "user_id": user.id,
+                    # rating aggregates of the single rating below
+                    "rating_count": 1 if items[index]["rating"] else 0,
+                    "rating_sum": items[index]["rating"],
+                }
+                for index in created
+            ]
+        )
+
+        ratings, tags = [], []
+        for index, recipe_id in zip(created, recipe_ids):
+            item = items[index]
+            if item["rating"]:
+                ratings.append(
+                    {
+                        "rating": item["rating"],
+                        "user_id": user.id,
+                        "recipe_id": recipe_id,
+                    }
+                )
+            for tag_id in {tags_by_key[tag_key(tag)].id for tag in item["tags"]}:
+                tags.append({"recipe_id": recipe_id, "tag_id": tag_id})
+            results[index] = {
+                "status": 201,
+                "id": recipe_id,
+                "_links": {"self": url_for("api.get_recipe", recipe_id=recipe_id)},
+            }
+        if ratings:
+            db.session.execute(db.insert(Rating), ratings)
+        if tags:
+            db.session.execute(db.insert(recipe_tags), tags)
+
+        # bulk inserts bypass the flush that keeps the index in sync
+        index_recipes(db.session.connection(), recipe_ids)
+
+    db.session.commit()
+
+    return jsonify(results)
+
+
 @bp.route("recipes/<int:recipe_id>", methods=["GET"])
 @token_auth.login_required
 def get_recipe(recipe_id):
@@ -85,36 +252,80 @@ def get_recipe(recipe_id):
 
 @bp.route("recipes/search", methods=["GET"])
 @token_auth.login_required
+@validate_recipe_filters
+@validate_fields(Recipe.FIELDS)
 def search_recipe():
     user: User = token_auth.current_user()
-    search_term = request.args.get("q")
-    book = request.args.get("book")
-
-    if not (search_term or book):
-        query = get_user_recipes_query(user)
-    elif search_term and not book:
-        query = get_user_recipes_query(user).where(Recipe.title.contains(search_term))
-    elif book and not search_term:
-        query = get_user_recipes_query(user).where(Recipe.book_id == book)
-    recipes = db.session.execute(query).scalars().all()
+    filters = parse_recipe_filters(request.args)
+    fields = parse_fields(request.args, Recipe.FIELDS)
 
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    query = filter_recipes_query(
+        get_user_recipe_rows_query(user, fields),
+        filters,
+        db.session.get_bind().dialect.name,
+    )
+    rows = db.session.execute(query).all()
+
+    return jsonify(Recipe.to_dict_list(rows, fields))
+
+
+def _sample_recipe_ids(user, n, rng):
+    """Return up to n distinct random ids of recipes visible to user.
+
+    Every visible recipe is equally likely: the recipes of every visible
+    owner are counted and n positions among all of them drawn, the recipes
+    of an owner in id order follow those of the previous owner. The
+    positions of an owner are read in ascending order, each skipping from
+    the id of the previous one along the (user_id, id) index. No recipe
+    rows are loaded or sorted.
+    """
+
+    counts = db.session.execute(get_user_recipe_counts_query(user)).all()
+    total = sum(count for _, count in counts)
+    positions = rng.sample(range(total), min(n, total))
+
+    ids_by_position = {}
+    first = 0
+    for owner_id, count in counts:
+        ids_query = get_owner_recipe_ids_query(owner_id)
+        last_id, last_position = None, first - 1
+        for position in sorted(p for p in positions if first <= p < first + count):
+            query = ids_query
+            if last_id is not None:
+                query = query.where(Recipe.id > last_id)
+            recipe_id = db.session.execute(
+                query.offset(position - last_position - 1).limit(1)
+            ).scalar()
+            if recipe_id is None:
+                # recipes deleted since counting
+                break
+            ids_by_position[position] = recipe_id
+            last_id, last_position = recipe_id, position
+        first += count
+
+    return [ids_by_position[p] for p in positions if p in ids_by_position]
 
 
 @bp.route("recipes/search/random", methods=["GET"])
 @token_auth.login_required
 @required_query_params(["limit"])
 @validate_limit
+@validate_seed
+@validate_fields(Recipe.FIELDS)
 def get_random_recipes():
     user: User = token_auth.current_user()
-    n = request.args.get("limit")
+    n = int(request.args.get("limit"))
+    seed = request.args.get("seed", type=int)
+    fields = parse_fields(request.args, Recipe.FIELDS)
+
+    sample = _sample_recipe_ids(user, n, random.Random(seed))
 
     result = db.session.execute(
-        get_user_recipes_query(user).order_by(db.func.random()).limit(n)
+        get_user_recipe_rows_query(user, fields).where(Recipe.id.in_(sample))
     )
-    recipes = result.scalars().all()
+    rows = sorted(result.all(), key=lambda r: sample.index(r.id))
 
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    return jsonify(Recipe.to_dict_list(rows, fields))
 
 
 @bp.route("/recipes/<int:recipe_id>", methods=["PUT"])
@@ -145,7 +356,11 @@ def update_recipe(recipe_id):
         )
         recipe.tags = []
 
-    recipe.from_dict(data)
+    try:
+        recipe.from_dict(data)
+    except ValueError as e:
+        db.session.rollback()
+        return bad_request(str(e))
     recipe.book = book
 
     db.session.add(recipe)
@@ -192,11 +407,17 @@ def delete_recipe(recipe_id):
     )
     recipe.tags = []
 
+    image, image_variants = recipe.image, recipe.image_variants
+
     result = db.session.execute(db.delete(Recipe).where(Recipe.id == recipe_id))
     if result.rowcount != 1:
         abort(500)
+    remove_from_index(db.session.connection(), [recipe_id])
     db.session.commit()
 
+    if image:
+        release_image_files(image, image_variants)
+
     return "", 204
 
 
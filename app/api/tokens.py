@@ -1,28 +1,41 @@
 from flask import jsonify, request, abort
-from app import db
 from app.api import bp
-from app.api.auth import basic_auth, token_auth
+from app.api.auth import (
+    basic_auth,
+    token_auth,
+    issue_refresh_token,
+    issue_token,
+    load_refresh_token,
+    revoke_tokens,
+)
 from app.models.user import User
 from datetime import datetime
 
 REFRESH_TOKEN = "refresh_token"
 
 
+def _lifetime(expiration):
+    return (expiration - datetime.utcnow()).seconds
+
+
 @bp.route("/tokens", methods=["GET"])
 @basic_auth.login_required
 def get_token():
     user: User = basic_auth.current_user()
 
+    token, token_expiration = issue_token(user)
+
     token_data = {
-        "token": user.get_token(),
-        "token_expiration": user.token_expiration,
-        "token_lifetime": user.get_token_lifetime(),
+        "token": token,
+        "token_expiration": token_expiration,
+        "token_lifetime": _lifetime(token_expiration),
     }
     
-    refresh_token = user.get_refresh_token()
+    # stored with the user unless TOKEN_MODE is signed, see issue_refresh_token
+    refresh_token, refresh_token_expiration = issue_refresh_token(user)
 
     response = jsonify(token_data)
-    response.set_cookie(REFRESH_TOKEN, refresh_token, None, user.refresh_token_expiration, samesite="Lax", domain=None, httponly=True, secure=True)
+    response.set_cookie(REFRESH_TOKEN, refresh_token, None, refresh_token_expiration, samesite="Lax", domain=None, httponly=True, secure=True)
     return response
 
 
@@ -30,7 +43,7 @@ def get_token():
 @token_auth.login_required
 def revoke_token():
     user: User = token_auth.current_user()
-    user.revoke_token()
+    revoke_tokens(user)
 
     return "", 204
 
@@ -41,25 +54,24 @@ def refresh_token():
         abort(400)
 
 
-    result = db.session.execute(
-        db.select(User).where(User.refresh_token == refresh_token)
-    )
-    user: User = result.scalars().first()
+    user, refresh_token_expiration = load_refresh_token(refresh_token)
 
     if not user:
         abort(400)
 
-    if user.refresh_token_expiration < datetime.utcnow():
+    if refresh_token_expiration < datetime.utcnow():
         abort(404)
 
+    token, token_expiration = issue_token(user, force_new=True)
+
     token_data = {
-        "token": user.get_token(force_new=True),
-        "token_expiration": user.token_expiration,
-        "token_lifetime": user.get_token_lifetime(),
+        "token": token,
+        "token_expiration": token_expiration,
+        "token_lifetime": _lifetime(token_expiration),
     }
 
-    refresh_token = user.get_refresh_token()
+    refresh_token, refresh_token_expiration = issue_refresh_token(user)
 
     response = jsonify(token_data)
-    response.set_cookie(REFRESH_TOKEN, refresh_token, None, user.refresh_token_expiration, httponly=True)
+    response.set_cookie(REFRESH_TOKEN, refresh_token, None, refresh_token_expiration, httponly=True)
     return response
@@ -4,7 +4,7 @@ from app.models.user import User
 from app.models.user_group import UserGroup
 from app.extensions import db
 from flask import jsonify, request, url_for, abort
-from app.api.auth import token_auth
+from app.api.auth import token_auth, invalidate_principals
 from app.validators import required_fields
 
 ALREADY_IN_GROUP = "user is already in a group"
@@ -37,6 +37,7 @@ def create_new_user_group():
     user.user_group = user_group
     db.session.add(user)
     db.session.commit()
+    invalidate_principals([user.id])
 
     response = jsonify(user_group.to_dict())
     response.status_code = 201
@@ -79,11 +80,17 @@ def delete_user_group(group_id):
     if user_group.group_admin_user_id != user.id:
         abort(403)
 
+    member_ids = (
+        db.session.execute(db.select(User.id).where(User.user_group_id == group_id))
+        .scalars()
+        .all()
+    )
     db.session.execute(db.delete(UserGroup).where(UserGroup.id == group_id))
     db.session.execute(
         db.update(User).where(User.user_group_id == group_id).values(user_group_id=None)
     )
     db.session.commit()
+    invalidate_principals(member_ids)
 
     return "", 204
 
@@ -130,6 +137,7 @@ def add_user_to_group(group_id):
         user_group.users.append(user_to_add)
         db.session.add(user_group)
         db.session.commit()
+        invalidate_principals([user_to_add.id])
 
         return jsonify(user_group.to_dict())
     else:
@@ -191,5 +199,6 @@ def delete_user_from_group(group_id, user_id):
     user_group.users.remove(user_to_remove)
     db.session.add(user_group)
     db.session.commit()
+    invalidate_principals([user_to_remove.id])
 
     return jsonify(user_group.to_dict())
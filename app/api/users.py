@@ -3,6 +3,7 @@ from app.api.errors import bad_request
 from app.models.user import User
 from app.extensions import db
 from flask import jsonify, request, url_for, abort
+from sqlalchemy.orm import selectinload
 from app.api.auth import token_auth
 from app.validators import required_fields
 
@@ -61,7 +62,8 @@ def get_self():
 @bp.route("/users", methods=["GET"])
 @token_auth.login_required(role="admin")
 def get_users():
-    users = User.query.all()
+    # roles of all users in one more query
+    users = User.query.options(selectinload(User.roles)).all()
     return jsonify([user.to_dict(include_email=True) for user in users])
 
 
@@ -1,9 +1,23 @@
 import os
+from datetime import datetime, timedelta
 from os import getenv
+import click
 from dotenv import load_dotenv
 from app.extensions import db
 from app.models.user import User
 from app.models.role import Role
+from app.models.recipe import Recipe
+from app.queries.rating import get_rating_aggregates_query
+from app.search import index_recipes
+from app.images import ORPHAN, diff_image_files, fail_stale_image_processing
+from app.queries.explain import (
+    FULL_SCAN_ALLOWED,
+    build_query,
+    explain_query,
+    is_full_scan,
+    query_builders,
+)
+from app.storage import get_storage
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, ".env"))
@@ -38,3 +52,124 @@ def register_cli(app):
     @app.cli.command("drop_db")
     def drop_db():
         db.drop_all()
+
+    @app.cli.command("rebuild_ratings")
+    def rebuild_ratings():
+        """Recompute the denormalized rating aggregates of all recipes."""
+
+        aggregates = [
+            {"id": recipe_id, "rating_count": count, "rating_sum": total}
+            for recipe_id, count, total in db.session.execute(
+                get_rating_aggregates_query()
+            )
+        ]
+
+        db.session.execute(db.update(Recipe).values(rating_count=0, rating_sum=0))
+        if aggregates:
+            # bulk UPDATE by primary key, executed as executemany
+            db.session.execute(db.update(Recipe), aggregates)
+        db.session.commit()
+
+    @app.cli.command("rebuild_search_index")
+    def rebuild_search_index():
+        """Rebuild the full text search index of all recipes."""
+
+        index_recipes(db.session.connection())
+        db.session.commit()
+
+    @app.cli.command("gc_images")
+    @click.option("--dry-run", is_flag=True, help="Only report, change nothing.")
+    @click.option("--batch-size", default=500, show_default=True)
+    @click.option(
+        "--min-age",
+        default=3600,
+        show_default=True,
+        help="Seconds before an unused file is deleted, keeps running uploads.",
+    )
+    def gc_images(dry_run, batch_size, min_age):
+        """Delete image files no recipe uses, unset images with missing files."""
+
+        storage = get_storage()
+        cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+        orphans = []
+        deleted = 0
+        dangling = set()
+
+        for kind, name, detail in diff_image_files(storage):
+            if kind == ORPHAN:
+                if detail > cutoff:
+                    continue
+                click.echo("orphan: {}".format(name))
+                orphans.append(name)
+                if len(orphans) >= batch_size:
+                    if not dry_run:
+                        storage.delete_many(orphans)
+                    deleted += len(orphans)
+                    orphans = []
+            else:
+                click.echo("missing: {} of image {}".format(name, detail))
+                if name == detail:
+                    dangling.add(name)
+
+        if orphans and not dry_run:
+            storage.delete_many(orphans)
+        deleted += len(orphans)
+
+        if dangling and not dry_run:
+            db.session.execute(
+                db.update(Recipe)
+                .where(Recipe.image.in_(dangling))
+                .values(image=None, image_variants=None)
+            )
+            db.session.commit()
+
+        click.echo(
+            "{} {} orphaned files, {} {} images with missing files".format(
+                "would delete" if dry_run else "deleted",
+                deleted,
+                "would unset" if dry_run else "unset",
+                len(dangling),
+            )
+        )
+
+    @app.cli.command("fail_stale_images")
+    def fail_stale_images():
+        """Mark images processing longer than IMAGE_PROCESSING_TIMEOUT failed."""
+
+        click.echo("{} stale images failed".format(fail_stale_image_processing()))
+
+    @app.cli.command("explain_queries")
+    def explain_queries():
+        """Print the plan of every query builder in app.queries, flag full scans.
+
+        Fails if a query that should use an index scans a table, e.g. in CI.
+        """
+
+        # a user in a group, so the group visibility is part of the plans
+        arguments = {
+            "user": User(id=1, user_group_id=1),
+            "recipe": Recipe(id=1),
+            "recipe_id": 1,
+            "owner_id": 1,
+            "book_id": 1,
+            "book_ids": [1, 2],
+        }
+        dialect_name = db.session.get_bind().dialect.name
+        flagged = []
+
+        for name, builder in query_builders():
+            query = build_query(builder, arguments)
+            if query is None:
+                click.echo("{}: skipped, unknown arguments".format(name))
+                continue
+            click.echo(name)
+            for line in explain_query(db.session, query):
+                full_scan = is_full_scan(dialect_name, line)
+                click.echo("  {:9} {}".format("FULL SCAN" if full_scan else "", line))
+                if full_scan and name not in FULL_SCAN_ALLOWED:
+                    flagged.append(name)
+
+        if flagged:
+            raise click.ClickException(
+                "full scans in " + ", ".join(sorted(set(flagged)))
+            )
@@ -1,5 +1,10 @@
 """
-serve static images for development
+serve recipe images
+
+Image files are named by their content hash and never change, so responses carry a
+strong content hash ETag and may be cached forever. Behind a web server the
+file transfer can be offloaded with X-Sendfile (USE_X_SENDFILE) or nginx'
+X-Accel-Redirect (IMAGE_ACCEL_REDIRECT).
 """
 
 from flask import Blueprint
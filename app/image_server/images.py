@@ -1,19 +1,82 @@
 from . import bp
-from flask import abort, current_app, send_file
+from flask import Response, abort, current_app, redirect, request, send_file
+from functools import lru_cache
+from app.storage import get_storage, mimetype, shard_key
+import hashlib
 import re
 import os
 
+IMAGE_FILE = re.compile(r"[a-z0-9]{32}(-[0-9]+w)?\.[a-z]{3,4}(\.thumbnail)?")
+ONE_YEAR = 365 * 24 * 60 * 60
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=4096)
+def _content_hash(path, mtime_ns, size):
+    """Return the hex digest of the file at path.
+
+    mtime_ns and size are part of the cache key only, a changed file gets a
+    new hash.
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _accel_redirect_response(image_file, location, etag, stat):
+    """Return an empty response for nginx to fill in from its internal location."""
+
+    response = Response(mimetype=mimetype(image_file))
+    response.headers["X-Accel-Redirect"] = (
+        current_app.config["IMAGE_ACCEL_REDIRECT"].rstrip("/") + "/" + location
+    )
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    return response
+
 
 @bp.route("/images/<int:recipe_id>/<string:image_file>", methods=["GET"])
 def get_image(recipe_id, image_file):
     # validate image_file path
-    expr = re.compile(r"[a-z0-9]{32}.[a-z]{3,4}(.thumbnail)?")
-    if not expr.match(image_file):
+    if not IMAGE_FILE.fullmatch(image_file):
         abort(400)
 
-    path = os.path.join("../", current_app.config["UPLOAD_FOLDER"], image_file)
+    storage = get_storage()
+    key = shard_key(image_file)
+    path = storage.local_path(key)
+
+    # send clients to storages that serve files themselves
+    if path is None:
+        if not storage.exists(key):
+            abort(404)
+        return redirect(storage.url(key))
 
     try:
-        return send_file(path)
+        stat = os.stat(path)
+        etag = _content_hash(path, stat.st_mtime_ns, stat.st_size)
     except FileNotFoundError:
         abort(404)
+
+    accel_redirect = current_app.config["IMAGE_ACCEL_REDIRECT"]
+    offloaded = accel_redirect or current_app.config["USE_X_SENDFILE"]
+    if accel_redirect:
+        location = os.path.relpath(path, storage.root).replace(os.sep, "/")
+        response = _accel_redirect_response(image_file, location, etag, stat)
+    else:
+        # sends X-Sendfile instead of the file with USE_X_SENDFILE
+        response = send_file(
+            path, mimetype=mimetype(image_file), etag=etag, conditional=False
+        )
+
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+
+    # 304 for If-None-Match / If-Modified-Since, 206 for Range requests.
+    # Offloaded files are sent by the web server, which also handles ranges.
+    return response.make_conditional(
+        request, accept_ranges=not offloaded, complete_length=stat.st_size
+    )
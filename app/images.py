@@ -0,0 +1,516 @@
+"""
+recipe image processing
+
+Uploaded images are fitted to IMAGE_SIZE and get a thumbnail and variants
+of smaller widths, optionally in more formats like WebP. With the
+IMAGE_PROCESSING config "sync" this happens on the request thread. With
+"async" the upload is stored as is and processed by a pool of worker
+processes, the recipe has image_status "processing" until it is done. A job
+not done after IMAGE_PROCESSING_TIMEOUT is taken as failed: the recipe is
+read with image_status "failed", a new upload may replace it and flask
+fail_stale_images stores the status.
+"""
+
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from flask import current_app
+from sqlalchemy import event
+from PIL import Image, ImageOps
+from app.extensions import db
+from app.models.recipe import (
+    FAILED,
+    PROCESSING,
+    Recipe,
+    image_status,
+    stale_processing_cutoff,
+)
+from app.storage import get_storage, shard_key
+
+IMAGE_SIZE = (1200, 800)
+THUMBNAIL_SIZE = (128, 128)
+THUMBNAIL = "{}.thumbnail"
+HASH_CHUNK_SIZE = 64 * 1024
+
+ASYNC = "async"
+
+# results of diff_image_files
+ORPHAN = "orphan"
+DANGLING = "dangling"
+GC_CHUNK_SIZE = 1000
+
+
+def image_work_folder():
+    """Return the local folder for uploads and processing results."""
+
+    return current_app.config["IMAGE_WORK_FOLDER"] or tempfile.gettempdir()
+
+
+def content_hash(stream):
+    """Return the hex content hash of stream and rewind it."""
+
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def image_extension(image_format):
+    return image_format.lower().replace("jpeg", "jpg")
+
+
+def supported_formats(image_formats):
+    """Return the Pillow formats of image_formats Pillow can write."""
+
+    Image.init()
+    return [f.upper() for f in image_formats if f.upper() in Image.SAVE]
+
+
+class ImageTooLarge(Exception):
+    """The image has more pixels than allowed."""
+
+
+def read_image_header(stream, formats, max_pixels):
+    """Return the Pillow format and size of the image in stream and rewind it.
+
+    Only the header is parsed, nothing is decoded. Images in formats other
+    than formats raise UnidentifiedImageError, images with more than
+    max_pixels ImageTooLarge, so oversized images are never allocated.
+    """
+
+    Image.init()
+    formats = [f.upper() for f in formats if f.upper() in Image.OPEN]
+    try:
+        with Image.open(stream, formats=formats) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError as error:
+        # Pillow refuses images above twice its own MAX_IMAGE_PIXELS
+        raise ImageTooLarge(str(error)) from error
+    stream.seek(0)
+
+    if size[0] * size[1] > max_pixels:
+        raise ImageTooLarge("{}x{} pixels".format(*size))
+    return image_format, size
+
+
+def image_variant_filename(filename, width, extension):
+    """Return the file name of the variant of filename with width and extension.
+
+    The variant of the full width in the original format is the image itself.
+    """
+
+    root, original_extension = filename.rsplit(".", 1)
+    if width == IMAGE_SIZE[0] and extension == original_extension:
+        return filename
+    return "{}-{:d}w.{}".format(root, width, extension)
+
+
+def process_image(source, filename, image_format, widths=(), extra_formats=()):
+    """Write the fitted image, its thumbnail and variants to local filename.
+
+    The source is decoded once. JPEG sources are decoded at the smallest
+    scale still covering IMAGE_SIZE (draft mode), everything else is made
+    from the fitted image in memory. Variants are written for all widths up
+    to the IMAGE_SIZE width, in image_format and in extra_formats. Returns
+    the variant file names as {extension: {width: name}}.
+
+    source is a path or a file object. Runs in the image worker processes,
+    so it must not use the app.
+    """
+
+    with Image.open(source) as image:
+        image.draft(image.mode, IMAGE_SIZE)
+        fitted = ImageOps.fit(image, IMAGE_SIZE)
+
+    fitted.save(filename, image_format)
+
+    variants = {}
+    widths = sorted(set(w for w in widths if 0 < w <= IMAGE_SIZE[0]))
+    for variant_format in [image_format, *supported_formats(extra_formats)]:
+        extension = image_extension(variant_format)
+        if extension in variants:
+            continue
+        variants[extension] = {}
+        for width in widths:
+            variant = image_variant_filename(filename, width, extension)
+            if variant != filename:
+                height = round(width * IMAGE_SIZE[1] / IMAGE_SIZE[0])
+                resized = fitted.resize((width, height), Image.Resampling.LANCZOS)
+                resized.save(variant, variant_format)
+            variants[extension][str(width)] = os.path.basename(variant)
+
+    fitted.thumbnail(THUMBNAIL_SIZE)
+    fitted.save(THUMBNAIL.format(filename), image_format)
+
+    return variants
+
+
+def image_variants_config():
+    """Return the widths and extra formats of variants configured for the app."""
+
+    config = current_app.config
+    return config["IMAGE_VARIANT_WIDTHS"], config["IMAGE_EXTRA_FORMATS"]
+
+
+def image_filenames(filename, variants=None):
+    """Return the names of all files of the image filename."""
+
+    filenames = {filename, THUMBNAIL.format(filename)}
+    for names in (variants or {}).values():
+        filenames.update(names.values())
+    return sorted(filenames)
+
+
+def store_image_files(folder):
+    """Move the files processing wrote to the local folder to the storage."""
+
+    storage = get_storage()
+    for name in os.listdir(folder):
+        storage.save_file(shard_key(name), os.path.join(folder, name))
+
+
+def remove_image_files(filename, variants=None):
+    """Try to delete the image filename, its thumbnail and variants."""
+
+    storage = get_storage()
+    for name in image_filenames(filename, variants):
+        try:
+            storage.delete(shard_key(name))
+        except Exception:
+            # left for gc_images
+            current_app.logger.exception("deleting image file %s failed", name)
+
+
+def lock_image(connection, filename):
+    """Lock image filename until the transaction of connection ends.
+
+    Image files are shared by all recipes with the same image. Counting the
+    recipes using an image and deleting its files holds the lock, as does
+    setting the image of a recipe, so a recipe never gets an image whose
+    files are being deleted. PostgreSQL takes an advisory lock on the content
+    hash, SQLite the database write lock. Other databases lock the recipes
+    using the image with SELECT .. FOR UPDATE, with next-key locking like
+    InnoDB's that also keeps other recipes from getting it.
+    """
+
+    dialect_name = connection.dialect.name
+    if dialect_name == "postgresql":
+        key = int(filename[:15], 16)
+        connection.execute(db.select(db.func.pg_advisory_xact_lock(key)))
+    elif dialect_name == "sqlite":
+        # any write statement takes the lock, this one changes nothing
+        connection.execute(
+            db.update(Recipe.__table__).where(db.false()).values(image=None)
+        )
+    else:
+        connection.execute(
+            db.select(Recipe.id).where(Recipe.image == filename).with_for_update()
+        ).all()
+
+
+def release_image_files(filename, variants=None):
+    """Delete the files of image filename unless a recipe still uses them.
+
+    Call after the change of the last reference is committed. Runs in its
+    own transaction holding the lock of the image, see lock_image.
+    """
+
+    with db.engine.begin() as connection:
+        lock_image(connection, filename)
+        references = connection.execute(
+            db.select(db.func.count(Recipe.id)).where(Recipe.image == filename)
+        ).scalar()
+        if not references:
+            remove_image_files(filename, variants)
+
+
+def get_stored_image_variants(filename):
+    """Return the variants of the stored image filename or None.
+
+    Any recipe using filename has it fully processed, the image of a recipe
+    is only set after processing.
+    """
+
+    row = db.session.execute(
+        db.select(Recipe.image_variants).where(Recipe.image == filename).limit(1)
+    ).first()
+    if row is None or not get_storage().exists(shard_key(filename)):
+        return None
+    return row.image_variants or {}
+
+
+def is_stale_processing():
+    """Return a where clause of recipes whose processing is taken as failed."""
+
+    return db.and_(
+        Recipe.image_status == PROCESSING,
+        db.or_(
+            Recipe.image_processing_at.is_(None),
+            Recipe.image_processing_at < stale_processing_cutoff(),
+        ),
+    )
+
+
+def is_processing(recipe: Recipe):
+    """Return whether a job is processing an image of recipe."""
+
+    return image_status(recipe) == PROCESSING
+
+
+def start_image_processing(recipe: Recipe):
+    """Mark the image of recipe as processing, return the start time.
+
+    The transition is a single conditional UPDATE, so of concurrent uploads
+    only one starts a job. Returns None if another one is processing.
+    """
+
+    started_at = datetime.utcnow()
+    result = db.session.execute(
+        db.update(Recipe)
+        .where(
+            Recipe.id == recipe.id,
+            db.or_(
+                Recipe.image_status.is_distinct_from(PROCESSING),
+                is_stale_processing(),
+            ),
+        )
+        .values(image_status=PROCESSING, image_processing_at=started_at)
+        .execution_options(synchronize_session=False)
+    )
+    started = result.rowcount == 1
+    db.session.commit()
+    return started_at if started else None
+
+
+def fail_stale_image_processing():
+    """Mark the images of recipes with stale processing as failed.
+
+    Returns the number of recipes.
+    """
+
+    result = db.session.execute(
+        db.update(Recipe)
+        .where(is_stale_processing())
+        .values(image_status=FAILED, image_processing_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def set_recipe_image(recipe: Recipe, filename, variants, folder=None):
+    """Replace the image of recipe and release the files of the old one.
+
+    The files of the new image are stored from the local folder processing
+    wrote them to. Without folder they are the stored files of an image
+    other recipes use. Those may be deleted by release_image_files until
+    the image lock is held, then nothing is changed and False returned.
+    """
+
+    lock_image(db.session.connection(), filename)
+    if folder is not None:
+        store_image_files(folder)
+    elif not get_storage().exists(shard_key(filename)):
+        db.session.rollback()
+        return False
+
+    old_file, old_variants = recipe.image, recipe.image_variants
+    recipe.image = filename
+    recipe.image_variants = variants
+    recipe.image_status = None
+    recipe.image_processing_at = None
+    db.session.add(recipe)
+    db.session.commit()
+
+    if old_file and old_file != filename:
+        release_image_files(old_file, old_variants)
+    return True
+
+
+@event.listens_for(db.session, "before_flush")
+def collect_deleted_recipe_images(session, flush_context, instances):
+    """Remember the images of recipes deleted by the flush, e.g. by cascades."""
+
+    with session.no_autoflush:
+        for obj in session.deleted:
+            if isinstance(obj, Recipe) and obj.image:
+                images = session.info.setdefault("deleted_images", {})
+                images[obj.image] = obj.image_variants
+
+
+@event.listens_for(db.session, "after_flush")
+def release_deleted_recipe_images(session, flush_context):
+    """Mark the images of deleted recipes no recipe uses any more for release.
+
+    The files are released after commit.
+    """
+
+    images = session.info.pop("deleted_images", None)
+    if not images:
+        return
+
+    referenced = set(
+        session.connection()
+        .execute(db.select(Recipe.image).where(Recipe.image.in_(list(images))))
+        .scalars()
+    )
+    released = session.info.setdefault("released_images", {})
+    for filename, variants in images.items():
+        if filename not in referenced:
+            released[filename] = variants
+
+
+@event.listens_for(db.session, "after_commit")
+def remove_released_images(session):
+    for filename, variants in session.info.pop("released_images", {}).items():
+        release_image_files(filename, variants)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def keep_released_images(session, previous_transaction):
+    session.info.pop("deleted_images", None)
+    session.info.pop("released_images", None)
+
+
+def iter_referenced_image_files():
+    """Yield (file name, image) of all files used by recipes, ordered by name.
+
+    Image names start with a fixed length content hash, so the files of
+    images ordered by name are ordered by file name as well.
+    """
+
+    result = db.session.execute(
+        db.select(Recipe.image, Recipe.image_variants)
+        .where(Recipe.image.is_not(None))
+        .order_by(Recipe.image)
+        .execution_options(yield_per=GC_CHUNK_SIZE)
+    )
+    last_image = None
+    for image, variants in result:
+        if image != last_image:
+            last_image = image
+            for name in image_filenames(image, variants):
+                yield name, image
+
+
+def diff_image_files(storage):
+    """Compare the stored image files with the ones recipes use.
+
+    Both are streamed in file name order and merged, so memory use does not
+    depend on the number of files. Yields (key, modified_at) of stored files
+    no recipe uses as ("orphan", key, modified_at) and image files recipes
+    use but the storage does not have as ("dangling", file name, image).
+    """
+
+    stored = iter(storage.iter_files())
+    referenced = iter_referenced_image_files()
+    file = next(stored, None)
+    reference = next(referenced, None)
+
+    while file or reference:
+        name = file[0].rsplit("/", 1)[-1] if file else None
+        if reference is None or (file and name < reference[0]):
+            yield ORPHAN, file[0], file[1]
+            file = next(stored, None)
+        elif file is None or name > reference[0]:
+            yield DANGLING, reference[0], reference[1]
+            reference = next(referenced, None)
+        else:
+            file = next(stored, None)
+            reference = next(referenced, None)
+
+
+class ImageJobs:
+    """Queue of image processing jobs of one app.
+
+    Pillow work runs in a process pool. Every job is driven by a thread that
+    waits for its result and writes it to the recipe, so request workers
+    return as soon as the upload is stored.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self._processes = ProcessPoolExecutor(max_workers=workers)
+        self._threads = ThreadPoolExecutor(max_workers=workers)
+        self._futures = set()
+        self._lock = Lock()
+
+    def submit(self, recipe_id, upload, filename, image_format, started_at):
+        """Process the local file upload as image filename of the recipe.
+
+        started_at is the start time start_image_processing returned, the
+        result is dropped if the processing was restarted meanwhile. upload
+        is deleted when done.
+        """
+
+        future = self._threads.submit(
+            self._run, recipe_id, upload, filename, image_format, started_at
+        )
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _run(self, recipe_id, upload, filename, image_format, started_at):
+        with self.app.app_context(), tempfile.TemporaryDirectory(
+            dir=image_work_folder()
+        ) as folder:
+            try:
+                variants = self._processes.submit(
+                    process_image,
+                    upload,
+                    os.path.join(folder, filename),
+                    image_format,
+                    *image_variants_config(),
+                ).result()
+                failed = False
+            except Exception:
+                current_app.logger.exception("processing image %s failed", filename)
+                failed = True
+            finally:
+                os.unlink(upload)
+
+            # the files are only stored along with the image of the recipe
+            recipe = db.session.get(Recipe, recipe_id)
+            if recipe is None:
+                return
+            if recipe.image_processing_at != started_at:
+                # taken as failed and replaced by a later upload
+                current_app.logger.warning(
+                    "dropping stale image %s of recipe %s", filename, recipe_id
+                )
+            elif failed:
+                recipe.image_status = FAILED
+                recipe.image_processing_at = None
+                db.session.commit()
+            else:
+                set_recipe_image(recipe, filename, variants, folder)
+
+    def wait(self):
+        """Block until all submitted jobs are done."""
+
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result()
+
+
+_image_jobs_lock = Lock()
+
+
+def get_image_jobs() -> ImageJobs:
+    with _image_jobs_lock:
+        jobs = current_app.extensions.get("image_jobs")
+        if jobs is None:
+            app = current_app._get_current_object()
+            jobs = ImageJobs(app, current_app.config["IMAGE_WORKERS"])
+            current_app.extensions["image_jobs"] = jobs
+        return jobs
@@ -0,0 +1,85 @@
+"""
+JSON encoding of the responses
+
+The JSON_BACKEND config selects the provider of app.json, used by jsonify,
+request.get_json and the streamed lists: "orjson" encodes with orjson,
+"stdlib" with the json module like Flask does by default. "auto", the
+default, takes orjson if it is installed. Both write the same JSON: sorted
+keys, dates as HTTP dates.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AUTO = "auto"
+ORJSON = "orjson"
+STDLIB = "stdlib"
+
+# json.dumps arguments orjson follows, its output is compact or indented by 2
+ORJSON_ARGUMENTS = {"sort_keys", "indent", "separators"}
+# the separators of json.dumps that write what orjson writes
+COMPACT_SEPARATORS = (",", ":")
+INDENT_SEPARATORS = (",", ": ")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson encoding with the defaults and date format of Flask.
+
+    Arguments orjson has no option for fall back to the json module.
+    """
+
+    def _encode(self, obj, sort_keys, indent):
+        # dates are left to default, orjson would write ISO 8601
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def _follows(self, kwargs):
+        """Return whether orjson writes what json.dumps(**kwargs) writes."""
+
+        if kwargs.keys() - ORJSON_ARGUMENTS:
+            return False
+        indent = kwargs.get("indent")
+        separators = kwargs.get("separators")
+        separators = tuple(separators) if separators is not None else None
+        if indent is None:
+            # json.dumps separates by ", " and ": " by default
+            return separators == COMPACT_SEPARATORS
+        return indent == 2 and separators in [None, INDENT_SEPARATORS]
+
+    def dumps(self, obj, **kwargs):
+        if not self._follows(kwargs):
+            return super().dumps(obj, **kwargs)
+        indent = kwargs.get("indent")
+        sort_keys = kwargs.get("sort_keys", self.sort_keys)
+        return self._encode(obj, sort_keys, indent).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self._encode(obj, self.sort_keys, indent) + b"\n", mimetype=self.mimetype
+        )
+
+
+def create_json_provider(app):
+    """Return the JSON provider for the JSON_BACKEND config of app."""
+
+    backend = app.config["JSON_BACKEND"]
+    if backend == ORJSON and orjson is None:
+        raise RuntimeError("JSON_BACKEND orjson needs the orjson package")
+    if backend in [AUTO, ORJSON] and orjson is not None:
+        return OrjsonProvider(app)
+    return DefaultJSONProvider(app)
@@ -1,5 +1,6 @@
-from flask import url_for
 from app.extensions import db
+from app.models.recipe import Recipe
+from app.url_templates import url_template
 from datetime import datetime
 
 
@@ -22,22 +23,51 @@ class Book(db.Model):
         "polymorphic_identity": "book",
         "polymorphic_on": type,
     }
+    __table_args__ = (
+        # visibility filter, keyset pagination order of the books of an owner
+        db.Index("ix_book_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
+    # fields of the serialization of all book types, for sparse fieldsets
+    FIELDS = ["id", "title", "type", "year", "_links", "issue", "author"]
 
     def from_dict(self, data):
         for field in ["title", "type", "year"]:
             if field in data:
                 setattr(self, field, data[field])
 
-    def to_dict(self):
+    @classmethod
+    def to_dict_list(cls, books, fields=None):
+        """Serialize books for the list endpoints.
+
+        The recipe ids of all books are read in one query, if _links are
+        requested, instead of loading the recipes of every book.
+        """
+
+        if fields and "_links" not in fields:
+            recipe_ids = {}
+        else:
+            recipe_ids = get_recipe_ids_by_book([book.id for book in books])
+        data = [book.to_dict(recipe_ids.get(book.id, [])) for book in books]
+        if fields:
+            data = [{k: v for k, v in d.items() if k in fields} for d in data]
+        return data
+
+    def to_dict(self, recipe_ids=None):
+        """Serialize the book, recipe_ids are read if not given."""
+
+        if recipe_ids is None:
+            recipe_ids = get_recipe_ids_by_book([self.id]).get(self.id, [])
+        recipe_url = url_template("api.get_recipe", "recipe_id")
         data = {
             "id": self.id,
             "title": self.title,
             "type": self.type,
             "year": self.year,
             "_links": {
-                "self": url_for("api.get_book", book_id=self.id),
-                "recipes": [r.to_dict()["_links"]["self"] for r in self.recipes],
-                "user": url_for("api.get_user", id=self.user_id),
+                "self": url_template("api.get_book", "book_id").format(self.id),
+                "recipes": [recipe_url.format(recipe_id) for recipe_id in recipe_ids],
+                "user": url_template("api.get_user", "id").format(self.user_id),
             },
         }
         return data
@@ -59,8 +89,8 @@ class Magazine(Book):
             if field in data:
                 setattr(self, field, data[field])
 
-    def to_dict(self):
-        data = {**super().to_dict(), "issue": self.issue}
+    def to_dict(self, recipe_ids=None):
+        data = {**super().to_dict(recipe_ids), "issue": self.issue}
 
         return data
 
@@ -77,7 +107,21 @@ class Cookbook(Book):
             if field in data:
                 setattr(self, field, data[field])
 
-    def to_dict(self):
-        data = {**super().to_dict(), "author": self.author}
+    def to_dict(self, recipe_ids=None):
+        data = {**super().to_dict(recipe_ids), "author": self.author}
 
         return data
+
+
+def get_recipe_ids_by_book(book_ids):
+    """Return the ids of the recipes of the books as {book id: [recipe id]}."""
+
+    rows = db.session.execute(
+        db.select(Recipe.id, Recipe.book_id)
+        .where(Recipe.book_id.in_(book_ids))
+        .order_by(Recipe.id)
+    )
+    recipe_ids = {}
+    for recipe_id, book_id in rows:
+        recipe_ids.setdefault(book_id, []).append(recipe_id)
+    return recipe_ids
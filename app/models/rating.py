@@ -3,12 +3,22 @@ from datetime import datetime
 
 class Rating(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    rating = db.Column(db.Integer, nullable=False, default=0)
+    # active_history keeps the previous value around for the rating aggregates
+    rating = db.column_property(
+        db.Column(db.Integer, nullable=False, default=0), active_history=True
+    )
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id"), nullable=False, index=True
+    )
     recipe_id = db.Column(db.Integer, db.ForeignKey("recipe.id"), nullable=False)
 
     recipe = db.relationship("Recipe", back_populates="ratings")
-    user = db.relationship("User", back_populates="ratings")
\ No newline at end of file
+    user = db.relationship("User", back_populates="ratings")
+
+    __table_args__ = (
+        # one rating per user and recipe, also serves lookups by recipe_id
+        db.Index("ix_rating_recipe_id_user_id", "recipe_id", "user_id", unique=True),
+    )
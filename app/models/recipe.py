@@ -1,21 +1,42 @@
-from flask import url_for
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.ext.hybrid import hybrid_property
 from app.extensions import db
 from app.models.rating import Rating
-from app.models.tag import Tag
+from app.models.tag import UNKNOWN_TAG_MSG, Tag, resolve_tags, tag_key
 from app.models.recipe_tag import recipe_tags
-from datetime import datetime
+from app.storage import get_storage, shard_key
+from app.url_templates import url_template
+from datetime import datetime, timedelta
+
+# image_status of an image being processed, and of one that failed
+PROCESSING = "processing"
+FAILED = "failed"
 
 
 class Recipe(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(256), nullable=False)
     page = db.Column(db.Integer)
-    image = db.Column(db.String())
+    # content addressed, recipes with the same image share its files
+    image = db.Column(db.String(), index=True)
+    # "processing" while an uploaded image is processed, "failed" if that failed
+    image_status = db.Column(db.String(16))
+    # start of the processing, a job running longer is taken as failed
+    image_processing_at = db.Column(db.DateTime)
+    # file names of the image variants as {extension: {width: file name}}
+    image_variants = db.Column(db.JSON)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Denormalized rating aggregates, maintained on every Rating write
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+
     # Relationships
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey("book.id"), nullable=False)
+    book_id = db.Column(
+        db.Integer, db.ForeignKey("book.id"), nullable=False, index=True
+    )
 
     book = db.relationship("Book", back_populates="recipes")
     user = db.relationship("User", back_populates="recipes")
@@ -23,54 +44,268 @@ class Recipe(db.Model):
     ratings = db.relationship("Rating", cascade="all, delete-orphan")
     tags = db.relationship("Tag", secondary=recipe_tags)
 
+    __table_args__ = (
+        # keyset pagination order of the recipes of an owner
+        db.Index("ix_recipe_user_id_created_at_id", "user_id", "created_at", "id"),
+        # visibility filter, and random sampling of the recipes of an owner
+        db.Index("ix_recipe_user_id_id", "user_id", "id"),
+    )
+
     def from_dict(self, data):
+        """Set the fields of data, raises ValueError for an unknown tag id."""
+
         for field in ["title", "page", "image_path"]:
             if field in data:
                 setattr(self, field, data[field])
         if "tags" in data:
+            # all tags in a constant number of queries
+            tags = resolve_tags(data["tags"])
             for tag in data["tags"]:
-                # check if tag aleady exists
-                if "id" in tag:
-                    stmt = db.select(Tag).where(Tag.id == tag["id"])
-                else:
-                    stmt = db.select(Tag).where(Tag.tag_name == tag["tag_name"])
-                tag_obj = db.session.scalar(stmt)
-
-                if tag_obj:
+                tag_obj = tags.get(tag_key(tag))
+                if tag_obj is None:
+                    raise ValueError(UNKNOWN_TAG_MSG)
+                if tag_obj not in self.tags:
                     self.tags.append(tag_obj)
-                else:
-                    new_tag = Tag()
-                    new_tag.from_dict(tag)
-                    self.tags.append(new_tag)
 
-    def to_dict(self):
-        # Calculate average rating
-        stmt = (
-            db.select(db.func.avg(Rating.rating))
-            .where(Rating.recipe_id == self.id)
-            .group_by(Rating.recipe_id)
+    @hybrid_property
+    def average_rating(self):
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
+
+    @average_rating.expression
+    def average_rating(cls):
+        return db.case(
+            (
+                cls.rating_count > 0,
+                db.cast(cls.rating_sum, db.Float) / cls.rating_count,
+            ),
+            else_=0,
         )
-        average_rating = db.session.execute(stmt).scalar() or 0
-
-        data = {
-            "id": self.id,
-            "title": self.title,
-            "page": self.page,
-            "image": self.image,
-            "rating": average_rating,
-            "tags": [tag.to_dict() for tag in self.tags],
-            "_links": {
-                "self": url_for("api.get_recipe", recipe_id=self.id),
-                "user": url_for("api.get_user", id=self.user_id),
-                "book": url_for("api.get_book", book_id=self.book_id),
-                "image": (
-                    "/images/{}/{}".format(self.id, self.image) if self.image else None
-                ),
-                "thumbnail": (
-                    "/images/{}/{}.thumbnail".format(self.id, self.image)
-                    if self.image
-                    else None
-                ),
-            },
+
+    # fields of the serialization, in order, selectable as sparse fieldsets
+    FIELDS = [
+        "id",
+        "title",
+        "page",
+        "image",
+        "image_status",
+        "rating",
+        "tags",
+        "_links",
+    ]
+
+    # columns to_dict_list reads per field, id and created_at are always read
+    LIST_FIELD_COLUMNS = {
+        "id": [],
+        "title": ["title"],
+        "page": ["page"],
+        "image": ["image"],
+        "image_status": ["image_status", "image_processing_at"],
+        "rating": ["average_rating"],
+        "tags": [],
+        "_links": ["user_id", "book_id", "image", "image_variants"],
+    }
+
+    @classmethod
+    def list_columns(cls, fields=None):
+        """Return the columns to select for to_dict_list with fields.
+
+        id and created_at are included for the pagination cursor.
+        """
+
+        names = {"id": None, "created_at": None}
+        for field in fields or cls.FIELDS:
+            names.update(dict.fromkeys(cls.LIST_FIELD_COLUMNS[field]))
+        return [getattr(cls, name) for name in names]
+
+    @classmethod
+    def to_dict_list(cls, rows, fields=None):
+        """Serialize rows of list_columns(fields) for the list endpoints.
+
+        Works on plain column tuples, no Recipe objects are loaded. The tags
+        of all rows are read in one query, if requested.
+        """
+
+        fields = fields or cls.FIELDS
+        tags = {}
+        if "tags" in fields and rows:
+            tags = get_tags_by_recipe([row.id for row in rows])
+        links = RecipeLinks() if "_links" in fields else None
+        return [
+            recipe_dict(row, tags.get(row.id, []), fields, links) for row in rows
+        ]
+
+    def to_dict(self):
+        tags = [tag.to_dict() for tag in self.tags]
+        return recipe_dict(self, tags, self.FIELDS, RecipeLinks(storage_urls=True))
+
+
+class RecipeLinks:
+    """Builds the _links of recipes from url templates made once.
+
+    Image links are the stable /images/ urls of the image server, which
+    redirects to the storage. With storage_urls, e.g. for a single recipe,
+    they are the urls of the storage if it has them, pre-signed ones for S3.
+    Lists don't sign a url per image file.
+    """
+
+    def __init__(self, storage_urls=False):
+        self.recipe = url_template("api.get_recipe", "recipe_id")
+        self.user = url_template("api.get_user", "id")
+        self.book = url_template("api.get_book", "book_id")
+        self.storage_urls = storage_urls
+
+    def image_url(self, recipe_id, filename):
+        """Return the url of an image file."""
+
+        url = get_storage().url(shard_key(filename)) if self.storage_urls else None
+        return url or "/images/{}/{}".format(recipe_id, filename)
+
+    def image_links(self, recipe):
+        """Return the image variant links as {extension: {"<width>w": url}}."""
+
+        return {
+            extension: {
+                "{}w".format(width): self.image_url(recipe.id, filename)
+                for width, filename in filenames.items()
+            }
+            for extension, filenames in (recipe.image_variants or {}).items()
+        }
+
+    def to_dict(self, recipe):
+        """Return the links of a Recipe or a row with its columns."""
+
+        image = recipe.image
+        return {
+            "self": self.recipe.format(recipe.id),
+            "user": self.user.format(recipe.user_id),
+            "book": self.book.format(recipe.book_id),
+            "image": self.image_url(recipe.id, image) if image else None,
+            "thumbnail": (
+                self.image_url(recipe.id, "{}.thumbnail".format(image))
+                if image
+                else None
+            ),
+            "images": self.image_links(recipe) if image else None,
         }
-        return data
+
+
+def recipe_dict(recipe, tags, fields, links):
+    """Serialize fields of a Recipe or a row of Recipe.list_columns(fields).
+
+    tags are the serialized tags of the recipe.
+    """
+
+    data = {}
+    if "id" in fields:
+        data["id"] = recipe.id
+    if "title" in fields:
+        data["title"] = recipe.title
+    if "page" in fields:
+        data["page"] = recipe.page
+    if "image" in fields:
+        data["image"] = recipe.image
+    if "image_status" in fields:
+        data["image_status"] = image_status(recipe)
+    if "rating" in fields:
+        data["rating"] = recipe.average_rating
+    if "tags" in fields:
+        data["tags"] = tags
+    if "_links" in fields:
+        data["_links"] = links.to_dict(recipe)
+    return data
+
+
+def stale_processing_cutoff():
+    """Return the start time before which processing is taken as failed."""
+
+    timeout = current_app.config["IMAGE_PROCESSING_TIMEOUT"]
+    return datetime.utcnow() - timedelta(seconds=timeout)
+
+
+def image_status(recipe):
+    """Return the image_status of a Recipe or a row with its columns.
+
+    Processing that started before stale_processing_cutoff, e.g. in a worker
+    that died, is failed, whether or not flask fail_stale_images stored it.
+    """
+
+    if recipe.image_status == PROCESSING and (
+        recipe.image_processing_at is None
+        or recipe.image_processing_at < stale_processing_cutoff()
+    ):
+        return FAILED
+    return recipe.image_status
+
+
+def get_tags_by_recipe(recipe_ids):
+    """Return the serialized tags of the recipes as {recipe id: [tag]}."""
+
+    rows = db.session.execute(
+        db.select(
+            recipe_tags.c.recipe_id, Tag.id, Tag.tag_name, Tag.color, Tag.tag_type
+        )
+        .join(Tag, Tag.id == recipe_tags.c.tag_id)
+        .where(recipe_tags.c.recipe_id.in_(recipe_ids))
+        .order_by(recipe_tags.c.recipe_id, Tag.id)
+    )
+    tags = {}
+    for recipe_id, tag_id, tag_name, color, tag_type in rows:
+        tags.setdefault(recipe_id, []).append(
+            {"id": tag_id, "tag_name": tag_name, "color": color, "tag_type": tag_type}
+        )
+    return tags
+
+
+def _committed_rating(rating: Rating):
+    """Return the value of rating as it is currently stored in the database."""
+
+    history = db.inspect(rating).attrs.rating.history
+    if history.deleted:
+        return int(history.deleted[0] or 0)
+    if history.unchanged:
+        return int(history.unchanged[0] or 0)
+    return 0
+
+
+@event.listens_for(db.session, "before_flush")
+def update_rating_aggregates(session, flush_context, instances):
+    """Apply written and deleted Ratings to Recipe.rating_count/rating_sum.
+
+    Runs inside the flush, so the aggregates are committed in the same
+    transaction as the ratings themselves.
+    """
+
+    deltas = {}
+
+    with session.no_autoflush:
+        for rating in session.new:
+            if isinstance(rating, Rating) and rating.recipe:
+                count, total = deltas.get(rating.recipe, (0, 0))
+                deltas[rating.recipe] = (count + 1, total + int(rating.rating or 0))
+
+        for rating in session.dirty:
+            if isinstance(rating, Rating) and rating.recipe:
+                history = db.inspect(rating).attrs.rating.history
+                if not history.added:
+                    continue
+                change = int(history.added[0] or 0) - _committed_rating(rating)
+                count, total = deltas.get(rating.recipe, (0, 0))
+                deltas[rating.recipe] = (count, total + change)
+
+        for rating in session.deleted:
+            if isinstance(rating, Rating) and rating.recipe:
+                count, total = deltas.get(rating.recipe, (0, 0))
+                deltas[rating.recipe] = (count - 1, total - _committed_rating(rating))
+
+    for recipe, (count, total) in deltas.items():
+        if recipe in session.deleted:
+            continue
+        if recipe in session.new:
+            recipe.rating_count = (recipe.rating_count or 0) + count
+            recipe.rating_sum = (recipe.rating_sum or 0) + total
+        else:
+            # increment in SQL, concurrent ratings must not overwrite each other
+            recipe.rating_count = Recipe.rating_count + count
+            recipe.rating_sum = Recipe.rating_sum + total
@@ -1,5 +1,9 @@
+from sqlalchemy.dialects import postgresql, sqlite
 from app.extensions import db
 
+UNKNOWN_TAG_MSG = "unknown tag id"
+
+
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tag_name = db.Column(db.String(128), unique=True, nullable=False)
@@ -21,4 +25,99 @@ class Tag(db.Model):
             "color": self.color,
             "tag_type": self.tag_type,
         }
-        return data
\ No newline at end of file
+        return data
+
+
+def tag_key(tag):
+    """Return the key of a tag dict in the mapping of resolve_tags."""
+
+    if "id" in tag:
+        return ("id", tag["id"])
+    return ("tag_name", tag["tag_name"])
+
+
+def _insert_tags(new_tags):
+    """Insert the tag dicts new_tags, return the inserted Tags.
+
+    On PostgreSQL and SQLite names another transaction inserted meanwhile
+    are skipped by ON CONFLICT DO NOTHING. Other databases insert the tags
+    resolve_tags did not find, a concurrent insert of a name fails the
+    unique tag_name.
+    """
+
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        insert = postgresql.insert(Tag)
+    elif dialect_name == "sqlite":
+        insert = sqlite.insert(Tag)
+    else:
+        tags = [Tag(**tag) for tag in new_tags]
+        db.session.add_all(tags)
+        db.session.flush()
+        return tags
+
+    insert = insert.on_conflict_do_nothing(index_elements=["tag_name"])
+    return db.session.scalars(insert.returning(Tag), new_tags).all()
+
+
+def find_tags(tags):
+    """Return the existing Tags a list of tag dicts refers to, by id or name.
+
+    All referenced ids and names are looked up in one query.
+    """
+
+    ids = {tag["id"] for tag in tags if "id" in tag}
+    names = {tag["tag_name"] for tag in tags if "tag_name" in tag}
+    if not (ids or names):
+        return []
+    return db.session.scalars(
+        db.select(Tag).where(Tag.id.in_(ids) | Tag.tag_name.in_(names))
+    ).all()
+
+
+def resolve_tags(tags, existing=None):
+    """Return {tag_key(tag): Tag} for a list of tag dicts.
+
+    The existing tags are looked up with find_tags, or taken from existing,
+    its result for tags or more. Missing tags are inserted in one INSERT .. ON
+    CONFLICT DO NOTHING, names another transaction inserted meanwhile are
+    read back, so concurrent writers of the same new tag don't fail on the
+    unique tag_name. A tag with an unknown id is created from its tag_name,
+    without one it is left out, callers answer it with UNKNOWN_TAG_MSG.
+    """
+
+    by_id, by_name = {}, {}
+
+    def add(found):
+        for tag in found:
+            by_id[tag.id] = tag
+            by_name[tag.tag_name] = tag
+
+    add(find_tags(tags) if existing is None else existing)
+
+    new_tags = {}
+    for tag in tags:
+        if tag.get("id") in by_id or "tag_name" not in tag:
+            continue
+        if tag["tag_name"] not in by_name:
+            new_tags.setdefault(
+                tag["tag_name"],
+                {
+                    "tag_name": tag["tag_name"],
+                    "color": tag.get("color"),
+                    "tag_type": tag.get("tag_type"),
+                },
+            )
+    if new_tags:
+        add(_insert_tags(list(new_tags.values())))
+        concurrent = set(new_tags) - set(by_name)
+        if concurrent:
+            add(db.session.scalars(db.select(Tag).where(Tag.tag_name.in_(concurrent))))
+
+    mapping = {}
+    for tag in tags:
+        if tag.get("id") in by_id:
+            mapping[tag_key(tag)] = by_id[tag["id"]]
+        elif tag.get("tag_name") in by_name:
+            mapping[tag_key(tag)] = by_name[tag["tag_name"]]
+    return mapping
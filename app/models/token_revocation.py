@@ -0,0 +1,19 @@
+from app.extensions import db
+
+
+class TokenRevocation(db.Model):
+    """Signed tokens of the user issued before the revocation are invalid.
+
+    Access tokens issued before revoked_at, refresh tokens issued before
+    refresh_revoked_at. A change of group or roles revokes the access tokens
+    alone, logging out both.
+    """
+
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
+    )
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)
+    refresh_revoked_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return "<TokenRevocation {} {}>".format(self.user_id, self.revoked_at)
@@ -1,11 +1,11 @@
 from app.extensions import db
-from flask import url_for
+from app.url_templates import url_template
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import secrets
 from app.models.user_roles import user_roles
 from app.models.role import Role
-import urllib, hashlib
+import hashlib
 
 
 class User(db.Model):
@@ -28,7 +28,7 @@ class User(db.Model):
     ratings = db.relationship("Rating", cascade=CASCADE_OPTIONS)
 
     user_group_id = db.Column(
-        db.Integer, db.ForeignKey("user_group.id", ondelete="SET NULL")
+        db.Integer, db.ForeignKey("user_group.id", ondelete="SET NULL"), index=True
     )
     user_group = db.relationship(
         "UserGroup", back_populates="users", foreign_keys=[user_group_id]
@@ -63,9 +63,9 @@ class User(db.Model):
             "username": self.username,
             "roles": self.get_roles(),
             "_links": {
-                "self": url_for("api.get_user", id=self.id),
+                "self": url_template("api.get_user", "id").format(self.id),
                 "user_group": (
-                    url_for("api.get_user_group", id=self.user_group_id)
+                    url_template("api.get_user_group", "id").format(self.user_group_id)
                     if self.user_group_id
                     else None
                 ),
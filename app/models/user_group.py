@@ -1,5 +1,5 @@
 from app.extensions import db
-from flask import url_for
+from app.url_templates import url_template
 from datetime import datetime
 
 
@@ -24,15 +24,18 @@ class UserGroup(db.Model):
         return "<UserGroup {}>".format(self.name)
 
     def to_dict(self):
+        user_url = url_template("api.get_user", "id")
         data = {
             "id": self.id,
             "group_name": self.group_name,
             "group_admin": self.group_admin.to_dict() if self.group_admin else None,
             "users": [user.to_dict() for user in self.users],
             "_links": {
-                "self": url_for("api.get_user_group", id=self.id),
-                "users": [url_for("api.get_user", id=user.id) for user in self.users],
-                "group_admin": url_for("api.get_user", id=self.group_admin.id),
+                "self": url_template("api.get_user_group", "id").format(self.id),
+                "users": [user_url.format(user.id) for user in self.users],
+                "group_admin": (
+                    user_url.format(self.group_admin.id) if self.group_admin else None
+                ),
             },
         }
 
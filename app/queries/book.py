@@ -1,11 +1,26 @@
+from sqlalchemy.orm import with_polymorphic
 from .user import filter_by_user_and_group
 from app.models.book import Book
 from app.extensions import db
 
 
 def get_user_books_query(user):
-    return filter_by_user_and_group(db.select(Book), user)
+    """Return the books of the user and group.
+
+    Columns of all book types are loaded in the same query, outer joined.
+    """
+
+    books = with_polymorphic(Book, "*")
+    return filter_by_user_and_group(db.select(books), user, Book.user_id)
 
 
 def get_user_books_by_id_query(user, book_id):
     return get_user_books_query(user).where(Book.id == book_id)
+
+
+def get_user_book_ids_query(user, book_ids):
+    """Return the ids of book_ids the user and group have access to."""
+
+    return filter_by_user_and_group(db.select(Book.id), user, Book.user_id).where(
+        Book.id.in_(book_ids)
+    )
@@ -0,0 +1,81 @@
+import importlib
+import inspect
+import re
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (QUERY PLAN) of a select, executable like any other statement."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, "sqlite")
+def _compile_explain_sqlite(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+def explain_query(session, query):
+    """Return the query plan of query as a list of lines."""
+
+    result = session.execute(Explain(query))
+    if session.get_bind().dialect.name == "sqlite":
+        # rows of (id, parent, notused, detail)
+        return [row[-1] for row in result]
+    return [row[0] for row in result]
+
+
+# plan lines of full table (or full index) scans
+FULL_SCAN_PATTERNS = {
+    "sqlite": re.compile(r"^SCAN \w+"),
+    "postgresql": re.compile(r"Seq Scan on"),
+}
+
+# modules of the query builders checked by flask explain_queries
+QUERY_MODULES = ["app.queries.book", "app.queries.rating", "app.queries.recipe"]
+
+# builders reading all rows by design
+FULL_SCAN_ALLOWED = {"get_rating_aggregates_query"}
+
+
+def is_full_scan(dialect_name, line):
+    pattern = FULL_SCAN_PATTERNS.get(dialect_name)
+    return bool(pattern and pattern.search(line))
+
+
+def query_builders(module_names=QUERY_MODULES):
+    """Yield (name, function) of the get_*_query functions of the modules."""
+
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if (
+                function.__module__ == module_name
+                and name.startswith("get_")
+                and name.endswith("_query")
+            ):
+                yield name, function
+
+
+def build_query(builder, arguments):
+    """Call builder with the arguments it takes by name.
+
+    Returns None if it requires an argument missing from arguments.
+    """
+
+    kwargs = {}
+    for name, parameter in inspect.signature(builder).parameters.items():
+        if name in arguments:
+            kwargs[name] = arguments[name]
+        elif parameter.default is parameter.empty:
+            return None
+    return builder(**kwargs)
@@ -0,0 +1,51 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from app.extensions import db
+
+
+def encode_cursor(item):
+    """Return an opaque cursor pointing behind item (by created_at, id)."""
+
+    raw = "{}|{:d}".format(item.created_at.isoformat(), item.id)
+    return urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) tuple of a cursor, raise ValueError if invalid."""
+
+    try:
+        raw = urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, item_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def paginate_query(query, model, limit, cursor=None, owner_ids=None):
+    """Return a keyset paginated query, ordered by (created_at, id).
+
+    Fetches limit + 1 rows, so the caller can tell if there is a next page.
+    query is filtered by the user_id of model. Given the owner_ids of that
+    filter, a page of several owners is picked from the next limit + 1 rows
+    of every owner, each read in order from the (user_id, created_at, id)
+    index, instead of sorting all rows of all owners.
+    """
+
+    order = (model.created_at, model.id)
+    after = None
+    if cursor:
+        after = db.tuple_(*order) > db.tuple_(*decode_cursor(cursor))
+        query = query.where(after)
+
+    if owner_ids and len(owner_ids) > 1:
+        pages = []
+        for owner_id in owner_ids:
+            page = db.select(model.id).where(model.user_id == owner_id)
+            if after is not None:
+                page = page.where(after)
+            page = page.order_by(*order).limit(limit + 1).subquery()
+            pages.append(db.select(page.c.id))
+        page_ids = db.union_all(*pages).subquery()
+        query = query.join(page_ids, page_ids.c.id == model.id)
+
+    return query.order_by(*order).limit(limit + 1)
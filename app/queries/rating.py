@@ -8,3 +8,11 @@ def get_rating_by_recipe_and_user_query(user, recipe):
     return db.select(Rating).where(
         db.and_(Rating.recipe_id == recipe.id, Rating.user_id == user.id)
     )
+
+
+def get_rating_aggregates_query():
+    """Return recipe_id, count and sum of ratings for every rated recipe."""
+
+    return db.select(
+        Rating.recipe_id, db.func.count(Rating.id), db.func.sum(Rating.rating)
+    ).group_by(Rating.recipe_id)
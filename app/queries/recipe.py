@@ -1,11 +1,85 @@
 from .user import filter_by_user_and_group
 from app.models.recipe import Recipe
+from app.models.recipe_tag import recipe_tags
+from app.search import search_query
 from app.extensions import db
 
 
 def get_user_recipes_query(user):
-    return filter_by_user_and_group(db.select(Recipe), user)
+    return filter_by_user_and_group(db.select(Recipe), user, Recipe.user_id)
+
+
+def get_user_recipe_rows_query(user, fields=None):
+    """Return the recipes of the user and group as rows for Recipe.to_dict_list.
+
+    Only the columns the serialization of fields needs are selected.
+    """
+
+    return filter_by_user_and_group(
+        db.select(*Recipe.list_columns(fields)), user, Recipe.user_id
+    )
 
 
 def get_user_recipes_by_id_query(user, recipe_id):
     return get_user_recipes_query(user).where(Recipe.id == recipe_id)
+
+
+def get_user_recipe_counts_query(user):
+    """Return (owner id, number of recipes) of the user and group, by owner id."""
+
+    return (
+        filter_by_user_and_group(
+            db.select(Recipe.user_id, db.func.count()), user, Recipe.user_id
+        )
+        .group_by(Recipe.user_id)
+        .order_by(Recipe.user_id)
+    )
+
+
+def get_owner_recipe_ids_query(owner_id):
+    """Return the ids of the recipes of owner_id, in id order.
+
+    The order of the (user_id, id) index, unlike the recipes of several
+    owners, which are sorted.
+    """
+
+    return db.select(Recipe.id).where(Recipe.user_id == owner_id).order_by(Recipe.id)
+
+
+def filter_recipes_query(query, filters, dialect_name):
+    """Return query restricted by all given recipe filters, combined with AND.
+
+    filters is a dict as returned by parse_recipe_filters. With a q filter the
+    recipes are ordered by search rank.
+    """
+
+    if "book" in filters:
+        query = query.where(Recipe.book_id == filters["book"])
+
+    for tag_id in filters.get("tags", []):
+        # one EXISTS per tag, answered by the recipe_tags primary key
+        query = query.where(
+            db.exists().where(
+                recipe_tags.c.recipe_id == Recipe.id, recipe_tags.c.tag_id == tag_id
+            )
+        )
+
+    if "min_rating" in filters:
+        query = query.where(Recipe.average_rating >= filters["min_rating"])
+
+    if "has_image" in filters:
+        if filters["has_image"]:
+            query = query.where(Recipe.image.is_not(None))
+        else:
+            query = query.where(Recipe.image.is_(None))
+
+    if "created_after" in filters:
+        query = query.where(Recipe.created_at > filters["created_after"])
+
+    if "q" in filters:
+        matches = search_query(dialect_name, filters["q"])
+        query = query.join(matches, matches.c.recipe_id == Recipe.id).order_by(
+            matches.c.rank
+        )
+
+    return query
@@ -1,13 +1,13 @@
 from app.models.user import User
+from app.visibility import get_visible_owner_ids
 
 
-def filter_by_user_and_group(query, user):
-    """Return a query that joins User and filters by user and user_group."""
+def filter_by_user_and_group(query, user, owner_id):
+    """Return a query filtered to rows whose owner_id column is user or a
+    member of the user group of user.
+    """
 
-    return query.join(User).where(
-        (User.id == user.id)
-        | ((User.user_group_id == user.user_group_id) & (User.user_group_id != None))
-    )
+    return query.where(owner_id.in_(get_visible_owner_ids(user)))
 
 
 def filter_by_user(query, user):
@@ -0,0 +1,221 @@
+"""
+full text search index for recipes
+
+The index covers recipe title, tag names and book title. On SQLite it is a
+FTS5 virtual table, on PostgreSQL a table with a weighted tsvector document
+and a GIN index. Both are named recipe_search, are created and dropped along
+with the ORM tables and are kept in sync with recipes on every flush.
+"""
+
+import re
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from app.extensions import db
+from app.models.book import Book
+from app.models.recipe import Recipe
+from app.models.recipe_tag import recipe_tags
+from app.models.tag import Tag
+
+SEARCH_TABLE = "recipe_search"
+
+# recipe attributes stored in the index
+INDEXED_RECIPE_ATTRIBUTES = ["title", "tags", "book_id", "book"]
+
+# bm25 weights of the title, tags and book columns
+SQLITE_RANK_WEIGHTS = (10.0, 4.0, 1.0)
+
+sqlite_index = db.table(
+    SEARCH_TABLE,
+    db.column("rowid"),
+    db.column("title"),
+    db.column("tags"),
+    db.column("book"),
+)
+postgresql_index = db.table(
+    SEARCH_TABLE,
+    db.column("recipe_id"),
+    db.column("document", TSVECTOR),
+)
+
+event.listen(
+    db.metadata,
+    "after_create",
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search "
+        "USING fts5(title, tags, book, tokenize='unicode61 remove_diacritics 2')"
+    ).execute_if(dialect="sqlite"),
+)
+event.listen(
+    db.metadata,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS recipe_search ("
+        "recipe_id INTEGER PRIMARY KEY REFERENCES recipe (id) ON DELETE CASCADE, "
+        "document TSVECTOR NOT NULL)"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    db.metadata,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_recipe_search_document "
+        "ON recipe_search USING GIN (document)"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    db.metadata,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS recipe_search").execute_if(
+        dialect=("sqlite", "postgresql")
+    ),
+)
+
+
+def _tag_names(aggregate):
+    """Return a scalar subquery of all tag names of the outer recipe."""
+
+    return (
+        db.select(aggregate)
+        .select_from(recipe_tags.join(Tag.__table__))
+        .where(recipe_tags.c.recipe_id == Recipe.id)
+        .scalar_subquery()
+    )
+
+
+def _to_tsvector(text, weight):
+    config = db.literal_column("'simple'::regconfig")
+    return db.func.setweight(
+        db.func.to_tsvector(config, db.func.coalesce(text, "")), weight
+    )
+
+
+def _documents_query(dialect_name):
+    """Return a select of (recipe id, indexed columns...) for all recipes."""
+
+    if dialect_name == "sqlite":
+        tags = _tag_names(db.func.group_concat(Tag.tag_name, " "))
+        columns = [Recipe.id, Recipe.title, tags, Book.title]
+    else:
+        tags = _tag_names(db.func.string_agg(Tag.tag_name, " "))
+        document = (
+            _to_tsvector(Recipe.title, "A")
+            .op("||")(_to_tsvector(tags, "B"))
+            .op("||")(_to_tsvector(Book.title, "C"))
+        )
+        columns = [Recipe.id, document]
+
+    return db.select(*columns).join(Book, Recipe.book_id == Book.id)
+
+
+def _index_table(dialect_name):
+    if dialect_name == "sqlite":
+        return sqlite_index, sqlite_index.c.rowid
+    return postgresql_index, postgresql_index.c.recipe_id
+
+
+def remove_from_index(connection, recipe_ids):
+    """Remove recipes from the search index."""
+
+    if not recipe_ids:
+        return
+
+    index, recipe_id = _index_table(connection.dialect.name)
+    connection.execute(db.delete(index).where(recipe_id.in_(recipe_ids)))
+
+
+def index_recipes(connection, recipe_ids=None):
+    """(Re)index the given recipes, or all recipes if recipe_ids is None."""
+
+    dialect_name = connection.dialect.name
+    index, recipe_id = _index_table(dialect_name)
+    documents = _documents_query(dialect_name)
+
+    if recipe_ids is None:
+        connection.execute(db.delete(index))
+    elif not recipe_ids:
+        return
+    else:
+        remove_from_index(connection, recipe_ids)
+        documents = documents.where(Recipe.id.in_(recipe_ids))
+
+    columns = [c.name for c in index.c]
+    connection.execute(db.insert(index).from_select(columns, documents))
+
+
+def _has_changes(obj, attributes):
+    state = db.inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attributes)
+
+
+@event.listens_for(db.session, "after_flush")
+def sync_search_index(session, flush_context):
+    """Update the search index for recipes and books written by the flush."""
+
+    recipe_ids = set()
+    book_ids = set()
+    deleted_recipe_ids = set()
+
+    for obj in session.new:
+        if isinstance(obj, Recipe):
+            recipe_ids.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Recipe) and _has_changes(obj, INDEXED_RECIPE_ATTRIBUTES):
+            recipe_ids.add(obj.id)
+        elif isinstance(obj, Book) and _has_changes(obj, ["title"]):
+            book_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Recipe):
+            deleted_recipe_ids.add(obj.id)
+
+    if not (recipe_ids or book_ids or deleted_recipe_ids):
+        return
+
+    connection = session.connection()
+    if book_ids:
+        recipe_ids.update(
+            connection.execute(
+                db.select(Recipe.id).where(Recipe.book_id.in_(book_ids))
+            ).scalars()
+        )
+    remove_from_index(connection, deleted_recipe_ids)
+    index_recipes(connection, recipe_ids - deleted_recipe_ids)
+
+
+def search_query(dialect_name, term):
+    """Return a subquery of (recipe_id, rank) for recipes matching term.
+
+    Every word of term has to match a word in the recipe title, its tag names
+    or its book title as a prefix. Lower rank is a better match.
+    """
+
+    words = re.findall(r"\w+", term)
+
+    if not words:
+        return (
+            db.select(
+                db.literal(None, db.Integer).label("recipe_id"),
+                db.literal(0).label("rank"),
+            )
+            .where(db.false())
+            .subquery()
+        )
+
+    if dialect_name == "sqlite":
+        index = db.literal_column(SEARCH_TABLE)
+        match = " ".join('"{}"*'.format(word) for word in words)
+        query = db.select(
+            sqlite_index.c.rowid.label("recipe_id"),
+            db.func.bm25(index, *SQLITE_RANK_WEIGHTS).label("rank"),
+        ).where(index.op("MATCH")(match))
+    else:
+        ts_query = db.func.to_tsquery(
+            db.literal_column("'simple'::regconfig"),
+            " & ".join("{}:*".format(word) for word in words),
+        )
+        document = postgresql_index.c.document
+        query = db.select(
+            postgresql_index.c.recipe_id,
+            (-db.func.ts_rank(document, ts_query)).label("rank"),
+        ).where(document.op("@@")(ts_query))
+
+    return query.subquery()
@@ -0,0 +1,265 @@
+"""
+storage of uploaded files
+
+Files are addressed by a key, a relative path with "/" separators. The
+IMAGE_STORAGE config selects the backend: "local" stores files below
+UPLOAD_FOLDER, "s3" in the S3_BUCKET of an S3 compatible service. boto3 is
+only needed for "s3".
+"""
+
+import heapq
+import mimetypes
+import os
+import shutil
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from flask import current_app
+
+LOCAL = "local"
+S3 = "s3"
+
+THUMBNAIL_SUFFIX = ".thumbnail"
+COPY_BUFFER_SIZE = 64 * 1024
+# maximum number of keys of one DeleteObjects request
+S3_MAX_KEYS = 1000
+
+
+def shard_key(filename):
+    """Return the key of filename in <2 characters>/<2 characters>/ shards."""
+
+    return "{}/{}/{}".format(filename[:2], filename[2:4], filename)
+
+
+def mimetype(key):
+    if key.endswith(THUMBNAIL_SUFFIX):
+        key = key[: -len(THUMBNAIL_SUFFIX)]
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class Storage(ABC):
+    """Interface of the storage backends."""
+
+    @abstractmethod
+    def exists(self, key):
+        pass
+
+    @abstractmethod
+    def open(self, key):
+        """Return a binary file object to read key from."""
+
+    @abstractmethod
+    def save(self, key, stream):
+        """Store stream under key, reading it in chunks."""
+
+    @abstractmethod
+    def save_file(self, key, path):
+        """Move the local file path to key."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Delete key, a missing key is no error."""
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    @abstractmethod
+    def iter_files(self):
+        """Yield (key, modified_at) of all stored files, ordered by file name.
+
+        Sharded keys ordered by file name are ordered by key as well.
+        """
+
+    def local_path(self, key):
+        """Return the local path of key, None if it is not stored locally."""
+
+        return None
+
+    def url(self, key):
+        """Return a url for clients to fetch key directly, or None."""
+
+        return None
+
+
+class LocalStorage(Storage):
+    """Files in a local folder.
+
+    Keys of files stored before sharding are found in the folder itself.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        path = os.path.join(self.root, *key.split("/"))
+        if not os.path.exists(path):
+            unsharded = os.path.join(self.root, os.path.basename(path))
+            if os.path.exists(unsharded):
+                return unsharded
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def open(self, key):
+        return open(self.local_path(key), "rb")
+
+    def _prepare(self, key):
+        path = os.path.join(self.root, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def save(self, key, stream):
+        path = self._prepare(key)
+        partial = path + ".partial"
+        with open(partial, "wb") as f:
+            shutil.copyfileobj(stream, f, COPY_BUFFER_SIZE)
+        os.replace(partial, path)
+
+    def save_file(self, key, path):
+        shutil.move(path, self._prepare(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _iter_folder(self, folder, key_prefix, depth):
+        """Yield the files below folder in key order, depth levels deep."""
+
+        try:
+            entries = sorted(os.scandir(folder), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            key = key_prefix + entry.name
+            if depth and entry.is_dir():
+                yield from self._iter_folder(entry.path, key + "/", depth - 1)
+            elif not depth and entry.is_file():
+                modified_at = datetime.utcfromtimestamp(entry.stat().st_mtime)
+                yield key, modified_at
+
+    def iter_files(self):
+        # unsharded files in the root, merged by file name
+        return heapq.merge(
+            self._iter_folder(self.root, "", 2),
+            self._iter_folder(self.root, "", 0),
+            key=lambda file: file[0].rsplit("/", 1)[-1],
+        )
+
+
+class S3Storage(Storage):
+    """Objects in a bucket of an S3 compatible service.
+
+    Uploads are streamed in parts by boto3. Clients fetch files with
+    pre-signed urls, or below public_url for public buckets. client is
+    created from the boto3 default configuration if not given.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        prefix="",
+        client=None,
+        endpoint_url=None,
+        public_url=None,
+        url_expiration=3600,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.public_url = public_url
+        self.url_expiration = url_expiration
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as error:
+            code = getattr(error, "response", {}).get("Error", {}).get("Code")
+            if code in ["404", "NoSuchKey", "NotFound"]:
+                return False
+            raise
+        return True
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+
+    def save(self, key, stream):
+        self.client.upload_fileobj(
+            stream,
+            self.bucket,
+            self._key(key),
+            ExtraArgs={"ContentType": mimetype(key)},
+        )
+
+    def save_file(self, key, path):
+        self.client.upload_file(
+            path,
+            self.bucket,
+            self._key(key),
+            ExtraArgs={"ContentType": mimetype(key)},
+        )
+        os.unlink(path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_many(self, keys):
+        objects = [{"Key": self._key(key)} for key in keys]
+        for start in range(0, len(objects), S3_MAX_KEYS):
+            batch = objects[start : start + S3_MAX_KEYS]
+            self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": batch, "Quiet": True}
+            )
+
+    def iter_files(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"][len(self.prefix) :]
+                modified_at = item["LastModified"].astimezone(timezone.utc)
+                yield key, modified_at.replace(tzinfo=None)
+
+    def url(self, key):
+        if self.public_url:
+            return self.public_url.rstrip("/") + "/" + self._key(key)
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=self.url_expiration,
+        )
+
+
+def create_storage(config):
+    if config["IMAGE_STORAGE"] == S3:
+        return S3Storage(
+            config["S3_BUCKET"],
+            prefix=config["S3_PREFIX"],
+            endpoint_url=config["S3_ENDPOINT_URL"],
+            public_url=config["S3_PUBLIC_URL"],
+            url_expiration=config["S3_URL_EXPIRATION"],
+        )
+    return LocalStorage(config["UPLOAD_FOLDER"])
+
+
+def get_storage() -> Storage:
+    """Return the storage of the app, created on first use."""
+
+    storage = current_app.extensions.get("storage")
+    if storage is None:
+        storage = create_storage(current_app.config)
+        current_app.extensions["storage"] = storage
+    return storage
@@ -0,0 +1,31 @@
+"""
+url templates of the API endpoints
+
+url_for matches the rule of the endpoint and builds the url anew on every
+call. Serializers need the same few urls for every item of a list, so each
+is built once per request with a marker argument and filled in with
+str.format afterwards.
+"""
+
+from flask import g, url_for
+
+# an id no url contains otherwise
+MARKER = 7_919_000_003
+
+
+def url_template(endpoint, argument):
+    """Return the url of endpoint with "{}" in place of the int argument.
+
+    url_template("api.get_recipe", "recipe_id").format(1) is the same as
+    url_for("api.get_recipe", recipe_id=1).
+    """
+
+    templates = g.setdefault("url_templates", {})
+    template = templates.get((endpoint, argument))
+    if template is None:
+        url = url_for(endpoint, **{argument: MARKER})
+        template = (
+            url.replace("{", "{{").replace("}", "}}").replace(str(MARKER), "{}")
+        )
+        templates[(endpoint, argument)] = template
+    return template
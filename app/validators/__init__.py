@@ -3,3 +3,12 @@ from .validate_rating import validate_rating
 from .validate_tags import validate_tags
 from .validate_book_type import validate_book_type
 from .validate_limit import validate_limit
+from .validate_cursor import validate_cursor
+from .validate_recipe_filters import validate_recipe_filters, parse_recipe_filters
+from .validate_seed import validate_seed
+from .validate_recipe_items import (
+    validate_recipe_items,
+    parse_recipe_items,
+    validate_recipe_item,
+)
+from .validate_fields import validate_fields, parse_fields
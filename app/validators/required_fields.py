@@ -2,6 +2,14 @@ from functools import wraps
 from flask import request
 from app.api.errors import bad_request
 
+def missing_field_error(data, required_keys):
+  """Return the error message for the first missing required key, or None."""
+  for key in required_keys:
+    if key not in data or not data[key]:
+      return f"Missing required field: {key}"
+  return None
+
+
 def required_fields(required_keys):
   def decorator(f):
     @wraps(f)
@@ -9,9 +17,9 @@ def required_fields(required_keys):
       data = request.get_json()
       if not data:
         return bad_request("No JSON body provided")
-      for key in required_keys:
-        if key not in data or not data[key]:
-          return bad_request(f"Missing required field: {key}")
+      error = missing_field_error(data, required_keys)
+      if error:
+        return bad_request(error)
       return f(*args, **kwargs)
     return decorated_function
   return decorator
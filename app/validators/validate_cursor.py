@@ -0,0 +1,21 @@
+from functools import wraps
+from flask import request
+from app.api.errors import bad_request
+from app.queries.pagination import decode_cursor
+
+INVALID_CURSOR_MSG = "cursor is invalid, use the next link of the previous page"
+
+
+def validate_cursor(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # cursor in query string
+        if request.args.get("cursor"):
+            try:
+                decode_cursor(request.args.get("cursor"))
+            except ValueError:
+                return bad_request(INVALID_CURSOR_MSG)
+
+        return f(*args, **kwargs)
+
+    return decorated_function
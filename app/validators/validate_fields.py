@@ -0,0 +1,39 @@
+from functools import wraps
+from flask import request
+from app.api.errors import bad_request
+
+UNKNOWN_FIELD_MSG = "unknown field {}"
+
+
+def parse_fields(args, allowed):
+    """Return the fields of the comma separated fields query parameter
+
+    Returns None without one, i.e. all fields. raises ValueError with a
+    message naming the first field not in allowed
+    """
+
+    value = args.get("fields")
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    for field in fields:
+        if field not in allowed:
+            raise ValueError(UNKNOWN_FIELD_MSG.format(field))
+    return fields or None
+
+
+def validate_fields(allowed):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # sparse fieldset in query string
+            try:
+                parse_fields(request.args, allowed)
+            except ValueError as e:
+                return bad_request(str(e))
+
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
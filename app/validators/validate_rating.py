@@ -7,7 +7,7 @@ INVALID_RATING_MSG = "rating must be an integer between 1 and 5"
 def _validate_rating(rating):
     try:
         rating = int(rating)
-    except ValueError:
+    except (TypeError, ValueError):
         return 0
     if not 1 <= rating <= 5:
         return 0
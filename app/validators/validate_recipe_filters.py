@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request
+from app.api.errors import bad_request
+
+INVALID_FILTER_MSG = "invalid value for filter {}"
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+
+def _parse_datetime(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo:
+        # created_at is stored as naive UTC
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_min_rating(value):
+    rating = float(value)
+    if not 1 <= rating <= 5:
+        raise ValueError(value)
+    return rating
+
+
+def _parse_boolean(value):
+    return BOOLEAN_VALUES[value.lower()]
+
+
+def _parse_tags(value):
+    return [int(tag_id) for tag_id in value.split(",")]
+
+
+FILTER_PARSERS = {
+    "q": str,
+    "book": int,
+    "tags": _parse_tags,
+    "min_rating": _parse_min_rating,
+    "has_image": _parse_boolean,
+    "created_after": _parse_datetime,
+}
+
+
+def parse_recipe_filters(args):
+    """Return a dict of the parsed recipe filters present in the query string
+
+    q: full text search term \n
+    book: book id \n
+    tags: comma separated tag ids, recipe must have all of them \n
+    min_rating: minimum average rating between 1 and 5 \n
+    has_image: true or false \n
+    created_after: ISO 8601 date or datetime
+
+    raises ValueError with a message naming the invalid filter
+    """
+
+    filters = {}
+    for name, parse in FILTER_PARSERS.items():
+        value = args.get(name)
+        if not value:
+            continue
+        try:
+            filters[name] = parse(value)
+        except (KeyError, ValueError):
+            raise ValueError(INVALID_FILTER_MSG.format(name))
+    return filters
+
+
+def validate_recipe_filters(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # filters in query string
+        try:
+            parse_recipe_filters(request.args)
+        except ValueError as e:
+            return bad_request(str(e))
+
+        return f(*args, **kwargs)
+
+    return decorated_function
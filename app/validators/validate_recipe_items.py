@@ -0,0 +1,94 @@
+from functools import wraps
+from flask import current_app, g, request
+from app.api.errors import bad_request
+from .required_fields import missing_field_error
+from .validate_rating import INVALID_RATING_MSG, _validate_rating
+from .validate_tags import INVALID_TAGS_MSG, _validate_tags
+
+NDJSON_MIMETYPES = {"application/x-ndjson", "application/jsonl"}
+INVALID_ITEMS_MSG = "body must be a JSON array or NDJSON of recipe objects"
+INVALID_LINE_MSG = "invalid JSON in line {:d}"
+TOO_MANY_ITEMS_MSG = "at most {:d} recipes per request"
+INVALID_ITEM_MSG = "recipe must be a JSON object"
+INVALID_BOOK_ID_MSG = "book_id must be an integer"
+INVALID_TITLE_MSG = "title must be a string"
+
+
+def parse_recipe_items(req):
+    """Return the list of items of a JSON array or NDJSON body
+
+    raises ValueError with a message if the body is neither
+    """
+
+    if req.mimetype in NDJSON_MIMETYPES:
+        items = []
+        for number, line in enumerate(req.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(current_app.json.loads(line))
+            except ValueError:
+                raise ValueError(INVALID_LINE_MSG.format(number))
+        return items
+
+    items = req.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError(INVALID_ITEMS_MSG)
+    return items
+
+
+def validate_recipe_item(item):
+    """Validate one recipe of a bulk request like create_recipe does
+
+    Fills in rating 0 and empty tags if they are missing, returns the error
+    message for an invalid item or None.
+    """
+
+    if not isinstance(item, dict):
+        return INVALID_ITEM_MSG
+    error = missing_field_error(item, ["book_id", "title"])
+    if error:
+        return error
+    try:
+        item["book_id"] = int(item["book_id"])
+    except (TypeError, ValueError):
+        return INVALID_BOOK_ID_MSG
+    if not isinstance(item["title"], str):
+        return INVALID_TITLE_MSG
+    if "rating" in item:
+        item["rating"] = _validate_rating(item["rating"])
+        if not item["rating"]:
+            return INVALID_RATING_MSG
+    else:
+        item["rating"] = 0
+    if "tags" in item:
+        if not _validate_tags(item["tags"]):
+            return INVALID_TAGS_MSG
+    else:
+        item["tags"] = []
+    return None
+
+
+def validate_recipe_items(f):
+    """Validate the body of a bulk request, the items are checked one by one
+    with validate_recipe_item
+
+    The parsed items are kept in g.recipe_items for the view.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            items = parse_recipe_items(request)
+        except ValueError as e:
+            return bad_request(str(e))
+        if not items:
+            return bad_request(INVALID_ITEMS_MSG)
+        limit = current_app.config["RECIPE_BULK_LIMIT"]
+        if len(items) > limit:
+            return bad_request(TOO_MANY_ITEMS_MSG.format(limit))
+
+        g.recipe_items = items
+        return f(*args, **kwargs)
+
+    return decorated_function
@@ -0,0 +1,20 @@
+from functools import wraps
+from flask import request
+from app.api.errors import bad_request
+
+INVALID_SEED_MSG = "seed must be an integer"
+
+
+def validate_seed(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # seed in query string
+        if request.args.get("seed"):
+            try:
+                int(request.args.get("seed"))
+            except ValueError:
+                return bad_request(INVALID_SEED_MSG)
+
+        return f(*args, **kwargs)
+
+    return decorated_function
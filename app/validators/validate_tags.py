@@ -39,7 +39,7 @@ def _validate_tags(tags):
     if not isinstance(tags, list):
         return False
     for tag in tags:
-        if not _validate_tag(tag):
+        if not isinstance(tag, dict) or not _validate_tag(tag):
             return False
         if not _validate_tag_color(tag):
             return False
@@ -0,0 +1,87 @@
+"""
+visibility of books and recipes
+
+Users see their own books and recipes and those of the members of their
+user group. Instead of joining user into every read, the ids of the
+visible owners are resolved once per request and queries filter on the
+indexed user_id column with a plain IN. Group members are cached in the
+worker for GROUP_MEMBERS_TTL seconds, membership changes made through
+another worker apply here after at most that delay, 0 reads them on every
+request.
+
+The group of the user itself comes from the token and may be older, see
+TOKEN_CACHE_TTL and signed tokens. A user missing from the members of that
+group has left it and sees only their own books and recipes, so the stale
+window of a removal is GROUP_MEMBERS_TTL alone.
+"""
+
+from threading import Lock
+from time import monotonic
+from flask import current_app, g, has_request_context
+from app.extensions import db
+from app.models.user import User
+
+
+class GroupMembers:
+    """Cache of user group id to the ids of its members."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._members = {}
+        self._lock = Lock()
+
+    def get(self, group_id, reload=False):
+        """Return the ids of the members of group_id, reload skips the cache."""
+
+        with self._lock:
+            entry = None if reload else self._members.get(group_id)
+            if entry and monotonic() - entry[0] < self.ttl:
+                return entry[1]
+
+        member_ids = tuple(
+            db.session.execute(
+                db.select(User.id).where(User.user_group_id == group_id)
+            ).scalars()
+        )
+        if self.ttl > 0:
+            with self._lock:
+                self._members[group_id] = (monotonic(), member_ids)
+        return member_ids
+
+    def invalidate(self):
+        with self._lock:
+            self._members.clear()
+
+
+def get_group_members() -> GroupMembers:
+    members = current_app.extensions.get("group_members")
+    if members is None:
+        members = GroupMembers(current_app.config["GROUP_MEMBERS_TTL"])
+        current_app.extensions["group_members"] = members
+    return members
+
+
+def get_visible_owner_ids(user):
+    """Return the ids of the users whose books and recipes user can see.
+
+    Resolved once per request.
+    """
+
+    cached = g.get("visible_owner_ids") if has_request_context() else None
+    if cached and cached[0] == user.id:
+        return cached[1]
+
+    owner_ids = (user.id,)
+    if user.user_group_id is not None:
+        members = get_group_members()
+        member_ids = members.get(user.user_group_id)
+        if user.id not in member_ids:
+            # joined since the members were cached, or left the group since
+            # the token was issued
+            member_ids = members.get(user.user_group_id, reload=True)
+        if user.id in member_ids:
+            owner_ids = member_ids
+
+    if has_request_context():
+        g.visible_owner_ids = (user.id, owner_ids)
+    return owner_ids
@@ -0,0 +1,48 @@
+"""shared setup of the benchmark databases"""
+
+from app import create_app
+from app.extensions import db
+from app.models.book import Cookbook
+from app.models.recipe import Recipe
+from app.models.role import Role
+from app.models.user import User
+from config import TestConfig
+
+BATCH_SIZE = 10_000
+
+
+def make_app(database):
+    class BenchmarkConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + database
+
+    return create_app(BenchmarkConfig)
+
+
+def seed_recipes(app, n_recipes, username="bench"):
+    """Create the user username (password username) with n_recipes recipes."""
+
+    with app.app_context():
+        db.create_all()
+        role = db.session.get(Role, 2) or Role(id=2, role_name="user")
+        user = User(username=username, email=username + "@example.com")
+        user.set_password(username)
+        user.roles.append(role)
+        book = Cookbook(title=username + " book")
+        user.books.append(book)
+        db.session.add(user)
+        db.session.commit()
+
+        for start in range(0, n_recipes, BATCH_SIZE):
+            rows = [
+                {
+                    "title": "recipe {:d}".format(i),
+                    "page": i,
+                    "user_id": user.id,
+                    "book_id": book.id,
+                }
+                for i in range(start, min(start + BATCH_SIZE, n_recipes))
+            ]
+            db.session.execute(db.insert(Recipe.__table__), rows)
+        db.session.commit()
+
+        return user.id
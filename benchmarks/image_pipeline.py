@@ -0,0 +1,135 @@
+"""CPU time and peak memory per image upload, decode once vs. three times
+
+usage: python -m benchmarks.image_pipeline [--megapixels 12 24] [--repeat 3]
+
+Writes synthetic phone photos as JPEG and processes each one in a fresh
+process per pipeline: "triple" is the former decode, fit, save, reopen and
+thumbnail sequence, "single" is app.images.process_image. Reports the mean
+CPU time per upload and the peak RSS above the process baseline.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageOps
+
+from app.images import IMAGE_SIZE, THUMBNAIL, THUMBNAIL_SIZE, process_image
+
+# 4:3 sensor sizes of typical phone cameras
+PHOTO_SIZES = {12: (4000, 3000), 24: (5664, 4248), 48: (8000, 6000)}
+
+
+def triple_decode(source, filename, image_format):
+    with Image.open(source) as image:
+        image_format = image.format
+
+    with Image.open(source) as image:
+        ImageOps.fit(image, IMAGE_SIZE).save(filename)
+
+    with Image.open(filename) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        image.save(THUMBNAIL.format(filename), image_format)
+
+
+def single_decode(source, filename, image_format):
+    with Image.open(source) as image:
+        image_format = image.format
+    process_image(source, filename, image_format)
+
+
+PIPELINES = {"triple": triple_decode, "single": single_decode}
+
+
+def write_photo(path, megapixels):
+    """Write a JPEG with gradients and sensor noise, roughly photo sized."""
+
+    size = PHOTO_SIZES[megapixels]
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 24)
+    red = Image.blend(gradient, noise, 0.3)
+    green = Image.blend(gradient.rotate(90).resize(size), noise, 0.3)
+    blue = Image.radial_gradient("L").resize(size)
+    Image.merge("RGB", (red, green, blue)).save(path, "JPEG", quality=90)
+
+
+def peak_rss():
+    """Return the peak RSS of this process in kB.
+
+    ru_maxrss survives exec, so the peak of the parent process would show up
+    in the child. VmHWM does not, use it where available.
+    """
+
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(pipeline, source, repeat):
+    baseline = peak_rss()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "image.jpg")
+        start = time.process_time()
+        for _ in range(repeat):
+            PIPELINES[pipeline](source, filename, "JPEG")
+        cpu_time = (time.process_time() - start) / repeat
+    peak = peak_rss() - baseline
+
+    print(
+        "{:8} {:8.0f} ms CPU {:8.1f} MB peak RSS".format(
+            pipeline, cpu_time * 1000, peak / 1024
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--megapixels", type=int, nargs="+", default=[12, 24], choices=PHOTO_SIZES
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pipeline", choices=PIPELINES)
+    parser.add_argument("--source")
+    args = parser.parse_args()
+
+    if args.pipeline:
+        run(args.pipeline, args.source, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in args.megapixels:
+            source = os.path.join(tmp, "{:d}mp.jpg".format(megapixels))
+            write_photo(source, megapixels)
+            print(
+                "{:d} MP photo, {:.1f} MB".format(
+                    megapixels, os.path.getsize(source) / 1e6
+                )
+            )
+            for pipeline in PIPELINES:
+                subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.image_pipeline",
+                        "--pipeline",
+                        pipeline,
+                        "--source",
+                        source,
+                        "--repeat",
+                        str(args.repeat),
+                    ],
+                    check=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""encode time of recipe lists, stdlib json vs. orjson
+
+usage: python -m benchmarks.json_encoding [--recipes 10000] [--repeat 5]
+
+Seeds a temporary sqlite database, serializes all recipes once with
+Recipe.to_dict_list and encodes them with each JSON backend: "response"
+is the whole list through jsonify as GET /recipes sends it, "stream" the
+items one by one as ?stream=true does. Reports the best time of --repeat
+runs and the body size.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from app.extensions import db
+from app.json_provider import OrjsonProvider, orjson
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.queries.recipe import get_user_recipe_rows_query
+from benchmarks.fixtures import make_app, seed_recipes
+
+PROVIDERS = {"stdlib": DefaultJSONProvider, "orjson": OrjsonProvider}
+
+
+def encode_response(app, payloads):
+    return jsonify(payloads).get_data()
+
+
+def encode_stream(app, payloads):
+    dumps = app.json.dumps
+    return ",".join(dumps(item, separators=(",", ":")) for item in payloads)
+
+
+MODES = {"response": encode_response, "stream": encode_stream}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        user_id = seed_recipes(app, args.recipes)
+
+        with app.test_request_context():
+            user = db.session.get(User, user_id)
+            rows = db.session.execute(get_user_recipe_rows_query(user)).all()
+            payloads = Recipe.to_dict_list(rows)
+            print("{:d} recipes".format(len(payloads)))
+
+            for backend, provider in PROVIDERS.items():
+                if backend == "orjson" and orjson is None:
+                    print("orjson is not installed")
+                    continue
+                app.json = provider(app)
+                for mode, encode in MODES.items():
+                    best = float("inf")
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        body = encode(app, payloads)
+                        best = min(best, time.perf_counter() - start)
+                    print(
+                        "{:8} {:8} {:8.1f} ms {:8.1f} MB".format(
+                            backend, mode, best * 1000, len(body) / 1e6
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
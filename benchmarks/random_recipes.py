@@ -0,0 +1,89 @@
+"""ORDER BY random() vs. sampling positions of the recipe id index
+
+usage: python -m benchmarks.random_recipes [--recipes 100000] [--limit 10]
+                                            [--group-users 3]
+
+Times the former query of GET /recipes/search/random against the sampling
+now used by the endpoint, on a temporary sqlite database: for a user
+without a group, and for a user of a group of --group-users users, all with
+--recipes recipes.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.api.recipes import _sample_recipe_ids
+from app.extensions import db
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.models.user_group import UserGroup
+from app.queries.recipe import get_user_recipes_query
+from benchmarks.fixtures import make_app, seed_recipes
+
+REPEAT = 5
+
+
+def order_by_random(user, limit):
+    query = get_user_recipes_query(user).order_by(db.func.random()).limit(limit)
+    return db.session.execute(query).scalars().all()
+
+
+def position_sampling(user, limit):
+    sample = _sample_recipe_ids(user, limit, random.Random())
+    query = get_user_recipes_query(user).where(Recipe.id.in_(sample))
+    return db.session.execute(query).scalars().all()
+
+
+def seed_group(app, n_users, n_recipes):
+    """Create a group of n_users users with n_recipes recipes each."""
+
+    user_ids = [
+        seed_recipes(app, n_recipes, username="member{:d}".format(i))
+        for i in range(n_users)
+    ]
+    with app.app_context():
+        group = UserGroup(group_name="bench group")
+        db.session.add(group)
+        db.session.flush()
+        db.session.execute(
+            db.update(User).where(User.id.in_(user_ids)).values(user_group_id=group.id)
+        )
+        db.session.commit()
+    return user_ids[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--group-users", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        cases = {
+            "single user": seed_recipes(app, args.recipes),
+            "group of {:d}".format(args.group_users): seed_group(
+                app, args.group_users, args.recipes
+            ),
+        }
+        print("{:d} recipes per user, limit {:d}".format(args.recipes, args.limit))
+
+        for case, user_id in cases.items():
+            print("\n{}:".format(case))
+            with app.app_context():
+                user = db.session.get(User, user_id)
+                for sample in [order_by_random, position_sampling]:
+                    start = time.perf_counter()
+                    for _ in range(REPEAT):
+                        assert len(sample(user, args.limit)) == args.limit
+                        db.session.expunge_all()
+                    elapsed = (time.perf_counter() - start) / REPEAT
+                    print("  {:18} {:8.1f} ms".format(sample.__name__, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
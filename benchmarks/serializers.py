@@ -0,0 +1,132 @@
+"""throughput of the recipe list serialization, ORM objects vs. column rows
+
+usage: python -m benchmarks.serializers [--recipes 10000] [--repeat 3]
+
+Seeds a temporary sqlite database with recipes of two tags each and
+serializes all of them within a request, the way GET /recipes does. "orm"
+is the former path: Recipe objects with their tags selectin loaded and
+url_for for every link. "rows" is Recipe.to_dict_list on the rows of
+get_user_recipe_rows_query, "sparse" the same with fields=id,title,_links.
+Reports the best time of --repeat runs, query and serialization included.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from flask import url_for
+from sqlalchemy.orm import selectinload
+
+from app.extensions import db
+from app.models.recipe import Recipe
+from app.models.recipe_tag import recipe_tags
+from app.models.tag import Tag
+from app.models.user import User
+from app.queries.recipe import get_user_recipes_query, get_user_recipe_rows_query
+from app.storage import get_storage, shard_key
+from benchmarks.fixtures import BATCH_SIZE, make_app, seed_recipes
+
+TAGS = 20
+TAGS_PER_RECIPE = 2
+SPARSE_FIELDS = ["id", "title", "_links"]
+
+
+def legacy_image_url(recipe, filename):
+    url = get_storage().url(shard_key(filename))
+    return url or "/images/{}/{}".format(recipe.id, filename)
+
+
+def legacy_to_dict(recipe):
+    """Recipe.to_dict before url templates."""
+
+    return {
+        "id": recipe.id,
+        "title": recipe.title,
+        "page": recipe.page,
+        "image": recipe.image,
+        "image_status": recipe.image_status,
+        "rating": recipe.average_rating,
+        "tags": [tag.to_dict() for tag in recipe.tags],
+        "_links": {
+            "self": url_for("api.get_recipe", recipe_id=recipe.id),
+            "user": url_for("api.get_user", id=recipe.user_id),
+            "book": url_for("api.get_book", book_id=recipe.book_id),
+            "image": legacy_image_url(recipe, recipe.image) if recipe.image else None,
+            "thumbnail": (
+                legacy_image_url(recipe, "{}.thumbnail".format(recipe.image))
+                if recipe.image
+                else None
+            ),
+            "images": None,
+        },
+    }
+
+
+def serialize_orm(user):
+    query = get_user_recipes_query(user).options(selectinload(Recipe.tags))
+    return [legacy_to_dict(r) for r in db.session.execute(query).scalars()]
+
+
+def serialize_rows(user, fields=None):
+    rows = db.session.execute(get_user_recipe_rows_query(user, fields)).all()
+    return Recipe.to_dict_list(rows, fields)
+
+
+MODES = {
+    "orm": serialize_orm,
+    "rows": serialize_rows,
+    "sparse": lambda user: serialize_rows(user, SPARSE_FIELDS),
+}
+
+
+def seed_tags(n_recipes):
+    db.session.execute(
+        db.insert(Tag.__table__),
+        [{"tag_name": "tag {:d}".format(i)} for i in range(TAGS)],
+    )
+    rows = [
+        {"recipe_id": recipe_id, "tag_id": (recipe_id + i) % TAGS + 1}
+        for recipe_id in range(1, n_recipes + 1)
+        for i in range(TAGS_PER_RECIPE)
+    ]
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(recipe_tags.insert(), rows[start : start + BATCH_SIZE])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        user_id = seed_recipes(app, args.recipes)
+
+        with app.test_request_context():
+            seed_tags(args.recipes)
+            user = db.session.get(User, user_id)
+            # same output, recipes without images
+            assert serialize_orm(user) == serialize_rows(user)
+            print("{:d} recipes".format(args.recipes))
+
+            for mode, serialize in MODES.items():
+                best = float("inf")
+                for _ in range(args.repeat):
+                    db.session.expunge_all()
+                    user = db.session.get(User, user_id)
+                    start = time.perf_counter()
+                    data = serialize(user)
+                    best = min(best, time.perf_counter() - start)
+                assert len(data) == args.recipes
+                print(
+                    "{:8} {:8.0f} ms {:10.0f} recipes/s".format(
+                        mode, best * 1000, args.recipes / best
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Peak memory of GET /recipes as one JSON array vs. ?stream=true
+
+usage: python -m benchmarks.stream_export [--recipes 100000]
+
+Seeds a temporary sqlite database and requests the full recipe list in a
+fresh process per mode, reporting the peak RSS of that process.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64encode
+
+from benchmarks.fixtures import make_app, seed_recipes
+
+
+def run(database, mode):
+    app = make_app(database)
+    client = app.test_client()
+    credentials = b64encode(b"bench:bench").decode("utf-8")
+    token = client.get(
+        "/api/1/tokens", headers={"Authorization": "Basic " + credentials}
+    ).json["token"]
+
+    query_string = {"stream": "true"} if mode == "stream" else None
+    start = time.perf_counter()
+    response = client.get(
+        "/api/1/recipes",
+        headers={"Authorization": "Bearer " + token},
+        query_string=query_string,
+    )
+    size = sum(len(chunk) for chunk in response.response)
+    elapsed = time.perf_counter() - start
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        "{:8} {:8.2f} s {:10.1f} MB body {:10.1f} MB peak RSS".format(
+            mode, elapsed, size / 1e6, max_rss / 1024
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipes", type=int, default=100_000)
+    parser.add_argument("--mode", choices=["list", "stream"])
+    parser.add_argument("--database")
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.database, args.mode)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "bench.db")
+        seed_recipes(make_app(database), args.recipes)
+        print("{:d} recipes".format(args.recipes))
+        for mode in ["list", "stream"]:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.stream_export",
+                    "--mode",
+                    mode,
+                    "--database",
+                    database,
+                ],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""join user with OR vs. user_id IN (visible owners)
+
+usage: python -m benchmarks.visibility [--users 100000] [--group-size 5]
+                                        [--without-indexes]
+
+Seeds a temporary sqlite database with users in groups, a book and a few
+recipes each, and compares the query plan and time of the former
+visibility filter, joining user with an OR on user and group, against the
+user_id IN filter of app.visibility, for the recipes of random users, one
+request each. --without-indexes drops the user_id and user_group_id indexes
+listed in OWNER_INDEXES, the schema before the owner ids filter.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.extensions import db
+from app.models.book import Book
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.models.user_group import UserGroup
+from app.queries.explain import explain_query
+from app.queries.recipe import get_user_recipes_query
+from benchmarks.fixtures import BATCH_SIZE, make_app
+
+RECIPES_PER_USER = 3
+REPEAT = 200
+OWNER_INDEXES = [
+    "ix_recipe_user_id_id",
+    "ix_recipe_user_id_created_at_id",
+    "ix_book_user_id_created_at_id",
+    "ix_user_user_group_id",
+]
+
+
+def join_or_filter(user):
+    return (
+        db.select(Recipe)
+        .join(User)
+        .where(
+            (User.id == user.id)
+            | (
+                (User.user_group_id == user.user_group_id)
+                & (User.user_group_id != None)  # noqa: E711
+            )
+        )
+    )
+
+
+def owner_ids_filter(user):
+    return get_user_recipes_query(user)
+
+
+def insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start : start + BATCH_SIZE]
+        db.session.execute(db.insert(model.__table__), batch)
+
+
+def seed(n_users, group_size):
+    db.create_all()
+    n_groups = n_users // group_size
+    insert(
+        UserGroup,
+        [{"id": i + 1, "group_name": "g{:d}".format(i)} for i in range(n_groups)],
+    )
+    insert(
+        User,
+        [
+            {
+                "id": i + 1,
+                "username": "u{:d}".format(i),
+                "email": "u{:d}@example.com".format(i),
+                "user_group_id": (
+                    i // group_size + 1 if i // group_size < n_groups else None
+                ),
+            }
+            for i in range(n_users)
+        ],
+    )
+    insert(
+        Book,
+        [
+            {
+                "id": i + 1,
+                "title": "b{:d}".format(i),
+                "type": "cookbook",
+                "user_id": i + 1,
+            }
+            for i in range(n_users)
+        ],
+    )
+    insert(
+        Recipe,
+        [
+            {
+                "title": "r{:d}".format(i),
+                "user_id": i // RECIPES_PER_USER + 1,
+                "book_id": i // RECIPES_PER_USER + 1,
+                "rating_count": 0,
+                "rating_sum": 0,
+            }
+            for i in range(n_users * RECIPES_PER_USER)
+        ],
+    )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--group-size", type=int, default=5)
+    parser.add_argument("--without-indexes", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            seed(args.users, args.group_size)
+            if args.without_indexes:
+                for index in OWNER_INDEXES:
+                    db.session.execute(db.text("DROP INDEX " + index))
+            db.session.execute(db.text("ANALYZE"))
+            print(
+                "{:d} users in groups of {:d}, {:d} recipes".format(
+                    args.users, args.group_size, args.users * RECIPES_PER_USER
+                )
+            )
+
+            user_ids = random.Random(0).sample(range(1, args.users + 1), REPEAT)
+            for query in [join_or_filter, owner_ids_filter]:
+                with app.test_request_context():
+                    user = db.session.get(User, user_ids[0])
+                    print("\n{}:".format(query.__name__))
+                    for line in explain_query(db.session, query(user)):
+                        print("  " + line)
+
+                start = time.perf_counter()
+                for user_id in user_ids:
+                    # one request per user, owner ids are resolved per request
+                    with app.test_request_context():
+                        user = db.session.get(User, user_id)
+                        recipes = db.session.execute(query(user)).scalars().all()
+                        assert len(recipes) >= RECIPES_PER_USER
+                        db.session.expunge_all()
+                elapsed = (time.perf_counter() - start) / REPEAT
+                print("  {:8.2f} ms per request".format(elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,12 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, ".env"))
 
 
+def env_list(name, default=""):
+    """Return the comma separated values of environment variable name."""
+
+    return [value for value in os.environ.get(name, default).split(",") if value]
+
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or "toBeChanged"
     SQLALCHEMY_DATABASE_URI = os.environ.get(
@@ -12,9 +18,55 @@ class Config:
     ) or "sqlite:///" + os.path.join(basedir, "app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER") or "images"
+    # relative to the project root
+    UPLOAD_FOLDER = os.path.join(basedir, os.environ.get("UPLOAD_FOLDER") or "images")
+    # prefix of the nginx internal location of UPLOAD_FOLDER, images are then
+    # sent with X-Accel-Redirect. Set USE_X_SENDFILE for X-Sendfile servers.
+    IMAGE_ACCEL_REDIRECT = os.environ.get("IMAGE_ACCEL_REDIRECT")
+    USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "").lower() in ["true", "1"]
+    # "local" stores images in UPLOAD_FOLDER, "s3" in an S3 compatible bucket
+    IMAGE_STORAGE = os.environ.get("IMAGE_STORAGE") or "local"
+    S3_BUCKET = os.environ.get("S3_BUCKET")
+    S3_PREFIX = os.environ.get("S3_PREFIX") or ""
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+    # base url of a public bucket, otherwise image urls are pre-signed
+    S3_PUBLIC_URL = os.environ.get("S3_PUBLIC_URL")
+    S3_URL_EXPIRATION = int(os.environ.get("S3_URL_EXPIRATION") or 3600)
+    # local folder for uploads while they are processed, defaults to the temp dir
+    IMAGE_WORK_FOLDER = os.environ.get("IMAGE_WORK_FOLDER")
     ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "PNG", "JPG", "JPEG"}
     MAX_CONTENT_LENGTH = 8 * 1000 * 1000
+    # Maximum number of recipes of one POST /recipes/bulk request
+    RECIPE_BULK_LIMIT = int(os.environ.get("RECIPE_BULK_LIMIT") or 1000)
+    # Uploads with more pixels are rejected before they are decoded
+    IMAGE_MAX_MEGAPIXELS = float(os.environ.get("IMAGE_MAX_MEGAPIXELS") or 50)
+    # "sync" processes uploaded images in the request, "async" in worker processes
+    IMAGE_PROCESSING = os.environ.get("IMAGE_PROCESSING") or "sync"
+    IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS") or 2)
+    # Seconds after which an unfinished job is taken as failed, e.g. its worker died
+    IMAGE_PROCESSING_TIMEOUT = int(os.environ.get("IMAGE_PROCESSING_TIMEOUT") or 600)
+    # Widths of the image variants and formats written next to the uploaded one
+    IMAGE_VARIANT_WIDTHS = [
+        int(width) for width in env_list("IMAGE_VARIANT_WIDTHS", "128,400,800,1200")
+    ]
+    IMAGE_EXTRA_FORMATS = env_list("IMAGE_EXTRA_FORMATS", "webp")
+
+    # In-process cache of access tokens, per worker
+    TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE") or 1024)
+    TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL") or 60)
+
+    # "database": random tokens stored with the user
+    # "signed": tokens signed with SECRET_KEY, verified without the database
+    TOKEN_MODE = os.environ.get("TOKEN_MODE") or "database"
+    # Seconds between reloads of the signed token revocations, per worker
+    TOKEN_REVOCATION_REFRESH = int(os.environ.get("TOKEN_REVOCATION_REFRESH") or 10)
+    # Seconds user group members are cached for visibility checks, per worker.
+    # Bounds how long a user removed from a group through another worker still
+    # sees it, whatever the token caches hold. 0 disables the cache.
+    GROUP_MEMBERS_TTL = int(os.environ.get("GROUP_MEMBERS_TTL") or 10)
+
+    # "orjson" or "stdlib" JSON encoding, "auto" takes orjson if installed
+    JSON_BACKEND = os.environ.get("JSON_BACKEND") or "auto"
 
 
 class TestConfig(Config):
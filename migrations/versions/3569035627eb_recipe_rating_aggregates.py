@@ -0,0 +1,45 @@
+"""recipe rating aggregates
+
+Stores the count and sum of the ratings of every recipe on the recipe,
+computed from the existing ratings.
+
+Revision ID: 3569035627eb
+Revises: bf3493c3740f
+Create Date: 2026-10-18 16:02:11.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3569035627eb'
+down_revision = 'bf3493c3740f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the server default fills the existing rows, it is dropped again below
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'))
+
+    # same as flask rebuild_ratings
+    op.execute(
+        "UPDATE recipe SET "
+        "rating_count = (SELECT count(*) FROM rating "
+        "WHERE rating.recipe_id = recipe.id), "
+        "rating_sum = (SELECT coalesce(sum(rating.rating), 0) FROM rating "
+        "WHERE rating.recipe_id = recipe.id)"
+    )
+
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.alter_column('rating_count', server_default=None)
+        batch_op.alter_column('rating_sum', server_default=None)
+
+
+def downgrade():
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
@@ -0,0 +1,65 @@
+"""recipe full text search index
+
+Creates the recipe_search table of app.search and indexes the existing
+recipes, like flask rebuild_search_index does.
+
+Revision ID: 5e8fe59efa99
+Revises: 83cbdddd9a11
+Create Date: 2026-10-18 16:07:52.114390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8fe59efa99'
+down_revision = '83cbdddd9a11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect_name = op.get_bind().dialect.name
+
+    if dialect_name == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search "
+            "USING fts5(title, tags, book, tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "INSERT INTO recipe_search (rowid, title, tags, book) "
+            "SELECT recipe.id, recipe.title, "
+            "(SELECT group_concat(tag.tag_name, ' ') FROM recipe_tags "
+            "JOIN tag ON tag.id = recipe_tags.tag_id "
+            "WHERE recipe_tags.recipe_id = recipe.id), "
+            "book.title "
+            "FROM recipe JOIN book ON recipe.book_id = book.id"
+        )
+    elif dialect_name == 'postgresql':
+        op.execute(
+            "CREATE TABLE IF NOT EXISTS recipe_search ("
+            "recipe_id INTEGER PRIMARY KEY REFERENCES recipe (id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        )
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_recipe_search_document "
+            "ON recipe_search USING GIN (document)"
+        )
+        op.execute(
+            "INSERT INTO recipe_search (recipe_id, document) "
+            "SELECT recipe.id, "
+            "setweight(to_tsvector('simple'::regconfig, "
+            "coalesce(recipe.title, '')), 'A') || "
+            "setweight(to_tsvector('simple'::regconfig, "
+            "coalesce((SELECT string_agg(tag.tag_name, ' ') FROM recipe_tags "
+            "JOIN tag ON tag.id = recipe_tags.tag_id "
+            "WHERE recipe_tags.recipe_id = recipe.id), '')), 'B') || "
+            "setweight(to_tsvector('simple'::regconfig, "
+            "coalesce(book.title, '')), 'C') "
+            "FROM recipe JOIN book ON recipe.book_id = book.id"
+        )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS recipe_search")
@@ -0,0 +1,30 @@
+"""recipe image status
+
+image_status is "processing" while an uploaded image is processed and
+"failed" if that failed. The images of existing recipes were processed on
+upload, they get the status of a processed image, NULL.
+
+Revision ID: f67f2c8d3e6b
+Revises: c37819449e14
+Create Date: 2026-10-18 16:13:05.684422
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f67f2c8d3e6b'
+down_revision = 'c37819449e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_status', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('recipe', schema=None) as batch_op:
+        batch_op.drop_column('image_status')
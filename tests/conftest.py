@@ -1,10 +1,13 @@
+import io
 import pytest
 from os import getenv
+from PIL import Image
 from app import create_app
 from config import TestConfig
 from tests.auth_actions import AuthActions
 from tests.book_fixtures import BookFixtures
 from tests.recipe_fixtures import RecipeFixtures
+from tests.query_counter import QueryCounter
 from app.extensions import db
 from app.models.role import Role
 from app.models.user import User
@@ -17,8 +20,9 @@ def basic_app():
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     app = create_app(TestConfig)
+    app.config["UPLOAD_FOLDER"] = str(tmp_path / "images")
 
     with app.app_context():
         db.create_all()
@@ -111,3 +115,21 @@ def books(app):
 @pytest.fixture
 def recipes(app):
     return RecipeFixtures(app)
+
+
+@pytest.fixture
+def query_counter(app):
+    with app.app_context():
+        engine = db.engine
+    return QueryCounter(engine)
+
+
+@pytest.fixture
+def jpeg():
+    def make_jpeg(size=(1600, 1200)):
+        data = io.BytesIO()
+        Image.new("RGB", size, (200, 100, 50)).save(data, "JPEG")
+        data.seek(0)
+        return data
+
+    return make_jpeg
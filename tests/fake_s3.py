@@ -0,0 +1,71 @@
+import io
+import shutil
+from datetime import datetime, timezone
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """In memory stand-in for the boto3 S3 client methods used by S3Storage
+    usage: S3Storage("bucket", client=FakeS3Client())
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+
+    def upload_fileobj(self, stream, bucket, key, ExtraArgs=None):
+        data = io.BytesIO()
+        shutil.copyfileobj(stream, data)
+        self.objects[(bucket, key)] = (data.getvalue(), ExtraArgs or {})
+        self.modified[(bucket, key)] = datetime.now(timezone.utc)
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        with open(path, "rb") as f:
+            self.upload_fileobj(f, bucket, key, ExtraArgs)
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("404")
+        return {"ContentLength": len(self.objects[(Bucket, Key)][0])}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("NoSuchKey")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        assert len(Delete["Objects"]) <= 1000
+        for item in Delete["Objects"]:
+            self.delete_object(Bucket, item["Key"])
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix=""):
+        keys = sorted(
+            key
+            for bucket, key in self.objects
+            if bucket == Bucket and key.startswith(Prefix)
+        )
+        # small pages to exercise pagination
+        for start in range(0, len(keys), 2):
+            yield {
+                "Contents": [
+                    {"Key": key, "LastModified": self.modified[(Bucket, key)]}
+                    for key in keys[start : start + 2]
+                ]
+            }
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return "https://s3.example.com/{}/{}?signature=fake&expires={}".format(
+            Params["Bucket"], Params["Key"], ExpiresIn
+        )
@@ -0,0 +1,22 @@
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Counts the SQL statements executed on an engine
+    usage: with QueryCounter(engine) as counter: ...; counter.count
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self.count = 0
+
+    def _count_statement(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self._engine, "before_cursor_execute", self._count_statement)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self._engine, "before_cursor_execute", self._count_statement)
@@ -1,5 +1,13 @@
+import re
+from datetime import datetime
 from app.extensions import db
-from app.models.book import Book
+from app.models.book import Book, Cookbook, Magazine
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.queries.book import get_user_books_query
+from app.queries.explain import explain_query
+from app.queries.pagination import encode_cursor, paginate_query
+from app.visibility import get_visible_owner_ids
 
 BOOK_ENDPOINT = "/api/1/books"
 BOOK_ENDPOINT_WITH_ID = "{}/{}".format(BOOK_ENDPOINT, "{}")
@@ -24,6 +32,67 @@ def test_get_all_books(books, auth, client):
         assert b["_links"]["user"][-1] == str(books.user_1["id"])
 
 
+def test_get_all_books_paginated(books, auth, client):
+    auth.login()
+
+    response = client.get(
+        BOOK_ENDPOINT, headers=auth.token_auth_header, query_string={"limit": 1}
+    )
+
+    assert response.status_code == 200
+    assert len(response.json) == 1
+    assert response.json[0]["id"] == books.book_1["id"]
+    next_url = re.match(r'<(.+)>; rel="next"', response.headers["Link"]).group(1)
+
+    response = client.get(next_url, headers=auth.token_auth_header)
+
+    assert response.status_code == 200
+    assert len(response.json) == 1
+    assert response.json[0]["id"] == books.book_2["id"]
+    assert "Link" not in response.headers
+
+
+def test_get_all_books_paginated_query_plans(app):
+    cursor = encode_cursor(Book(id=3, created_at=datetime(2024, 1, 2)))
+
+    with app.test_request_context():
+        for username in ["user_1", "user_5"]:
+            user = db.session.execute(
+                db.select(User).filter_by(username=username)
+            ).scalar_one()
+            owner_ids = get_visible_owner_ids(user)
+            for page_cursor in [None, cursor]:
+                query = paginate_query(
+                    get_user_books_query(user), Book, 10, page_cursor, owner_ids
+                )
+                plan = explain_query(db.session, query)
+                reads = [line for line in plan if line.split()[1:2] == ["book"]]
+
+                # books are read in page order from the owner index, by id for
+                # the page of a group
+                assert reads, plan
+                for line in reads:
+                    assert (
+                        "ix_book_user_id_created_at_id" in line
+                        or "INTEGER PRIMARY KEY" in line
+                    ), plan
+                if len(owner_ids) == 1:
+                    assert not any("TEMP B-TREE" in line for line in plan), plan
+
+
+def test_get_all_books_streamed(books, recipes, auth, client):
+    auth.login()
+
+    response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+    streamed_response = client.get(
+        BOOK_ENDPOINT, headers=auth.token_auth_header, query_string={"stream": "1"}
+    )
+
+    assert streamed_response.status_code == 200
+    assert streamed_response.is_streamed
+    assert streamed_response.json == response.json
+
+
 def test_get_book(books, auth, client):
     auth.login()
 
@@ -285,3 +354,51 @@ def test_delete_book_of_another_user(books, auth, app, client):
         )
 
         assert db_res is not None
+
+
+def test_get_all_books_sparse_fields(books, recipes, auth, client):
+    auth.login()
+
+    response = client.get(
+        BOOK_ENDPOINT,
+        headers=auth.token_auth_header,
+        query_string={"fields": "title,id"},
+    )
+
+    assert response.status_code == 200
+    assert [list(b) for b in response.json] == [["id", "title"], ["id", "title"]]
+
+    response = client.get(
+        BOOK_ENDPOINT, headers=auth.token_auth_header, query_string={"fields": "x"}
+    )
+
+    assert response.status_code == 400
+
+
+def test_get_all_books_two_queries(app, books, recipes, auth, client, query_counter):
+    auth.login()
+    # warm up the token cache
+    client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+
+    with app.app_context():
+        user = db.session.execute(
+            db.select(User).filter_by(username="user_1")
+        ).scalar_one()
+        for i in range(10):
+            book = (Cookbook if i % 2 else Magazine)(title="b {:d}".format(i))
+            user.books.append(book)
+            for j in range(5):
+                recipe = Recipe(title="r {:d}".format(j), user=user)
+                book.recipes.append(recipe)
+        db.session.commit()
+
+    with query_counter:
+        response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+
+    assert response.status_code == 200
+    assert len(response.json) == 12
+    # the books with the columns of all types, the recipe ids of all books
+    assert query_counter.count == 2
+    new_books = sorted(response.json, key=lambda b: b["id"])[2:]
+    assert all(len(b["_links"]["recipes"]) == 5 for b in new_books)
+    assert "author" in new_books[-1] and "issue" in new_books[-2]
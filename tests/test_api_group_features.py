@@ -294,3 +294,80 @@ def test_modify_book_of_group(client, auth):
     assert response.status_code == 200
     assert response.json["title"] == "new_title"
     assert response.json["type"] == "cookbook"
+
+
+def test_new_group_member_sees_group_books(client, auth):
+    """Test that the cached group members are refreshed on membership changes"""
+
+    new_books = _create_shared_books(client, auth)
+    auth.login("user_1", "pass_1")
+    response = client.post(
+        BOOK_ENDPOINT,
+        json={"title": "b_4", "type": "cookbook"},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 201
+    new_books.append(response.json)
+
+    auth.login("user_5", "pass_5")
+    response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+    assert len(response.json) == 3
+
+    response = client.put(
+        "api/1/user_groups/1/users/email",
+        json={"email": "user_1@example.com"},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 200
+
+    book_ids = sorted(book["id"] for book in new_books)
+    response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+    assert sorted(book["id"] for book in response.json) == book_ids
+    auth.login("user_1", "pass_1")
+    response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+    assert sorted(book["id"] for book in response.json) == book_ids
+
+
+def test_removed_group_member_with_cached_token(app, client, auth):
+    """Test that a cached token of a removed member doesn't show the group"""
+
+    from app.extensions import db
+    from app.models.user import User
+
+    app.config["GROUP_MEMBERS_TTL"] = 0
+    new_books = _create_shared_books(client, auth)
+
+    auth.login("user_6", "pass_6")
+    response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+    assert len(response.json) == len(new_books)
+
+    # removed through another worker, the token cache still has the group
+    with app.app_context():
+        db.session.execute(
+            db.update(User).where(User.username == "user_6").values(user_group_id=None)
+        )
+        db.session.commit()
+
+    response = client.get(BOOK_ENDPOINT, headers=auth.token_auth_header)
+    assert response.status_code == 200
+    # only the own book of user_6 is left
+    assert [book["id"] for book in response.json] == [new_books[2]["id"]]
+
+
+def test_visibility_filters_on_owner_ids(app, client, auth, books, recipes):
+    """Test that reads filter on user_id IN (...) without joining user"""
+
+    from app.extensions import db
+    from app.models.user import User
+    from app.queries.recipe import get_user_recipes_query
+    from app.visibility import get_visible_owner_ids
+
+    with app.test_request_context():
+        user = db.session.execute(
+            db.select(User).filter_by(username="user_5")
+        ).scalar_one()
+        assert sorted(get_visible_owner_ids(user)) == [6, 7]
+
+        sql = str(get_user_recipes_query(user))
+        assert "JOIN user" not in sql
+        assert "recipe.user_id IN" in sql
@@ -1,11 +1,14 @@
 import io
+import os
 import re
 
 
 def test_put_image(client, auth, books, recipes, mocker):
     auth.login()
 
-    mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value.format = "JPEG"
+    image = mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value
+    image.format = "JPEG"
+    image.size = (1600, 1200)
     mocker.patch("PIL.Image.Image.save")
     mocker.patch("PIL.Image.Image.thumbnail")
     mocker.patch("PIL.ImageOps.fit")
@@ -27,11 +30,23 @@ def test_put_image(client, auth, books, recipes, mocker):
     assert data["_links"]["thumbnail"] == "/images/1/{}.thumbnail".format(
         data["image"]
     )
+    image_id = data["image"].split(".")[0]
+    assert data["_links"]["images"]["jpg"] == {
+        "128w": "/images/1/{}-128w.jpg".format(image_id),
+        "400w": "/images/1/{}-400w.jpg".format(image_id),
+        "800w": "/images/1/{}-800w.jpg".format(image_id),
+        "1200w": "/images/1/{}".format(data["image"]),
+    }
+    assert data["_links"]["images"]["webp"]["1200w"] == (
+        "/images/1/{}-1200w.webp".format(image_id)
+    )
 
 def test_put_image_invalid_file_extension(client, auth, books, recipes, mocker):
     auth.login()
 
-    mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value.format = "JPEG"
+    image = mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value
+    image.format = "JPEG"
+    image.size = (1600, 1200)
     mocker.patch("PIL.Image.Image.save")
     mocker.patch("PIL.Image.Image.thumbnail")
     mocker.patch("PIL.ImageOps.fit")
@@ -48,7 +63,9 @@ def test_put_image_invalid_file_extension(client, auth, books, recipes, mocker):
 def test_put_image_invalid_image_format(client, auth, books, recipes, mocker):
     auth.login()
 
-    mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value.format = "TIF"
+    image = mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value
+    image.format = "TIF"
+    image.size = (1600, 1200)
     mocker.patch("PIL.Image.Image.save")
     mocker.patch("PIL.Image.Image.thumbnail")
     mocker.patch("PIL.ImageOps.fit")
@@ -74,7 +91,9 @@ def test_put_image_not_authenticated(client, auth, books, recipes, mocker):
 def test_put_image_not_authorized(client, auth, books, recipes, mocker):
     auth.login()
 
-    mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value.format = "JPEG"
+    image = mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value
+    image.format = "JPEG"
+    image.size = (1600, 1200)
     mocker.patch("PIL.Image.Image.save")
     mocker.patch("PIL.Image.Image.thumbnail")
     mocker.patch("PIL.ImageOps.fit")
@@ -92,7 +111,9 @@ def test_put_image_not_authorized(client, auth, books, recipes, mocker):
 def test_put_image_not_found(client, auth, books, recipes, mocker):
     auth.login()
 
-    mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value.format = "JPEG"
+    image = mocker.patch("PIL.Image.open", spec=True).return_value.__enter__.return_value
+    image.format = "JPEG"
+    image.size = (1600, 1200)
     mocker.patch("PIL.Image.Image.save")
     mocker.patch("PIL.Image.Image.thumbnail")
     mocker.patch("PIL.ImageOps.fit")
@@ -153,3 +174,379 @@ def test_delete_image_not_found(client, auth, books, recipes, mocker):
     )
 
     assert response.status_code == 404
+
+
+def test_put_image_async(app, client, auth, books, recipes, tmp_path, jpeg):
+    from app.images import get_image_jobs
+
+    app.config["IMAGE_PROCESSING"] = "async"
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    auth.login()
+
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (jpeg(), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+
+    assert response.status_code == 202
+    assert response.json["image_status"] == "processing"
+    assert response.headers["Location"] == "/api/1/recipes/1"
+
+    # a second upload has to wait for the first one
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (jpeg(), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 409
+
+    with app.app_context():
+        get_image_jobs().wait()
+
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    data = response.json
+    assert data["image_status"] is None
+    assert re.compile(r"[a-z0-9]{32}.jpg").match(data["image"])
+    files = [data["image"], "{}.thumbnail".format(data["image"])]
+    for variants in data["_links"]["images"].values():
+        files += [url.rsplit("/", 1)[1] for url in variants.values()]
+    stored = [path.name for path in tmp_path.rglob("*") if path.is_file()]
+    assert sorted(stored) == sorted(set(files))
+    assert (tmp_path / data["image"][:2] / data["image"][2:4] / data["image"]).exists()
+
+
+def test_put_image_async_failed(app, client, auth, books, recipes, tmp_path, jpeg):
+    from app.images import get_image_jobs
+
+    app.config["IMAGE_PROCESSING"] = "async"
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    auth.login()
+
+    # valid header, truncated image data
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (io.BytesIO(jpeg().read()[:1000]), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 202
+
+    with app.app_context():
+        get_image_jobs().wait()
+
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    assert response.json["image_status"] == "failed"
+    assert response.json["image"] is None
+    assert [path for path in tmp_path.rglob("*") if path.is_file()] == []
+
+
+def test_put_image_async_stale_processing(
+    app, runner, client, auth, books, recipes, tmp_path, jpeg
+):
+    from datetime import datetime, timedelta
+    from app.extensions import db
+    from app.images import get_image_jobs, start_image_processing
+    from app.models.recipe import Recipe
+
+    app.config["IMAGE_PROCESSING"] = "async"
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    auth.login()
+
+    with app.app_context():
+        recipe = db.session.get(Recipe, 1)
+        started_at = start_image_processing(recipe)
+        assert started_at is not None
+        # concurrent uploads, only the first one starts a job
+        assert start_image_processing(recipe) is None
+
+    def put_image():
+        return client.put(
+            "/api/1/recipes/1/image",
+            data={"image": (jpeg(), "test.jpg")},
+            headers=auth.token_auth_header,
+        )
+
+    assert put_image().status_code == 409
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    assert response.json["image_status"] == "processing"
+
+    # the worker died, after the timeout the next upload replaces the job
+    with app.app_context():
+        recipe = db.session.get(Recipe, 1)
+        recipe.image_processing_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+    # read as failed, without flask fail_stale_images
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    assert response.json["image_status"] == "failed"
+    response = client.get("/api/1/recipes", headers=auth.token_auth_header)
+    assert [r["image_status"] for r in response.json if r["id"] == 1] == ["failed"]
+
+    result = runner.invoke(args=["fail_stale_images"])
+    assert "1 stale images failed" in result.output
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    assert response.json["image_status"] == "failed"
+
+    response = put_image()
+    assert response.status_code == 202
+
+    with app.app_context():
+        get_image_jobs().wait()
+
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    assert response.json["image_status"] is None
+    assert response.json["image"]
+
+
+def test_image_job_of_stale_processing_is_dropped(
+    app, client, auth, books, recipes, tmp_path, jpeg
+):
+    from datetime import datetime, timedelta
+    from app.extensions import db
+    from app.images import get_image_jobs, start_image_processing
+    from app.models.recipe import Recipe
+
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    upload = tmp_path / "upload"
+    upload.write_bytes(jpeg().read())
+
+    with app.app_context():
+        recipe = db.session.get(Recipe, 1)
+        started_at = start_image_processing(recipe)
+        # taken as failed and restarted before the first job is done
+        recipe.image_processing_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        assert start_image_processing(recipe) is not None
+
+        filename = "a" * 32 + ".jpg"
+        get_image_jobs().submit(1, str(upload), filename, "JPEG", started_at).result()
+
+        recipe = db.session.get(Recipe, 1)
+        assert recipe.image_status == "processing"
+        assert recipe.image is None
+
+
+def test_process_image_sizes(tmp_path, jpeg):
+    from PIL import Image
+    from app.images import process_image
+
+    filename = str(tmp_path / "image.jpg")
+    variants = process_image(
+        jpeg((4000, 3000)), filename, "JPEG", [1200, 400, 2000], ["webp"]
+    )
+
+    assert variants == {
+        "jpg": {"400": "image-400w.jpg", "1200": "image.jpg"},
+        "webp": {"400": "image-400w.webp", "1200": "image-1200w.webp"},
+    }
+    with Image.open(filename) as image:
+        assert image.size == (1200, 800)
+    with Image.open(filename + ".thumbnail") as image:
+        assert image.format == "JPEG"
+        assert image.size == (128, 85)
+    with Image.open(tmp_path / "image-400w.webp") as image:
+        assert image.format == "WEBP"
+        assert image.size == (400, 267)
+
+
+def test_put_same_image_is_stored_once(app, client, auth, books, recipes, jpeg):
+    auth.login()
+    image = jpeg().read()
+    upload_folder = app.config["UPLOAD_FOLDER"]
+
+    def stored_files():
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(upload_folder)
+            for name in names
+        )
+
+    filenames = []
+    for recipe_id in [1, 2]:
+        response = client.put(
+            "/api/1/recipes/{}/image".format(recipe_id),
+            data={"image": (io.BytesIO(image), "test.jpg")},
+            headers=auth.token_auth_header,
+        )
+        assert response.status_code == 200
+        filenames.append(response.json["image"])
+        if recipe_id == 1:
+            files = stored_files()
+
+    assert filenames[0] == filenames[1]
+    assert stored_files() == files
+
+    # files are kept while another recipe uses them
+    response = client.delete("/api/1/recipes/1/image", headers=auth.token_auth_header)
+    assert response.status_code == 200
+    assert stored_files() == files
+
+    response = client.delete("/api/1/recipes/2", headers=auth.token_auth_header)
+    assert response.status_code == 204
+    assert stored_files() == []
+
+
+def test_put_same_image_while_its_files_are_released(
+    app, client, auth, books, recipes, mocker, jpeg
+):
+    from app.extensions import db
+    from app.images import get_stored_image_variants, release_image_files
+    from app.models.recipe import Recipe
+    from app.storage import get_storage, shard_key
+
+    auth.login()
+    image = jpeg().read()
+    filename = _put_image(client, auth, 1, io.BytesIO(image))
+
+    def release_after_lookup(name):
+        # recipe 1 drops the image after recipe 2 found it stored, before
+        # recipe 2 has the image lock
+        variants = get_stored_image_variants(name)
+        db.session.execute(
+            db.update(Recipe).where(Recipe.id == 1).values(image=None)
+        )
+        db.session.commit()
+        release_image_files(name, variants)
+        assert not get_storage().exists(shard_key(name))
+        return variants
+
+    mocker.patch(
+        "app.api.images.get_stored_image_variants", side_effect=release_after_lookup
+    )
+
+    # the files are gone under the lock, the upload is stored again
+    assert _put_image(client, auth, 2, io.BytesIO(image)) == filename
+    with app.app_context():
+        assert get_storage().exists(shard_key(filename))
+        assert get_storage().exists(shard_key(filename + ".thumbnail"))
+
+
+def test_lock_image_on_other_databases(app, mocker):
+    from sqlalchemy.dialects import mysql
+    from app.images import lock_image
+
+    connection = mocker.Mock()
+    connection.dialect.name = "mysql"
+
+    with app.app_context():
+        lock_image(connection, "ab" * 32)
+
+    statement = connection.execute.call_args.args[0]
+    sql = str(statement.compile(dialect=mysql.dialect()))
+    assert sql.endswith("FOR UPDATE")
+    assert "recipe.image = " in sql
+
+
+def test_delete_book_removes_image_files(app, client, auth, books, recipes, jpeg):
+    auth.login()
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (jpeg(), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 200
+    assert os.listdir(app.config["UPLOAD_FOLDER"])
+
+    response = client.delete("/api/1/books/1", headers=auth.token_auth_header)
+    assert response.status_code == 204
+
+    with app.app_context():
+        from app.storage import get_storage
+
+        assert list(get_storage().iter_files()) == []
+
+
+def _put_image(client, auth, recipe_id, image):
+    response = client.put(
+        "/api/1/recipes/{}/image".format(recipe_id),
+        data={"image": (image, "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 200
+    return response.json["image"]
+
+
+def test_gc_images(app, runner, client, auth, books, recipes, jpeg):
+    from app.storage import get_storage, shard_key
+
+    auth.login()
+    image = _put_image(client, auth, 1, jpeg())
+    missing = _put_image(client, auth, 2, jpeg((800, 600)))
+    with app.app_context():
+        storage = get_storage()
+        stored = [key for key, _ in storage.iter_files()]
+        storage.save(shard_key("0" * 32 + ".jpg"), io.BytesIO(b"orphan"))
+        storage.save(shard_key("f" * 32 + ".jpg"), io.BytesIO(b"orphan"))
+        storage.delete(shard_key(missing))
+
+    result = runner.invoke(args=["gc_images", "--min-age", "0", "--dry-run"])
+    assert "orphan: 00/00/{}.jpg".format("0" * 32) in result.output
+    assert "missing: {0} of image {0}".format(missing) in result.output
+    assert "would delete 2 orphaned files, would unset 1 images" in result.output
+
+    # orphans are kept until they are older than --min-age
+    result = runner.invoke(args=["gc_images"])
+    assert "deleted 0 orphaned files, unset 1 images" in result.output
+
+    response = client.get("/api/1/recipes/2", headers=auth.token_auth_header)
+    assert response.json["image"] is None
+
+    # the remaining files of the unset image are orphans now
+    result = runner.invoke(args=["gc_images", "--min-age", "0", "--batch-size", "1"])
+    assert result.exit_code == 0
+    assert "deleted 10 orphaned files, unset 0 images" in result.output
+
+    with app.app_context():
+        remaining = [key for key, _ in get_storage().iter_files()]
+    assert remaining == [key for key in stored if missing.split(".")[0] not in key]
+    assert shard_key(image) in remaining
+
+    response = client.get("/api/1/recipes/1", headers=auth.token_auth_header)
+    assert response.json["image"] == image
+
+
+def test_put_image_too_many_pixels(app, client, auth, books, recipes, mocker):
+    from PIL import Image
+
+    auth.login()
+    app.config["IMAGE_MAX_MEGAPIXELS"] = 1
+    fit = mocker.patch("PIL.ImageOps.fit")
+    # 4 megapixels, compressed to a few kB
+    data = io.BytesIO()
+    Image.new("L", (2000, 2000)).save(data, "PNG")
+    data.seek(0)
+
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (data, "test.png")},
+        headers=auth.token_auth_header,
+    )
+
+    assert response.status_code == 413
+    assert response.json["message"] == "image has more than 1 megapixels"
+    fit.assert_not_called()
+
+
+def test_put_image_decompression_bomb(app, client, auth, books, recipes, mocker, jpeg):
+    auth.login()
+    mocker.patch("PIL.Image.MAX_IMAGE_PIXELS", 100 * 100)
+
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (jpeg(), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+
+    assert response.status_code == 413
+
+
+def test_put_image_not_an_image(client, auth, books, recipes):
+    auth.login()
+
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (io.BytesIO(b"GIF89a" + bytes(100)), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+
+    assert response.status_code == 400
@@ -1,3 +1,24 @@
+import itertools
+import random
+import re
+from datetime import datetime
+from sqlalchemy import event, text
+from app.extensions import db
+from app.models.recipe import Recipe
+from app.models.tag import Tag, resolve_tags
+from app.models.user import User
+from app.queries.explain import explain_query
+from app.queries.pagination import encode_cursor, paginate_query
+from app.queries.recipe import (
+    filter_recipes_query,
+    get_owner_recipe_ids_query,
+    get_user_recipe_counts_query,
+    get_user_recipe_rows_query,
+    get_user_recipes_query,
+)
+from app.api.recipes import _sample_recipe_ids
+from app.visibility import get_visible_owner_ids
+
 new_recipe_dict = {
     "title": "New Title",
     "page": 250,
@@ -174,6 +195,22 @@ def test_create_recipe_with_existing_tag(auth, client, books, recipes):
     assert res_data["tags"][0]["tag_name"] == recipes.recipe_1["tags"][0]["tag_name"]
 
 
+def test_create_recipe_with_unknown_tag_id(auth, client, books, recipes):
+    auth.login()
+    test_data = {k: new_recipe_dict[k] for k in ["title", "page", "book_id"]}
+    test_data["tags"] = [{"tag_name": "not created"}, {"id": 9999}]
+    response = client.post(
+        RECIPE_ENDPOINT, json=test_data, headers=auth.token_auth_header
+    )
+
+    assert response.status_code == 400
+    assert response.json["message"] == "unknown tag id"
+    with client.application.app_context():
+        assert db.session.scalar(
+            db.select(Tag).where(Tag.tag_name == "not created")
+        ) is None
+
+
 def test_create_recipe_with_invalid_tag_data(auth, client, books, recipes):
     auth.login()
     test_data = {k: new_recipe_dict[k] for k in ["title", "page", "book_id"]}
@@ -336,6 +373,29 @@ def test_update_recipe_with_tags(client, auth, books, recipes):
     ]
 
 
+def test_update_recipe_with_unknown_tag_id(client, auth, books, recipes):
+    auth.login()
+
+    response = client.put(
+        RECIPE_ENDPOINT_WITH_ID.format(recipes.recipe_1["id"]),
+        headers=auth.token_auth_header,
+        json={
+            "title": "Unchanged",
+            "book_id": books.book_1["id"],
+            "tags": [{"id": 9999}],
+        },
+    )
+
+    assert response.status_code == 400
+    assert response.json["message"] == "unknown tag id"
+    response = client.get(
+        RECIPE_ENDPOINT_WITH_ID.format(recipes.recipe_1["id"]),
+        headers=auth.token_auth_header,
+    )
+    assert response.json["title"] == recipes.recipe_1["title"]
+    assert len(response.json["tags"]) == len(recipes.recipe_1["tags"])
+
+
 def test_update_recipe_with_invalid_rating(client, auth, books, recipes):
     auth.login()
 
@@ -500,3 +560,813 @@ def test_recipe_search_random_invalid_limit(client, auth):
     )
 
     assert response.status_code == 400
+
+
+def test_get_all_recipes_with_ratings(client, auth, books, recipes):
+    auth.login()
+
+    client.put(
+        RECIPE_RATING.format(recipes.recipe_2["id"]),
+        headers=auth.token_auth_header,
+        query_string={"rating": 4},
+    )
+
+    response = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+
+    assert response.status_code == 200
+    ratings = {r["id"]: r["rating"] for r in response.json}
+    assert ratings[recipes.recipe_1["id"]] == 0
+    assert ratings[recipes.recipe_2["id"]] == 4
+
+
+def test_recipe_rating_aggregates(app, client, auth, books, recipes):
+    auth.login()
+
+    client.put(
+        RECIPE_RATING.format(recipes.recipe_1["id"]),
+        headers=auth.token_auth_header,
+        query_string={"rating": 2},
+    )
+    auth.login("user_2", "pass_2")
+    client.put(
+        RECIPE_RATING.format(recipes.recipe_4["id"]),
+        headers=auth.token_auth_header,
+        query_string={"rating": 5},
+    )
+    auth.login()
+    response = client.put(
+        RECIPE_RATING.format(recipes.recipe_1["id"]),
+        headers=auth.token_auth_header,
+        query_string={"rating": 4},
+    )
+    assert response.json["rating"] == 4
+
+    with app.app_context():
+        recipe = db.session.get(Recipe, recipes.recipe_1["id"])
+        assert recipe.rating_count == 1
+        assert recipe.rating_sum == 4
+
+
+def test_rebuild_ratings_command(app, runner, client, auth, books, recipes):
+    auth.login()
+
+    client.put(
+        RECIPE_RATING.format(recipes.recipe_1["id"]),
+        headers=auth.token_auth_header,
+        query_string={"rating": 3},
+    )
+
+    with app.app_context():
+        db.session.execute(db.update(Recipe).values(rating_count=7, rating_sum=9))
+        db.session.commit()
+
+    result = runner.invoke(args=["rebuild_ratings"])
+    assert result.exit_code == 0
+
+    with app.app_context():
+        recipe_1 = db.session.get(Recipe, recipes.recipe_1["id"])
+        recipe_2 = db.session.get(Recipe, recipes.recipe_2["id"])
+        assert (recipe_1.rating_count, recipe_1.rating_sum) == (1, 3)
+        assert (recipe_2.rating_count, recipe_2.rating_sum) == (0, 0)
+
+
+def test_get_all_recipes_constant_query_count(
+    app, client, auth, books, recipes, query_counter
+):
+    auth.login()
+    # warm up the token cache
+    client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+
+    with query_counter:
+        response = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+    assert response.status_code == 200
+    queries_for_few_recipes = query_counter.count
+
+    # add many more recipes with tags
+    with app.app_context():
+        user = db.session.execute(
+            db.select(User).filter_by(username="user_1")
+        ).scalar_one()
+        for i in range(50):
+            recipe = Recipe(title="bulk {:d}".format(i), book_id=books.book_1["id"])
+            recipe.user = user
+            recipe.tags = [Tag(tag_name="bulk_tag_{:d}".format(i))]
+            db.session.add(recipe)
+        db.session.commit()
+
+    with query_counter:
+        response = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+    assert response.status_code == 200
+    assert len(response.json) == 55
+    assert query_counter.count == queries_for_few_recipes
+
+
+def test_get_all_recipes_paginated(client, auth, books, recipes):
+    auth.login()
+
+    recipe_ids = []
+    url = RECIPE_ENDPOINT
+    query_string = {"limit": 2}
+    for _ in range(3):
+        response = client.get(
+            url, headers=auth.token_auth_header, query_string=query_string
+        )
+        assert response.status_code == 200
+        assert len(response.json) <= 2
+        recipe_ids += [r["id"] for r in response.json]
+
+        link = response.headers.get("Link")
+        if not link:
+            break
+        url = re.match(r'<(.+)>; rel="next"', link).group(1)
+        query_string = None
+
+    assert not link
+    assert len(recipe_ids) == 5
+    assert len(set(recipe_ids)) == 5
+
+
+def test_get_all_recipes_paginated_in_group(app, client, auth, books):
+    with app.app_context():
+        user_5, user_6 = db.session.execute(
+            db.select(User).where(User.username.in_(["user_5", "user_6"]))
+        ).scalars()
+        # interleaved recipes of the two users of a group, some created at once
+        for i in range(13):
+            recipe = Recipe(title="r {:d}".format(i), book_id=books.book_1["id"])
+            recipe.user = user_5 if i % 3 else user_6
+            recipe.created_at = datetime(2024, 1, 1 + i // 2)
+            db.session.add(recipe)
+        db.session.commit()
+
+    auth.login("user_5", "pass_5")
+    response = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+    all_ids = [r["id"] for r in response.json]
+    assert len(all_ids) == 13
+
+    recipe_ids = []
+    url = RECIPE_ENDPOINT
+    query_string = {"limit": 4}
+    while url:
+        response = client.get(
+            url, headers=auth.token_auth_header, query_string=query_string
+        )
+        assert response.status_code == 200
+        recipe_ids += [r["id"] for r in response.json]
+        link = response.headers.get("Link")
+        url = link and re.match(r'<(.+)>; rel="next"', link).group(1)
+        query_string = None
+
+    # created in (created_at, id) order
+    assert recipe_ids == sorted(all_ids)
+
+
+def test_get_all_recipes_paginated_query_plans(app):
+    cursor = encode_cursor(Recipe(id=3, created_at=datetime(2024, 1, 2)))
+
+    with app.test_request_context():
+        for username in ["user_1", "user_5"]:
+            user = db.session.execute(
+                db.select(User).filter_by(username=username)
+            ).scalar_one()
+            owner_ids = get_visible_owner_ids(user)
+            for page_cursor in [None, cursor]:
+                query = paginate_query(
+                    get_user_recipe_rows_query(user), Recipe, 10, page_cursor, owner_ids
+                )
+                plan = explain_query(db.session, query)
+                reads = [line for line in plan if line.split()[1:2] == ["recipe"]]
+
+                # recipes are read in page order from the owner index, by id
+                # for the page of a group
+                assert reads, plan
+                for line in reads:
+                    assert (
+                        "ix_recipe_user_id_created_at_id" in line
+                        or "INTEGER PRIMARY KEY" in line
+                    ), plan
+                if len(owner_ids) == 1:
+                    assert not any("TEMP B-TREE" in line for line in plan), plan
+
+
+def test_get_all_recipes_invalid_cursor(client, auth, books, recipes):
+    auth.login()
+
+    response = client.get(
+        RECIPE_ENDPOINT,
+        headers=auth.token_auth_header,
+        query_string={"limit": 2, "cursor": "not-a-cursor"},
+    )
+
+    assert response.status_code == 400
+
+
+def test_get_all_recipes_streamed(client, auth, books, recipes):
+    auth.login()
+
+    response = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+    streamed_response = client.get(
+        RECIPE_ENDPOINT,
+        headers=auth.token_auth_header,
+        query_string={"stream": "true"},
+    )
+
+    assert streamed_response.status_code == 200
+    assert streamed_response.is_streamed
+    assert streamed_response.mimetype == "application/json"
+    assert streamed_response.json == response.json
+
+
+def test_get_all_recipes_match_single_recipes(client, auth, books, recipes):
+    auth.login()
+
+    response = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+
+    assert response.status_code == 200
+    for r in response.json:
+        single = client.get(r["_links"]["self"], headers=auth.token_auth_header)
+        assert r == single.json
+
+
+def test_get_all_recipes_sparse_fields(
+    client, auth, books, recipes, query_counter
+):
+    auth.login()
+    client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header)
+
+    with query_counter:
+        response = client.get(
+            RECIPE_ENDPOINT,
+            headers=auth.token_auth_header,
+            query_string={"fields": "id,title"},
+        )
+    assert response.status_code == 200
+    assert len(response.json) == 5
+    assert all(list(r) == ["id", "title"] for r in response.json)
+    # no tags query
+    queries_without_tags = query_counter.count
+
+    with query_counter:
+        response = client.get(
+            RECIPE_ENDPOINT,
+            headers=auth.token_auth_header,
+            query_string={"fields": "tags,id"},
+        )
+    assert all(list(r) == ["id", "tags"] for r in response.json)
+    assert query_counter.count == queries_without_tags + 1
+
+    response = client.get(
+        RECIPE_ENDPOINT,
+        headers=auth.token_auth_header,
+        query_string={"fields": "id", "limit": 2},
+    )
+    next_url = re.match(r'<(.+)>; rel="next"', response.headers["Link"]).group(1)
+    response = client.get(next_url, headers=auth.token_auth_header)
+    assert all(list(r) == ["id"] for r in response.json)
+
+
+def test_recipe_lists_reject_unknown_fields(client, auth, books, recipes):
+    auth.login()
+
+    for url, query_string in [
+        (RECIPE_ENDPOINT, {}),
+        (RECIPE_SEARCH, {}),
+        (RECIPE_SEARCH_RANDOM, {"limit": 2}),
+    ]:
+        response = client.get(
+            url,
+            headers=auth.token_auth_header,
+            query_string={**query_string, "fields": "id,rating_sum"},
+        )
+        assert response.status_code == 400
+        assert response.json["message"] == "unknown field rating_sum"
+
+
+def test_search_recipe_by_prefix_tag_and_book(client, auth, books, recipes):
+    auth.login()
+
+    def search(term):
+        response = client.get(
+            RECIPE_SEARCH, headers=auth.token_auth_header, query_string={"q": term}
+        )
+        assert response.status_code == 200
+        return [r["id"] for r in response.json]
+
+    assert search("rez") == search("rezept")
+    assert search("tag3") == [recipes.recipe_2["id"]]
+    assert search("b_2") == [
+        recipes.recipe_3["id"],
+        recipes.recipe_3_1["id"],
+        recipes.recipe_3_2["id"],
+    ]
+    assert search("rezept titel") == [recipes.recipe_3_1["id"]]
+    assert search("!!!") == []
+
+
+def test_search_recipe_ranked(client, auth, books, recipes):
+    auth.login()
+
+    # title matches rank before tag matches
+    client.post(
+        RECIPE_ENDPOINT,
+        json={
+            "title": "Pasta",
+            "book_id": books.book_1["id"],
+            "tags": [{"tag_name": "zucchini"}],
+        },
+        headers=auth.token_auth_header,
+    )
+    client.post(
+        RECIPE_ENDPOINT,
+        json={"title": "Zucchini Soup", "book_id": books.book_1["id"]},
+        headers=auth.token_auth_header,
+    )
+
+    response = client.get(
+        RECIPE_SEARCH, headers=auth.token_auth_header, query_string={"q": "zucchini"}
+    )
+
+    assert [r["title"] for r in response.json] == ["Zucchini Soup", "Pasta"]
+
+
+def test_search_index_follows_updates_and_deletes(client, auth, books, recipes):
+    auth.login()
+
+    def search(term):
+        response = client.get(
+            RECIPE_SEARCH, headers=auth.token_auth_header, query_string={"q": term}
+        )
+        return [r["id"] for r in response.json]
+
+    client.put(
+        RECIPE_ENDPOINT_WITH_ID.format(recipes.recipe_1["id"]),
+        json={"title": "Lasagne", "book_id": books.book_1["id"]},
+        headers=auth.token_auth_header,
+    )
+    assert search("lasagne") == [recipes.recipe_1["id"]]
+    assert recipes.recipe_1["id"] not in search("title")
+
+    client.put(
+        "api/1/books/{}".format(books.book_1["id"]),
+        json={"title": "Italian Classics", "type": "cookbook"},
+        headers=auth.token_auth_header,
+    )
+    assert search("italian") == [recipes.recipe_1["id"], recipes.recipe_2["id"]]
+
+    client.delete(
+        RECIPE_ENDPOINT_WITH_ID.format(recipes.recipe_1["id"]),
+        headers=auth.token_auth_header,
+    )
+    assert search("lasagne") == []
+
+
+def test_rebuild_search_index_command(app, runner, client, auth, books, recipes):
+    auth.login()
+
+    with app.app_context():
+        db.session.execute(db.text("DELETE FROM recipe_search"))
+        db.session.commit()
+
+    result = runner.invoke(args=["rebuild_search_index"])
+    assert result.exit_code == 0
+
+    response = client.get(
+        RECIPE_SEARCH, headers=auth.token_auth_header, query_string={"q": "rezept"}
+    )
+    assert len(response.json) == 2
+
+
+SEARCH_FILTER_NAMES = ["q", "book", "tags", "min_rating", "has_image", "created_after"]
+INDEXED_FILTER_NAMES = ["q", "book", "created_after"]
+
+
+def all_filter_combinations():
+    for n in range(len(SEARCH_FILTER_NAMES) + 1):
+        yield from itertools.combinations(SEARCH_FILTER_NAMES, n)
+
+
+def test_search_recipes_combined_filters(app, client, auth, books, recipes):
+    auth.login()
+    r_1, r_2, r_3, r_3_1, r_3_2 = [
+        recipes.recipe_1,
+        recipes.recipe_2,
+        recipes.recipe_3,
+        recipes.recipe_3_1,
+        recipes.recipe_3_2,
+    ]
+    tag_1 = r_1["tags"][0]
+
+    # recipe_2 gets tag_1 as well
+    client.put(
+        RECIPE_ENDPOINT_WITH_ID.format(r_2["id"]),
+        json={"title": r_2["title"], "book_id": books.book_1["id"], "tags": [tag_1]},
+        headers=auth.token_auth_header,
+    )
+    for recipe, rating in [(r_1, 4), (r_2, 2), (r_3, 5)]:
+        client.put(
+            RECIPE_RATING.format(recipe["id"]),
+            headers=auth.token_auth_header,
+            query_string={"rating": rating},
+        )
+    created_at = {}
+    with app.app_context():
+        for day, r in enumerate([r_1, r_2, r_3, r_3_1, r_3_2], start=1):
+            recipe = db.session.get(Recipe, r["id"])
+            recipe.created_at = datetime(2024, 1, day, 12)
+            recipe.image = "{:032x}.jpg".format(day) if r in [r_1, r_3] else None
+            created_at[r["id"]] = recipe.created_at
+        db.session.commit()
+
+    all_recipes = client.get(RECIPE_ENDPOINT, headers=auth.token_auth_header).json
+    filter_values = {
+        "q": "title",
+        "book": str(books.book_1["id"]),
+        "tags": str(tag_1["id"]),
+        "min_rating": "3",
+        "has_image": "true",
+        "created_after": "2024-01-02",
+    }
+    predicates = {
+        "q": lambda r: "title" in r["title"].lower().split(),
+        "book": lambda r: r["_links"]["book"].endswith("/" + filter_values["book"]),
+        "tags": lambda r: tag_1["id"] in [t["id"] for t in r["tags"]],
+        "min_rating": lambda r: r["rating"] >= 3,
+        "has_image": lambda r: r["image"] is not None,
+        "created_after": lambda r: created_at[r["id"]] > datetime(2024, 1, 2),
+    }
+
+    for names in all_filter_combinations():
+        response = client.get(
+            RECIPE_SEARCH,
+            headers=auth.token_auth_header,
+            query_string={name: filter_values[name] for name in names},
+        )
+        assert response.status_code == 200, names
+
+        expected = [
+            r["id"] for r in all_recipes if all(predicates[n](r) for n in names)
+        ]
+        assert sorted(r["id"] for r in response.json) == sorted(expected), names
+
+
+def test_search_recipes_filter_query_plans(app):
+    filter_values = {
+        "q": "title",
+        "book": 1,
+        "tags": [1, 2],
+        "min_rating": 3,
+        "has_image": True,
+        "created_after": datetime(2024, 1, 2),
+    }
+
+    with app.app_context():
+        user = db.session.get(User, 2)
+
+        for names in all_filter_combinations():
+            query = filter_recipes_query(
+                get_user_recipes_query(user),
+                {name: filter_values[name] for name in names},
+                "sqlite",
+            )
+            plan = explain_query(db.session, query)
+            scanned = [line.split()[1] for line in plan if line.startswith("SCAN")]
+
+            # tags and users are always looked up by index
+            assert "recipe_tags" not in scanned, (names, plan)
+            assert "user" not in scanned, (names, plan)
+            # an indexed filter drives the query instead of a recipe table scan
+            if set(names) & set(INDEXED_FILTER_NAMES):
+                assert "recipe" not in scanned, (names, plan)
+            # only search results need sorting
+            if "q" not in names:
+                assert not any("TEMP B-TREE" in line for line in plan), (names, plan)
+
+
+def test_search_recipes_invalid_filter(client, auth, books, recipes):
+    auth.login()
+
+    for name, value in [
+        ("book", "abc"),
+        ("tags", "1,x"),
+        ("min_rating", "6"),
+        ("has_image", "maybe"),
+        ("created_after", "yesterday"),
+    ]:
+        response = client.get(
+            RECIPE_SEARCH, headers=auth.token_auth_header, query_string={name: value}
+        )
+        assert response.status_code == 400
+        assert name in response.json["message"]
+
+
+def test_recipe_search_random_with_seed(client, auth, books, recipes):
+    auth.login()
+
+    def random_recipes(seed):
+        response = client.get(
+            RECIPE_SEARCH_RANDOM,
+            headers=auth.token_auth_header,
+            query_string={"limit": 3, "seed": seed},
+        )
+        assert response.status_code == 200
+        return [r["id"] for r in response.json]
+
+    assert random_recipes(42) == random_recipes(42)
+    assert len(set(random_recipes(42))) == 3
+    assert any(random_recipes(42) != random_recipes(seed) for seed in range(10))
+
+
+def test_recipe_search_random_limit_above_count(client, auth, books, recipes):
+    auth.login()
+
+    response = client.get(
+        RECIPE_SEARCH_RANDOM,
+        headers=auth.token_auth_header,
+        query_string={"limit": 50},
+    )
+
+    assert response.status_code == 200
+    # only the 5 own recipes, each once
+    assert sorted(r["id"] for r in response.json) == sorted(
+        r["id"]
+        for r in [
+            recipes.recipe_1,
+            recipes.recipe_2,
+            recipes.recipe_3,
+            recipes.recipe_3_1,
+            recipes.recipe_3_2,
+        ]
+    )
+
+
+def test_recipe_search_random_invalid_seed(client, auth):
+    auth.login()
+
+    response = client.get(
+        RECIPE_SEARCH_RANDOM,
+        headers=auth.token_auth_header,
+        query_string={"limit": 2, "seed": "abc"},
+    )
+
+    assert response.status_code == 400
+
+
+def test_sample_recipe_ids_of_interleaved_owners(app, books, recipes):
+    with app.app_context():
+        user_5 = db.session.execute(
+            db.select(User).filter_by(username="user_5")
+        ).scalar_one()
+        user_6 = db.session.execute(
+            db.select(User).filter_by(username="user_6")
+        ).scalar_one()
+        # interleaved recipes of the two users of a group
+        for i in range(200):
+            recipe = Recipe(title="probe {:d}".format(i), book_id=books.book_1["id"])
+            recipe.user = user_5 if i % 2 else user_6
+            db.session.add(recipe)
+        db.session.commit()
+
+        sample = _sample_recipe_ids(user_5, 10, random.Random(7))
+        visible_ids = [
+            recipe.id
+            for recipe in db.session.execute(get_user_recipes_query(user_5)).scalars()
+        ]
+
+        assert len(set(sample)) == 10
+        assert set(sample) <= set(visible_ids)
+        assert sample == _sample_recipe_ids(user_5, 10, random.Random(7))
+
+        # uniform: every visible recipe is drawn about equally often
+        rng = random.Random(11)
+        counts = dict.fromkeys(visible_ids, 0)
+        runs = 20 * len(visible_ids)
+        for _ in range(runs):
+            for recipe_id in _sample_recipe_ids(user_5, 5, rng):
+                counts[recipe_id] += 1
+        expected = runs * 5 / len(visible_ids)
+        assert min(counts.values()) > expected * 0.5
+        assert max(counts.values()) < expected * 1.5
+
+
+def test_sample_recipe_ids_query_plans(app, books, recipes):
+    with app.app_context():
+        user_5 = db.session.execute(
+            db.select(User).filter_by(username="user_5")
+        ).scalar_one()
+        # user_5 shares with user_6
+        assert len(get_visible_owner_ids(user_5)) == 2
+
+        for query in [
+            get_user_recipe_counts_query(user_5),
+            get_owner_recipe_ids_query(user_5.id)
+            .where(Recipe.id > 1)
+            .offset(1)
+            .limit(1),
+        ]:
+            plan = explain_query(db.session, query)
+            # the recipes of a group are not sorted once per sampled position,
+            # either index led by user_id gives the order
+            assert not any("TEMP B-TREE" in line for line in plan), plan
+            assert any("INDEX ix_recipe_user_id_" in line for line in plan), plan
+
+
+RECIPE_BULK = "{}/bulk".format(RECIPE_ENDPOINT)
+
+
+def test_create_recipes_bulk(app, auth, client, books, recipes):
+    auth.login()
+    existing_tag = recipes.recipe_1["tags"][0]
+    items = [
+        {
+            "title": "Bulk 1",
+            "page": 1,
+            "book_id": books.book_1["id"],
+            "rating": 4,
+            "tags": [{"id": existing_tag["id"]}, {"tag_name": "bulk"}],
+        },
+        {"title": "", "book_id": books.book_1["id"]},
+        {"title": "Bulk 2", "book_id": books.book_3["id"]},
+        {"title": "Bulk 3", "book_id": books.book_2["id"], "rating": 9},
+        {
+            "title": "Bulk 4",
+            "book_id": books.book_2["id"],
+            "tags": [{"tag_name": "rejected"}, {"id": 9999}],
+        },
+        {
+            "title": "Bulk 5",
+            "book_id": books.book_2["id"],
+            "tags": [{"tag_name": "bulk"}, {"tag_name": existing_tag["tag_name"]}],
+        },
+    ]
+
+    response = client.post(RECIPE_BULK, json=items, headers=auth.token_auth_header)
+
+    assert response.status_code == 200
+    results = response.json
+    assert [r["status"] for r in results] == [201, 400, 404, 400, 400, 201]
+    assert results[1]["message"] == "Missing required field: title"
+    assert results[3]["message"] == "rating must be an integer between 1 and 5"
+    assert results[4]["message"] == "unknown tag id"
+
+    response = client.get(results[0]["_links"]["self"], headers=auth.token_auth_header)
+    assert response.json["title"] == "Bulk 1"
+    assert response.json["rating"] == 4
+    assert sorted(t["tag_name"] for t in response.json["tags"]) == sorted(
+        ["bulk", existing_tag["tag_name"]]
+    )
+
+    response = client.get(
+        RECIPE_ENDPOINT_WITH_ID.format(results[5]["id"]),
+        headers=auth.token_auth_header,
+    )
+    assert response.json["rating"] == 0
+    assert len(response.json["tags"]) == 2
+
+    # indexed for search
+    response = client.get(
+        RECIPE_SEARCH, query_string={"q": "bulk"}, headers=auth.token_auth_header
+    )
+    assert sorted(r["title"] for r in response.json) == ["Bulk 1", "Bulk 5"]
+
+    with app.app_context():
+        assert db.session.scalar(
+            db.select(db.func.count(Tag.id)).where(Tag.tag_name == "bulk")
+        ) == 1
+        # tags of rejected items are not created
+        assert db.session.scalar(
+            db.select(db.func.count(Tag.id)).where(Tag.tag_name == "rejected")
+        ) == 0
+
+
+def test_create_recipes_bulk_ndjson(auth, client, books):
+    auth.login()
+    body = '{"title": "a", "book_id": 1}\n\n{"title": "b", "book_id": "1"}\n'
+
+    response = client.post(
+        RECIPE_BULK,
+        data=body,
+        content_type="application/x-ndjson",
+        headers=auth.token_auth_header,
+    )
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json] == [201, 201]
+
+
+def test_create_recipes_bulk_invalid_body(app, auth, client, books):
+    auth.login()
+
+    response = client.post(
+        RECIPE_BULK,
+        data='{"title": "a", "book_id": 1}\n{"title": ',
+        content_type="application/x-ndjson",
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 400
+    assert response.json["message"] == "invalid JSON in line 2"
+
+    response = client.post(
+        RECIPE_BULK, json={"title": "a"}, headers=auth.token_auth_header
+    )
+    assert response.status_code == 400
+
+    app.config["RECIPE_BULK_LIMIT"] = 2
+    response = client.post(
+        RECIPE_BULK,
+        json=[{"title": "a", "book_id": 1}] * 3,
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 400
+
+
+def test_create_recipes_bulk_query_count(auth, client, books, query_counter):
+    auth.login()
+
+    def items(n):
+        return [
+            {
+                "title": "Recipe {:d}".format(i),
+                "book_id": books.book_1["id"],
+                "rating": 3,
+                "tags": [{"tag_name": "tag {:d}".format(i)}, {"tag_name": "all"}],
+            }
+            for i in range(n)
+        ]
+
+    client.post(RECIPE_BULK, json=items(1), headers=auth.token_auth_header)
+    with query_counter:
+        response = client.post(
+            RECIPE_BULK, json=items(5), headers=auth.token_auth_header
+        )
+    assert [r["status"] for r in response.json] == [201] * 5
+    queries_for_few = query_counter.count
+
+    with query_counter:
+        response = client.post(
+            RECIPE_BULK, json=items(200), headers=auth.token_auth_header
+        )
+    assert [r["status"] for r in response.json] == [201] * 200
+    assert query_counter.count == queries_for_few
+
+
+def test_create_recipe_tags_constant_query_count(
+    auth, client, books, recipes, query_counter
+):
+    auth.login()
+    existing = recipes.recipe_1["tags"]
+
+    def create(n):
+        test_data = {k: new_recipe_dict[k] for k in ["title", "page", "book_id"]}
+        test_data["tags"] = [
+            {"id": existing[0]["id"]},
+            {"tag_name": existing[1]["tag_name"]},
+        ]
+        test_data["tags"] += [
+            {"tag_name": "new {:d} {:d}".format(n, i)} for i in range(n)
+        ]
+        with query_counter:
+            response = client.post(
+                RECIPE_ENDPOINT, json=test_data, headers=auth.token_auth_header
+            )
+        assert response.status_code == 201
+        assert len(response.json["tags"]) == n + 2
+        return query_counter.count
+
+    create(1)
+    assert create(2) == create(20)
+
+
+def test_resolve_tags_inserted_concurrently(app, books, recipes):
+    with app.app_context():
+
+        def insert_concurrently(orm_execute_state):
+            if orm_execute_state.is_insert:
+                # another transaction inserts the same tag before this one
+                orm_execute_state.session.connection().execute(
+                    text("INSERT INTO tag (tag_name) VALUES ('racy')")
+                )
+
+        event.listen(db.session, "do_orm_execute", insert_concurrently)
+        try:
+            tags = resolve_tags([{"tag_name": "racy"}, {"tag_name": "calm"}])
+        finally:
+            event.remove(db.session, "do_orm_execute", insert_concurrently)
+
+        assert tags[("tag_name", "racy")].id
+        assert tags[("tag_name", "calm")].id
+        db.session.commit()
+        assert db.session.scalar(
+            db.select(db.func.count(Tag.id)).where(Tag.tag_name == "racy")
+        ) == 1
+
+
+def test_resolve_tags_without_upsert(app, books, recipes, mocker):
+    with app.app_context():
+        bind = mocker.Mock(wraps=db.session.get_bind())
+        bind.dialect.name = "mysql"
+        mocker.patch.object(db.session, "get_bind", return_value=bind)
+
+        tags = resolve_tags([{"tag_name": "plain", "color": "red"}])
+
+        assert tags[("tag_name", "plain")].id
+        assert db.session.get(Tag, tags[("tag_name", "plain")].id).color == "red"
@@ -1,6 +1,8 @@
+import pytest
 from base64 import b64encode
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import db
+from app.api.auth import Principal, TokenCache, verify_token, get_user_roles
 from app.models.user import User
 
 username, password = ("admin", "admin")
@@ -56,3 +58,159 @@ def test_revoke_token(app, client):
 
     with app.app_context():
         assert User.check_token(token) is None
+
+
+def test_token_auth_warm_request_runs_no_query(auth, app, client, query_counter):
+    auth.login()
+    response = client.get("/api/1/users/me", headers=auth.token_auth_header)
+    assert response.status_code == 200
+
+    with app.test_request_context(), query_counter:
+        user = verify_token(auth.token)
+        roles = get_user_roles(user)
+
+    assert query_counter.count == 0
+    assert user.id == auth.user.id
+    assert roles == ["user"]
+
+
+def test_revoked_token_is_not_cached(auth, client):
+    auth.login()
+    response = client.get("/api/1/users/me", headers=auth.token_auth_header)
+    assert response.status_code == 200
+
+    headers = auth.token_auth_header
+    auth.logout()
+
+    response = client.get("/api/1/users/me", headers=headers)
+    assert response.status_code == 401
+
+
+def test_token_cache_evicts_least_recently_used_and_expired():
+    cache = TokenCache(maxsize=2, ttl=60)
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+
+    cache.set("a", Principal(1, None, ("user",), expires_at))
+    cache.set("b", Principal(2, None, ("user",), expires_at))
+    cache.get("a")
+    cache.set("c", Principal(3, None, ("user",), datetime.utcnow()))
+
+    assert cache.get("a").id == 1
+    assert cache.get("b") is None
+    assert cache.get("c") is None
+
+
+@pytest.fixture
+def signed_tokens(app):
+    app.config["TOKEN_MODE"] = "signed"
+
+
+def test_signed_token_auth_runs_no_query(
+    signed_tokens, auth, app, client, query_counter
+):
+    auth.login()
+    response = client.get("/api/1/users/me", headers=auth.token_auth_header)
+    assert response.status_code == 200
+
+    with app.test_request_context(), query_counter:
+        user = verify_token(auth.token)
+        roles = get_user_roles(user)
+
+    assert query_counter.count == 0
+    assert user.id == response.json["id"]
+    assert roles == ["user"]
+
+
+def test_signed_token_is_not_stored(signed_tokens, auth, app):
+    auth.login()
+
+    with app.app_context():
+        user = db.session.execute(
+            db.select(User).filter_by(username="user_1")
+        ).scalar_one()
+        assert user.token is None
+
+
+def test_tampered_signed_token_fails(signed_tokens, auth, client):
+    auth.login()
+    headers = {"Authorization": "Bearer {}x".format(auth.token)}
+
+    response = client.get("/api/1/users/me", headers=headers)
+    assert response.status_code == 401
+
+
+def test_revoked_signed_token_fails(signed_tokens, auth, client):
+    auth.login()
+    headers = auth.token_auth_header
+
+    response = auth.logout()
+    assert response.status_code == 204
+
+    response = client.get("/api/1/users/me", headers=headers)
+    assert response.status_code == 401
+
+    auth.login()
+    response = client.get("/api/1/users/me", headers=auth.token_auth_header)
+    assert response.status_code == 200
+
+
+def test_signed_refresh_token(signed_tokens, auth, app, client):
+    auth.login()
+    refresh_token = client.get_cookie("refresh_token").value
+    headers = {"Cookie": "refresh_token={}".format(refresh_token)}
+
+    with app.app_context():
+        user = db.session.execute(
+            db.select(User).filter_by(username="user_1")
+        ).scalar_one()
+        assert user.refresh_token is None
+
+    response = client.get("/api/1/tokens/refresh", headers=headers)
+    assert response.status_code == 200
+    client.delete_cookie("refresh_token")
+    token_headers = {"Authorization": "Bearer {}".format(response.json["token"])}
+    response = client.get("/api/1/users/me", headers=token_headers)
+    assert response.status_code == 200
+
+    # tampered
+    response = client.get(
+        "/api/1/tokens/refresh", headers={"Cookie": headers["Cookie"] + "x"}
+    )
+    assert response.status_code == 400
+
+    # revoked along with the access tokens
+    response = client.delete("/api/1/tokens", headers=token_headers)
+    assert response.status_code == 204
+    response = client.get("/api/1/tokens/refresh", headers=headers)
+    assert response.status_code == 400
+
+
+def test_signed_refresh_after_group_change(signed_tokens, auth, app, client):
+    auth.login()
+    refresh_token = client.get_cookie("refresh_token").value
+    headers = {"Cookie": "refresh_token={}".format(refresh_token)}
+
+    response = client.post(
+        "/api/1/user_groups",
+        json={"group_name": "new group"},
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 201
+    group_id = response.json["id"]
+
+    # the access token names the former group
+    response = client.get("/api/1/users/me", headers=auth.token_auth_header)
+    assert response.status_code == 401
+
+    # the refresh token is still valid and issues a token with the new group
+    response = client.get("/api/1/tokens/refresh", headers=headers)
+    assert response.status_code == 200
+    client.delete_cookie("refresh_token")
+    token = response.json["token"]
+    response = client.get(
+        "/api/1/users/me", headers={"Authorization": "Bearer {}".format(token)}
+    )
+    assert response.status_code == 200
+
+    with app.test_request_context():
+        assert verify_token(token).user_group_id == group_id
@@ -10,3 +10,101 @@ def test_healthy(client):
     response = client.get("api/1/healthy")
     assert response.status_code == 200
     assert response.json == {"healthy": True}
+
+
+def test_explain_queries_command(runner):
+    result = runner.invoke(args=["explain_queries"])
+    assert result.exit_code == 0
+    assert "SEARCH rating USING INDEX ix_rating_recipe_id_user_id" in result.output
+
+
+def test_explain_queries_command_flags_full_scans(app, runner):
+    from app.extensions import db
+
+    with app.app_context():
+        for index in ["ix_recipe_user_id_id", "ix_recipe_user_id_created_at_id"]:
+            db.session.execute(db.text("DROP INDEX " + index))
+        db.session.commit()
+
+    result = runner.invoke(args=["explain_queries"])
+    assert result.exit_code == 1
+    assert "FULL SCAN SCAN recipe" in result.output
+    assert (
+        "full scans in get_owner_recipe_ids_query, get_user_recipe_counts_query, "
+        "get_user_recipe_rows_query, get_user_recipes_query"
+    ) in result.output
+
+
+def test_migrations_match_models(tmp_path):
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from flask_migrate import upgrade
+    from app import create_app
+    from app.extensions import db
+    from config import TestConfig
+
+    class MigrationConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "migrated.db")
+
+    app = create_app(MigrationConfig)
+    with app.app_context():
+        upgrade()
+
+        with db.engine.connect() as connection:
+            context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_object": lambda o, name, type_, *args: not (
+                        type_ == "table" and name.startswith("recipe_search")
+                    )
+                },
+            )
+            assert compare_metadata(context, db.metadata) == []
+            assert "recipe_search" in db.inspect(connection).get_table_names()
+
+
+def test_migrations_upgrade_baseline_data(tmp_path):
+    from flask_migrate import upgrade
+    from app import create_app
+    from app.extensions import db
+    from app.search import search_query
+    from config import TestConfig
+
+    class MigrationConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + str(tmp_path / "baseline.db")
+
+    app = create_app(MigrationConfig)
+    with app.app_context():
+        upgrade(revision="bf3493c3740f")
+
+        for statement in [
+            "INSERT INTO user (id, username) VALUES (1, 'cook')",
+            "INSERT INTO book (id, title, user_id) VALUES (1, 'Dessert Classics', 1)",
+            "INSERT INTO tag (id, tag_name) VALUES (1, 'french')",
+            "INSERT INTO recipe (id, title, image, user_id, book_id) "
+            "VALUES (1, 'Crème brûlée', 'a.png', 1, 1), (2, 'Tarte', NULL, 1, 1)",
+            "INSERT INTO recipe_tags (recipe_id, tag_id) VALUES (1, 1)",
+            "INSERT INTO rating (rating, user_id, recipe_id) "
+            "VALUES (4, 1, 1), (2, 1, 1)",
+        ]:
+            db.session.execute(db.text(statement))
+        db.session.commit()
+
+        upgrade()
+
+        recipes = db.session.execute(
+            db.text(
+                "SELECT id, rating_count, rating_sum, image_status FROM recipe "
+                "ORDER BY id"
+            )
+        ).all()
+        # duplicate ratings are removed by the rating index revision
+        assert recipes == [(1, 1, 2, None), (2, 0, 0, None)]
+
+        def search(term):
+            query = db.select(search_query("sqlite", term).c.recipe_id)
+            return sorted(db.session.execute(query).scalars())
+
+        assert search("creme") == [1]
+        assert search("french") == [1]
+        assert search("dessert") == [1, 2]
@@ -0,0 +1,97 @@
+import pytest
+
+IMAGE_FILE = "0123456789abcdef0123456789abcdef.jpg"
+IMAGE_URL = "/images/1/{}".format(IMAGE_FILE)
+IMAGE_DATA = b"\xff\xd8not really a jpeg\xff\xd9"
+
+
+@pytest.fixture
+def image(app, tmp_path):
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    (tmp_path / IMAGE_FILE).write_bytes(IMAGE_DATA)
+    (tmp_path / (IMAGE_FILE + ".thumbnail")).write_bytes(IMAGE_DATA)
+    return tmp_path / IMAGE_FILE
+
+
+def test_get_image(image, client):
+    response = client.get(IMAGE_URL)
+
+    assert response.status_code == 200
+    assert response.data == IMAGE_DATA
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert response.cache_control.immutable
+    assert response.cache_control.public
+    assert response.cache_control.max_age == 365 * 24 * 60 * 60
+
+
+def test_get_thumbnail_mimetype(image, client):
+    response = client.get(IMAGE_URL + ".thumbnail")
+
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+
+
+def test_get_image_not_modified(image, client):
+    etag = client.get(IMAGE_URL).headers["ETag"]
+
+    response = client.get(IMAGE_URL, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_get_image_etag_is_content_hash(image, client):
+    etag = client.get(IMAGE_URL).headers["ETag"]
+
+    image.write_bytes(IMAGE_DATA + b"changed")
+    response = client.get(IMAGE_URL, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_image_range(image, client):
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=0-3"})
+
+    assert response.status_code == 206
+    assert response.data == IMAGE_DATA[:4]
+
+
+def test_get_image_accel_redirect(image, app, client):
+    app.config["IMAGE_ACCEL_REDIRECT"] = "/internal/images/"
+
+    response = client.get(IMAGE_URL)
+
+    assert response.status_code == 200
+    assert response.data == b""
+    assert response.headers["X-Accel-Redirect"] == "/internal/images/" + IMAGE_FILE
+    assert response.mimetype == "image/jpeg"
+    assert response.cache_control.immutable
+
+
+def test_get_image_invalid_name(image, client):
+    response = client.get("/images/1/../config.py")
+    assert response.status_code in [400, 404]
+
+    response = client.get("/images/1/{}.exe".format(IMAGE_FILE))
+    assert response.status_code == 400
+
+
+def test_get_image_not_found(image, client):
+    response = client.get("/images/1/{}.png".format("f" * 32))
+    assert response.status_code == 404
+
+
+def test_get_sharded_image(app, client, tmp_path):
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    shard = tmp_path / IMAGE_FILE[:2] / IMAGE_FILE[2:4]
+    shard.mkdir(parents=True)
+    (shard / IMAGE_FILE).write_bytes(IMAGE_DATA)
+
+    response = client.get(IMAGE_URL)
+
+    assert response.status_code == 200
+    assert response.data == IMAGE_DATA
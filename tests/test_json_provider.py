@@ -0,0 +1,130 @@
+import uuid
+import pytest
+from base64 import b64encode
+from datetime import date, datetime
+from decimal import Decimal
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+from app import create_app, json_provider
+from app.json_provider import ORJSON, STDLIB, OrjsonProvider
+from config import TestConfig
+
+PROVIDERS = {STDLIB: DefaultJSONProvider, ORJSON: OrjsonProvider}
+
+requires_orjson = pytest.mark.skipif(
+    json_provider.orjson is None, reason="orjson is not installed"
+)
+
+PAYLOAD = {
+    "title": "Crème brûlée",
+    "created_at": datetime(2015, 10, 21, 7, 28),
+    "day": date(2015, 10, 21),
+    "price": Decimal("1.50"),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "tags": [{"tag_name": "dessert", "color": None}],
+    "rating": 4.5,
+}
+
+
+@pytest.fixture(params=[STDLIB, pytest.param(ORJSON, marks=requires_orjson)])
+def json_app(request, app):
+    """The app with each JSON backend."""
+
+    app.json = PROVIDERS[request.param](app)
+    return app
+
+
+@requires_orjson
+def test_create_json_provider(mocker):
+    class JSONConfig(TestConfig):
+        JSON_BACKEND = "auto"
+
+    assert type(create_app(JSONConfig).json) is OrjsonProvider
+
+    JSONConfig.JSON_BACKEND = STDLIB
+    assert type(create_app(JSONConfig).json) is DefaultJSONProvider
+
+    mocker.patch("app.json_provider.orjson", None)
+    JSONConfig.JSON_BACKEND = "auto"
+    assert type(create_app(JSONConfig).json) is DefaultJSONProvider
+
+    JSONConfig.JSON_BACKEND = ORJSON
+    with pytest.raises(RuntimeError):
+        create_app(JSONConfig)
+
+
+@requires_orjson
+def test_json_backends_write_the_same_json(app):
+    bodies = []
+    for provider in PROVIDERS.values():
+        app.json = provider(app)
+        with app.test_request_context():
+            response = jsonify(PAYLOAD)
+            bodies.append(response.get_data())
+            assert response.mimetype == "application/json"
+
+            encoded = app.json.dumps(PAYLOAD, separators=(",", ":"))
+            assert app.json.loads(encoded) == app.json.loads(bodies[-1])
+
+    stdlib, orjson = bodies
+    assert DefaultJSONProvider(app).loads(stdlib) == OrjsonProvider(app).loads(orjson)
+    data = DefaultJSONProvider(app).loads(orjson)
+    assert data["created_at"] == "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert data["day"] == "Wed, 21 Oct 2015 00:00:00 GMT"
+    assert data["price"] == "1.50"
+    assert data["id"] == "12345678-1234-5678-1234-567812345678"
+    # sorted keys, compact
+    assert list(data) == sorted(PAYLOAD)
+    assert orjson.startswith(b'{"created_at":"Wed')
+
+
+@requires_orjson
+def test_orjson_provider_falls_back_for_other_arguments(app):
+    provider = OrjsonProvider(app)
+
+    compact = provider.dumps({"b": 1, "a": "é"}, separators=(",", ":"))
+    assert compact == '{"a":"é","b":1}'
+    assert provider.dumps({"b": 1}, indent=2) == '{\n  "b": 1\n}'
+    # json.dumps separators, orjson has no option for them
+    assert provider.dumps({"b": 1, "a": 2}) == '{"a": 2, "b": 1}'
+    assert provider.dumps([1, 2], separators=(", ", ":")) == "[1, 2]"
+    assert provider.dumps([1, 2], indent=2, separators=(",", ":")) == "[\n  1,\n  2\n]"
+    assert provider.dumps({"a": "é"}, ensure_ascii=True) == '{"a": "\\u00e9"}'
+    assert provider.loads("[1.5]", parse_float=Decimal) == [Decimal("1.5")]
+
+
+def test_get_token_on_json_backends(json_app, client):
+    credentials = b64encode(b"admin:admin").decode("utf-8")
+
+    response = client.get(
+        "/api/1/tokens", headers={"Authorization": "Basic " + credentials}
+    )
+
+    assert response.status_code == 200
+    expiration = datetime.strptime(
+        response.json["token_expiration"], "%a, %d %b %Y %H:%M:%S %Z"
+    )
+    assert expiration > datetime.utcnow()
+
+
+def test_recipes_on_json_backends(json_app, client, auth, books, recipes):
+    auth.login()
+
+    response = client.get("api/1/recipes", headers=auth.token_auth_header)
+    streamed_response = client.get(
+        "api/1/recipes",
+        headers=auth.token_auth_header,
+        query_string={"stream": "true"},
+    )
+
+    assert response.status_code == 200
+    assert len(response.json) == 5
+    assert streamed_response.json == response.json
+
+    response = client.post(
+        "api/1/recipes",
+        data='{"title": "New", "book_id": 1',
+        content_type="application/json",
+        headers=auth.token_auth_header,
+    )
+    assert response.status_code == 400
@@ -0,0 +1,149 @@
+import io
+import pytest
+from app.storage import LocalStorage, S3Storage, shard_key
+from tests.fake_s3 import FakeS3Client
+
+
+def test_shard_key():
+    assert shard_key("0123abcd.jpg") == "01/23/0123abcd.jpg"
+
+
+def test_local_storage(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    storage.save("ab/cd/abcd.jpg", io.BytesIO(b"image"))
+
+    assert (tmp_path / "ab" / "cd" / "abcd.jpg").read_bytes() == b"image"
+    assert storage.exists("ab/cd/abcd.jpg")
+    with storage.open("ab/cd/abcd.jpg") as f:
+        assert f.read() == b"image"
+    assert storage.url("ab/cd/abcd.jpg") is None
+
+    storage.delete("ab/cd/abcd.jpg")
+    storage.delete("ab/cd/abcd.jpg")
+    assert not storage.exists("ab/cd/abcd.jpg")
+
+
+def test_local_storage_finds_unsharded_files(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    (tmp_path / "abcd.jpg").write_bytes(b"image")
+
+    assert storage.exists("ab/cd/abcd.jpg")
+    assert storage.local_path("ab/cd/abcd.jpg") == str(tmp_path / "abcd.jpg")
+
+
+def test_s3_storage(tmp_path):
+    client = FakeS3Client()
+    storage = S3Storage("bucket", prefix="images/", client=client)
+
+    storage.save("ab/cd/abcd.jpg", io.BytesIO(b"image"))
+    path = tmp_path / "abcd.jpg.thumbnail"
+    path.write_bytes(b"thumbnail")
+    storage.save_file("ab/cd/abcd.jpg.thumbnail", str(path))
+
+    assert not path.exists()
+    data, extra_args = client.objects[("bucket", "images/ab/cd/abcd.jpg")]
+    assert data == b"image"
+    assert extra_args["ContentType"] == "image/jpeg"
+    assert storage.exists("ab/cd/abcd.jpg.thumbnail")
+    assert storage.open("ab/cd/abcd.jpg").read() == b"image"
+    assert storage.url("ab/cd/abcd.jpg").startswith(
+        "https://s3.example.com/bucket/images/ab/cd/abcd.jpg?signature="
+    )
+
+    storage.delete("ab/cd/abcd.jpg")
+    assert not storage.exists("ab/cd/abcd.jpg")
+
+
+def test_s3_storage_public_url():
+    storage = S3Storage("bucket", client=FakeS3Client(), public_url="https://cdn/")
+
+    assert storage.url("ab/cd/abcd.jpg") == "https://cdn/ab/cd/abcd.jpg"
+
+
+@pytest.fixture
+def s3_client(app):
+    client = FakeS3Client()
+    app.extensions["storage"] = S3Storage("bucket", client=client)
+    return client
+
+
+def test_put_image_to_s3(s3_client, client, auth, books, recipes, jpeg):
+    auth.login()
+
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (jpeg(), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+
+    assert response.status_code == 200
+    image = response.json["image"]
+    links = response.json["_links"]
+    assert links["image"].startswith(
+        "https://s3.example.com/bucket/{}?".format(shard_key(image))
+    )
+    assert links["images"]["webp"]["400w"].startswith("https://s3.example.com/")
+    assert ("bucket", shard_key(image)) in s3_client.objects
+    assert ("bucket", shard_key(image + ".thumbnail")) in s3_client.objects
+
+    response = client.get("/images/1/{}".format(image))
+    assert response.status_code == 302
+    assert response.location == links["image"]
+
+    response = client.delete("/api/1/recipes/1/image", headers=auth.token_auth_header)
+    assert response.status_code == 200
+    assert s3_client.objects == {}
+
+
+def test_recipe_lists_link_images_unsigned(
+    s3_client, client, auth, books, recipes, jpeg
+):
+    auth.login()
+    response = client.put(
+        "/api/1/recipes/1/image",
+        data={"image": (jpeg(), "test.jpg")},
+        headers=auth.token_auth_header,
+    )
+    image = response.json["image"]
+
+    response = client.get("/api/1/recipes", headers=auth.token_auth_header)
+
+    links = next(r["_links"] for r in response.json if r["id"] == 1)
+    assert links["image"] == "/images/1/{}".format(image)
+    assert links["images"]["webp"]["400w"].startswith("/images/1/")
+    response = client.get(links["image"])
+    assert response.status_code == 302
+    assert response.location.startswith("https://s3.example.com/bucket/")
+
+
+def test_local_storage_iter_files(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.save("cd/ef/cdef.jpg", io.BytesIO(b"image"))
+    storage.save("ab/cd/abcd.jpg", io.BytesIO(b"image"))
+    (tmp_path / "bcde.jpg").write_bytes(b"image")
+
+    keys = [key for key, _ in storage.iter_files()]
+
+    assert keys == ["ab/cd/abcd.jpg", "bcde.jpg", "cd/ef/cdef.jpg"]
+
+    storage.delete_many(keys)
+    assert list(storage.iter_files()) == []
+
+
+def test_s3_storage_iter_files():
+    storage = S3Storage("bucket", prefix="images/", client=FakeS3Client())
+    for key in ["cd/ef/cdef.jpg", "ab/cd/abcd.jpg", "ab/cd/abcd.jpg.thumbnail"]:
+        storage.save(key, io.BytesIO(b"image"))
+
+    files = list(storage.iter_files())
+
+    assert [key for key, _ in files] == [
+        "ab/cd/abcd.jpg",
+        "ab/cd/abcd.jpg.thumbnail",
+        "cd/ef/cdef.jpg",
+    ]
+    assert files[0][1].tzinfo is None
+
+    storage.delete_many(["ab/cd/abcd.jpg", "cd/ef/cdef.jpg"])
+    assert [key for key, _ in storage.iter_files()] == ["ab/cd/abcd.jpg.thumbnail"]